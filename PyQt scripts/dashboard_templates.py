@@ -1,13 +1,105 @@
 from PyQt6.QtWidgets import QApplication, QWidget, QLabel, QVBoxLayout, QHBoxLayout, QPushButton, QSizePolicy
-from PyQt6.QtGui import QPainter, QColor, QBrush, QPen, QFont, QFontMetrics
-from PyQt6.QtCore import Qt, QPointF, QRectF, QObject, pyqtSignal, QSocketNotifier
+from PyQt6.QtGui import QPainter, QColor, QBrush, QPen, QFont, QFontMetrics, QPixmap, QPolygonF
+from PyQt6.QtCore import Qt, QPoint, QPointF, QRect, QRectF, QEvent, QObject, pyqtSignal, QSocketNotifier, QTimer
 from PyQt6.QtNetwork import QUdpSocket, QHostAddress
 import math
 import json
+import select
 import socket
+import threading
+import time
+from collections import deque
+import numpy as np
+from udpprotocol import PacketDecoder, subscription_packet
+from signalhistory import decimate_minmax
+
+# base class for the dashboard widgets, handles repaint scheduling and batched values
+# custom widgets can inherit from this too, they just need a signalname, a set_value function and a paint(painter) function
+# that draws the widget at (0, 0) (the same widget can then paint itself, or be drawn by a DashboardCanvas)
+class DashboardWidget(QWidget):
+    scheduler = None # RenderScheduler shared by the dashboard, set when the widget is registered (None = repaint right away)
+    canvas = None # DashboardCanvas that draws this widget (None = the widget paints itself like any other QWidget)
+
+    # function to ask for a repaint, goes through the render scheduler if the dashboard has one
+    def schedule_update(self):
+        if self.scheduler is not None:
+            self.scheduler.request(self)
+        else:
+            self.request_repaint()
+
+    # function to queue the actual repaint, on the widget itself or on the part of the canvas it is drawn on
+    def request_repaint(self):
+        if self.canvas is not None:
+            self.canvas.mark_dirty(self)
+        else:
+            self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        self.paint(painter)
+        painter.end()
+
+    # function to update value from a batch of incoming values ({signal name: latest value})
+    def set_values(self, snapshot):
+        if self.signalname in snapshot:
+            self.set_value(snapshot[self.signalname], self.signalname)
+
+    background = None # cached pixmap of the parts of the widget that don't change with the value
+    background_color = None # color the cached background is filled with (None = transparent, a DashboardCanvas sets its own)
+
+    # function to throw away the cached background, call this after changing a widget's config (range, label, ticks...)
+    def invalidate_background(self):
+        self.background = None
+        self.request_repaint()
+
+    def resizeEvent(self, event):
+        self.background = None
+        super().resizeEvent(event)
+
+    stale = False # True while the signal has gone quiet for longer than the receiver's stale_timeout
+
+    # function to flag the widget as showing an old value (or clear the flag when values come in again)
+    def set_stale(self, stale):
+        if stale != self.stale:
+            self.stale = stale
+            self.request_repaint()
+
+    link_stats = None # LinkStats the widget reports its paints to (see linkstats.py), set when the widget is registered
+    history = None # HistoryStore with the recent values of every signal (see signalhistory.py), set when the widget is registered
+
+    # function called at the end of every paint, draws the stale overlay and reports the paint to the link stats
+    def finish_paint(self, painter):
+        self.draw_stale(painter)
+        if self.link_stats is not None:
+            self.link_stats.painted(self.signalname)
+
+    # drawing function to grey the widget out while its value is stale
+    def draw_stale(self, painter):
+        if self.stale:
+            painter.fillRect(self.rect(), QColor(30, 30, 30, 150))
+            painter.setPen(QColor(220, 220, 220))
+            painter.setFont(QFont("Arial", 10))
+            painter.drawText(self.rect(), Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignRight, "no data")
+
+    # function to get the cached background, it is only redrawn (with draw_background) when it is missing
+    def cached_background(self):
+        if self.background is None:
+            ratio = self.devicePixelRatioF()
+            pixmap = QPixmap(int(self.width() * ratio), int(self.height() * ratio))
+            pixmap.setDevicePixelRatio(ratio)
+            pixmap.fill(Qt.GlobalColor.transparent if self.background_color is None else self.background_color)
+            painter = QPainter(pixmap)
+            painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+            self.draw_background(painter)
+            painter.end()
+            self.background = pixmap
+        return self.background
 
 # creator class for the tickbar widget
-class Tickbar(QWidget):
+class Tickbar(DashboardWidget):
+    active_color = QColor(255, 215, 0)
+    inactive_color = QColor(80, 80, 80)
+
     def __init__(self, min_value, max_value, numticks, tickbar_label, signalname, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.max_value = max_value
@@ -22,37 +114,43 @@ class Tickbar(QWidget):
     def set_value(self, value, name):
         if name == self.signalname:
             self.current_value = max(self.min_value, min(value, self.max_value))
-            self.update()
-
-    # drawing function to create tickbar
-    def paintEvent(self, event):
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-        
+            self.schedule_update()
 
+    # function to work out where every tick goes, only needed when the size or number of ticks changes
+    def tick_rects(self):
         w = self.width()
         h = self.height()
         spacing = 4
         tick_width = (w - (self.numticks - 1) * spacing) / self.numticks
         tick_height = h * 0.6   
         y_offset = (h * 0.2 - tick_height) / 2  
+        return [QRectF(i * (tick_width + spacing), y_offset, tick_width, tick_height) for i in range(self.numticks)]
 
+    # drawing function for the static parts of the tickbar (every tick in the inactive color, and the label), cached in a pixmap
+    def draw_background(self, painter):
+        self.rects = self.tick_rects()
+        painter.setBrush(self.inactive_color)
+        painter.setPen(Qt.PenStyle.NoPen)
+        for rect in self.rects:
+            painter.drawRoundedRect(rect, 6, 6)
+
+        self.draw_label(painter)
+
+    # drawing function to create tickbar, only the active ticks are drawn on top of the cached background
+    def paint(self, painter):
+        painter.drawPixmap(0, 0, self.cached_background())
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
 
         active_ticks = int(
             (self.current_value - self.min_value) / (self.max_value - self.min_value) * self.numticks
         )
 
-        for i in range(self.numticks):
-            x = i * (tick_width + spacing)
-            color = QColor(255, 215, 0) if i < active_ticks else QColor(80, 80, 80)
+        painter.setBrush(self.active_color)
+        painter.setPen(Qt.PenStyle.NoPen)
+        for rect in self.rects[:max(0, active_ticks)]:
+            painter.drawRoundedRect(rect, 6, 6)
 
-            painter.setBrush(color)
-            painter.setPen(Qt.PenStyle.NoPen)
-            painter.drawRoundedRect(
-                QRectF(x, y_offset, tick_width, tick_height), 6, 6
-            )
-
-        self.draw_label(painter)
+        self.finish_paint(painter)
     
     # drawing function to add widget label
     def draw_label(self, painter):
@@ -73,7 +171,7 @@ class Tickbar(QWidget):
         )
 
 # creator class for the gauge widget
-class Gauge(QWidget):
+class Gauge(DashboardWidget):
     def __init__(self, min_value, max_value, gauge_label, signalname, parent=None):
         super().__init__(parent)
         self.value = 0
@@ -87,13 +185,10 @@ class Gauge(QWidget):
         if name == self.signalname:
             if self.min_value <= value <= self.max_value:
                 self.value = value
-                self.update() 
-
-    # drawing function to create gauge
-    def paintEvent(self, event):
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+                self.schedule_update()
 
+    # drawing function for the static parts of the gauge (arc, scale numbers, and label), cached in a pixmap
+    def draw_background(self, painter):
         # Draw gauge arc
         rect = QRectF(10, 10, self.width() - 20, self.height() - 20)
         start_angle = 225 * 16 # Start at 225 degrees, pyqt counts in 1/16ths of a degree
@@ -104,6 +199,11 @@ class Gauge(QWidget):
         self.draw_scale_numbers(painter)
         self.draw_label(painter)
 
+    # drawing function to create gauge, only the needle is drawn on top of the cached background
+    def paint(self, painter):
+        painter.drawPixmap(0, 0, self.cached_background())
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+
         # Draw gauge needle
         needle_length = min(self.width(), self.height()) / 2 * 0.8
         center = QPointF(self.width() / 2, self.height() / 2)
@@ -124,7 +224,7 @@ class Gauge(QWidget):
         painter.setBrush(QBrush(QColor(0, 0, 0)))
         painter.drawEllipse(center, 5, 5)
 
-        painter.end()
+        self.finish_paint(painter)
         
     # drawing function for numbers on gauge
     def draw_scale_numbers(self, painter):
@@ -174,7 +274,7 @@ class Gauge(QWidget):
         )
 
 # creator class for the light widget
-class Light(QWidget):
+class Light(DashboardWidget):
     def __init__(self, light_label, signalname, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.value = 0
@@ -188,11 +288,10 @@ class Light(QWidget):
         if name == self.signalname:
             if self.min_value <= value <= self.max_value:
                 self.value = value
-                self.update()
+                self.schedule_update()
 
     # drawing function to create light
-    def paintEvent(self, event):
-        painter = QPainter(self)
+    def paint(self, painter):
         painter.setRenderHint(QPainter.RenderHint.Antialiasing)
         painter.setPen(QPen(QColor(100, 100, 100), 5))
 
@@ -209,6 +308,7 @@ class Light(QWidget):
         painter.drawEllipse(top_left_x, top_left_y, circle_diameter, circle_diameter)
 
         self.draw_label(painter)
+        self.finish_paint(painter)
 
     # drawing function to add label to widget
     def draw_label(self, painter):
@@ -227,12 +327,161 @@ class Light(QWidget):
             label_text
         )
 
+# function to make a QPolygonF out of numpy x and y arrays, the points are written straight into the polygon's memory
+# instead of making a QPointF for each one (a QPointF is two doubles)
+def numpy_polygon(xs, ys):
+    polygon = QPolygonF()
+    polygon.resize(len(xs))
+    pointer = polygon.data()
+    pointer.setsize(len(xs) * 16)
+    points = np.frombuffer(pointer, dtype=np.float64).reshape(-1, 2)
+    points[:, 0] = xs
+    points[:, 1] = ys
+    return polygon
+
+# creator class for the trend widget, a line of the last few seconds of a signal
+# the samples come from the HistoryStore the registry hands the widget, and are cut down to one min/max pair per pixel column
+# before drawing, so a 1 kHz signal costs the same to draw as a 10 Hz one
+class Trend(DashboardWidget):
+    line_color = QColor(0, 120, 215)
+    grid_color = QColor(200, 200, 200)
+
+    def __init__(self, min_value, max_value, seconds, trend_label, signalname, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = None
+        self.min_value = min_value
+        self.max_value = max_value
+        self.seconds = seconds # seconds of history shown across the widget
+        self.trend_label = trend_label
+        self.signalname = signalname
+
+        # the trend has to scroll along even when no new values come in (senders with a deadband only send changes)
+        self.scroll_timer = QTimer(self)
+        self.scroll_timer.timeout.connect(self.schedule_update)
+        self.scroll_timer.start(max(40, int(seconds * 1000 / 250))) # about a pixel of scroll per tick at the dashboard size
+
+    # function to update the newest value, the history itself is recorded by the receiver
+    def set_value(self, value, name):
+        if name == self.signalname:
+            self.value = value
+            self.schedule_update()
+
+    # area the line is drawn in, the label goes underneath
+    def plot_rect(self):
+        return QRectF(4, 4, self.width() - 8, self.height() - 28)
+
+    # drawing function for the static parts of the trend (frame, grid lines, range and label), cached in a pixmap
+    def draw_background(self, painter):
+        rect = self.plot_rect()
+        painter.setPen(QPen(self.grid_color, 1, Qt.PenStyle.DashLine))
+        for fraction in (0.25, 0.5, 0.75):
+            y = rect.top() + rect.height() * fraction
+            painter.drawLine(QPointF(rect.left(), y), QPointF(rect.right(), y))
+        painter.setPen(QPen(QColor(100, 100, 100), 1))
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        painter.drawRect(rect)
+
+        painter.setFont(QFont("Arial", 8))
+        painter.drawText(rect.adjusted(3, 1, 0, 0), Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft, f"{self.max_value:g}")
+        painter.drawText(rect.adjusted(3, 0, 0, -1), Qt.AlignmentFlag.AlignBottom | Qt.AlignmentFlag.AlignLeft, f"{self.min_value:g}")
+        self.draw_label(painter)
+
+    # drawing function to create the trend, only the line and the newest value are drawn on top of the cached background
+    def paint(self, painter):
+        painter.drawPixmap(0, 0, self.cached_background())
+        rect = self.plot_rect()
+
+        if self.history is not None:
+            now = time.time()
+            t_start = now - self.seconds
+            times, values = self.history.window(self.signalname, t_start, now)
+            columns, mins, maxs = decimate_minmax(times, values, t_start, now, int(rect.width()))
+            if len(columns):
+                # every column is a vertical stroke from its min to its max, joined to the next column so the line is continuous
+                scale = rect.height() / (self.max_value - self.min_value)
+                xs = np.repeat(rect.left() + columns + 0.5, 2)
+                ys = np.clip(rect.bottom() - (np.column_stack((mins, maxs)).ravel() - self.min_value) * scale, rect.top(), rect.bottom())
+                painter.setPen(QPen(self.line_color, 1))
+                painter.drawPolyline(numpy_polygon(xs, ys))
+
+        if self.value is not None:
+            painter.setPen(QColor(0, 0, 0))
+            painter.setFont(QFont("Arial", 10))
+            painter.drawText(rect.adjusted(0, 1, -4, 0), Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignRight, f"{self.value:.6g}")
+
+        self.finish_paint(painter)
+
+    # drawing function to add widget label
+    def draw_label(self, painter):
+        painter.setFont(QFont("Arial", 12))
+        fm = QFontMetrics(painter.font())
+
+        label_text = self.trend_label
+        text_width = fm.horizontalAdvance(label_text)
+
+        painter.setPen(QColor(100, 100, 100))
+        painter.drawText(
+            int(self.width() / 2 - text_width / 2),
+            int(self.height() - fm.descent() - 2),
+            label_text
+        )
+
 # class to create instance of UDP packet receiving object
+# batched=False emits data_received(name, value) for every value of every packet,
+# batched=True drains all the pending datagrams, merges them into one {signal name: latest value} snapshot and emits batch_received once per drain
+# threaded=True reads the socket on its own thread instead of the GUI thread, so slow repaints or open dialogs can't stall it
+# stale_timeout (seconds) emits stale_changed(name, True) for a signal that hasn't had a value for that long, and
+# stale_changed(name, False) once it gets one again. senders with a deadband only send changes, but resend every value
+# in a keyframe every so often, so set it a bit longer than the sender's keyframe_interval
+# link_stats (a linkstats.LinkStats) gets every datagram's sequence number and send/receive times, for latency and loss stats
+# history (a signalhistory.HistoryStore) gets every value of every datagram with the time it came in, for the trend widgets
+# derived (a derivedsignals.DerivedSignals) works out the derived signals from each batch (each packet when not batched), and
+# they go out with the received values, so widgets, the last-known state, stale flags and the history can't tell them apart
+# recorder (a sessionrecorder.SessionRecorder) gets every datagram as it came off the socket with its receive time, and writes
+# them to disk on its own thread, so the session can be replayed later (see replayengine.RecordingReplay)
 class DataReceiver(QObject):
     data_received = pyqtSignal(str, float)
+    batch_received = pyqtSignal(dict)
+    stale_changed = pyqtSignal(str, bool)
 
-    def __init__(self):
+    def __init__(self, batched=False, threaded=False, buffer_size=4096, socket_buffer_bytes=4 * 1024 * 1024, poll_interval_ms=5,
+                 stale_timeout=None, link_stats=None, history=None, derived=None, recorder=None):
         super().__init__()
+        self.batched = batched
+        self.threaded = threaded
+        self.decoder = PacketDecoder() # handles both the binary format and JSON dictionaries (see udpprotocol.py)
+        self.link_stats = link_stats
+        self.history = history
+        self.derived = derived
+        self.recorder = recorder
+
+        # last-known state, see check_stale()
+        self.state = {} # signal name -> last value received
+        self.last_update = {} # signal name -> time.monotonic() of the last value received
+        self.stale = set() # signals that have been quiet for longer than stale_timeout
+        self.stale_timeout = stale_timeout
+        if stale_timeout is not None:
+            self.stale_timer = QTimer(self)
+            self.stale_timer.timeout.connect(self.check_stale)
+            self.stale_timer.start(max(100, int(stale_timeout * 250))) # checked 4 times per timeout
+
+        # counters, see stats()
+        self.received = 0 # datagrams read from the socket
+        self.parsed = 0 # datagrams parsed successfully
+        self.failed = 0 # datagrams that couldn't be parsed
+        self.dropped = 0 # parsed datagrams thrown away because the GUI fell too far behind (threaded mode only)
+
+        # selective mode, see subscribe()
+        self.senders = set() # (host, port) of every sender we've heard from
+        self.subscription = None # signal names the dashboard is showing, None = never subscribed (senders send everything)
+        self.subscription_timer = QTimer(self)
+        self.subscription_timer.timeout.connect(self.send_subscription)
+        self.subscription_timer.start(2000) # resent every so often, UDP can lose it and senders can restart
+
+        if threaded:
+            self.start_thread(buffer_size, socket_buffer_bytes, poll_interval_ms)
+            return
+
         self.socket = QUdpSocket()
         if self.socket.bind(QHostAddress(QHostAddress.SpecialAddress.LocalHost), 6000):
             print("[DataReceiver] Bound to 6000")
@@ -243,15 +492,460 @@ class DataReceiver(QObject):
 
     # function to actually read the data as it comes in
     def read_data(self):
+        packets = []
         while self.socket.hasPendingDatagrams():
-            datagram, _, _ = self.socket.readDatagram(self.socket.pendingDatagramSize())
+            datagram, host, port = self.socket.readDatagram(self.socket.pendingDatagramSize())
+            self.received += 1
+            if (host.toString(), port) not in self.senders:
+                self.new_sender((host.toString(), port))
             try:
-                data = datagram.decode()
-                parsed = json.loads(data)
-                for key, value in parsed.items():
-                    self.data_received.emit(key, float(value))
+                packets.append(self.parse(datagram))
+                self.parsed += 1
             except Exception as e:
+                self.failed += 1
                 print(f"Failed to parse datagram: {e}")
+        self.deliver(packets)
+
+    # function to decode a datagram, returns (values, stamp) where stamp is (session, sequence, send time, receive time)
+    # for binary datagrams and None for JSON ones
+    def parse(self, datagram):
+        received = time.time()
+        if self.recorder is not None:
+            self.recorder.record(datagram, received) # before decoding, so the datagrams that fail to parse get recorded too
+        parsed = self.decoder.decode(datagram)
+        stamp = self.decoder.last_stamp
+        return parsed, None if stamp is None else (*stamp, received)
+
+    # function to send parsed packets on to the widgets, either value by value or as one snapshot
+    def deliver(self, packets):
+        if self.link_stats is not None:
+            for parsed, stamp in packets:
+                self.link_stats.datagram(parsed, stamp)
+        # JSON packets have no receive time of their own, they all get the time of this delivery (one time for the whole
+        # drain, so packets that came in together don't look microseconds apart to rate())
+        now = time.time()
+        if self.derived is not None and not self.batched:
+            # every packet gets its derived values added on, worked out at the time it came in
+            packets = [({**parsed, **self.derived.update(parsed, now if stamp is None else stamp[3])}, stamp)
+                       for parsed, stamp in packets]
+        if self.history is not None:
+            for parsed, stamp in packets:
+                self.history.record(parsed, now if stamp is None else stamp[3])
+        if self.batched:
+            snapshot = {}
+            for parsed, _ in packets:
+                snapshot.update(parsed) # newer packets overwrite older values of the same signal
+            if snapshot and self.derived is not None:
+                # the derived signals are worked out once per batch, from the newest values, at the time the newest packet came in
+                stamp = packets[-1][1]
+                received = now if stamp is None else stamp[3]
+                derived = self.derived.update(snapshot, received)
+                if derived:
+                    snapshot.update(derived)
+                    if self.history is not None:
+                        self.history.record(derived, received)
+            if snapshot:
+                self.refresh(snapshot)
+                self.batch_received.emit(snapshot)
+        else:
+            for parsed, _ in packets:
+                self.refresh(parsed)
+                for key, value in parsed.items():
+                    self.data_received.emit(key, value)
+
+    #------------ last-known state --------------
+    # function to remember the newest values, and clear the stale flag of signals that got a value again
+    def refresh(self, values):
+        self.state.update(values)
+        self.last_update.update(dict.fromkeys(values, time.monotonic()))
+        if self.stale:
+            for name in self.stale.intersection(values):
+                self.stale.discard(name)
+                self.stale_changed.emit(name, False)
+
+    # function called on a timer, flags the signals that haven't had a value (or a keyframe) within stale_timeout
+    def check_stale(self):
+        cutoff = time.monotonic() - self.stale_timeout
+        for name, last in self.last_update.items():
+            if last < cutoff and name not in self.stale:
+                self.stale.add(name)
+                self.stale_changed.emit(name, True)
+    #--------------------------------------------
+
+    #------------ threaded mode --------------
+    # the receiver thread drains the socket (with a bigger kernel receive buffer, so bursts don't get dropped) and puts the parsed
+    # packets into a bounded ring buffer. The GUI thread empties the buffer on a timer, at its own pace.
+    # the ring buffer is a deque with a max length: appends and pops on a deque are atomic, so no lock is needed between the two
+    # threads, and if the GUI falls behind the oldest packets get pushed out (and counted in dropped)
+    def start_thread(self, buffer_size, socket_buffer_bytes, poll_interval_ms):
+        self.buffer = deque(maxlen=buffer_size)
+        self.running = threading.Event()
+        self.running.set()
+
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, socket_buffer_bytes)
+        self.udp_socket.setblocking(False) # the thread waits with select() instead, see receive_loop
+        try:
+            self.udp_socket.bind(('127.0.0.1', 6000))
+            print("[DataReceiver] Bound to 6000 (threaded)")
+        except OSError as e:
+            print(f"[DataReceiver] Failed to bind: {e}")
+
+        self.thread = threading.Thread(target=self.receive_loop, name="DataReceiver", daemon=True)
+        self.thread.start()
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.drain_buffer)
+        self.poll_timer.start(poll_interval_ms)
+
+    # receiver thread loop, waits for a datagram and then reads everything else that is already waiting in one go
+    # (the socket is non-blocking so the reads stop as soon as it is empty, select() times out so the thread notices when it is stopped)
+    def receive_loop(self):
+        while self.running.is_set():
+            try:
+                readable, _, _ = select.select([self.udp_socket], [], [], 0.2)
+            except (OSError, ValueError):
+                break
+            if not readable:
+                continue
+            datagrams = []
+            while True:
+                try:
+                    datagrams.append(self.udp_socket.recvfrom(65535))
+                except BlockingIOError:
+                    break
+                except ConnectionResetError:
+                    continue # windows reports "port unreachable" for a subscription sent to a sender that has gone away
+                except OSError:
+                    break
+
+            for datagram, address in datagrams:
+                self.received += 1
+                if address not in self.senders:
+                    self.new_sender(address)
+                try:
+                    parsed = self.parse(datagram)
+                except Exception as e:
+                    self.failed += 1
+                    print(f"Failed to parse datagram: {e}")
+                    continue
+                self.parsed += 1
+                if len(self.buffer) == self.buffer.maxlen:
+                    self.dropped += 1 # oldest packet gets pushed out of the ring buffer
+                self.buffer.append(parsed)
+
+    # GUI thread side, takes everything out of the ring buffer and delivers it
+    def drain_buffer(self):
+        packets = []
+        while True:
+            try:
+                packets.append(self.buffer.popleft())
+            except IndexError:
+                break
+        self.deliver(packets)
+
+    # function to stop the receiver thread and close the socket (threaded mode)
+    def close(self):
+        if self.threaded:
+            self.running.clear()
+            self.poll_timer.stop()
+            self.thread.join(timeout=1)
+            self.udp_socket.close()
+        else:
+            self.socket.close()
+    #-----------------------------------------
+
+    #------------ selective mode --------------
+    # tell the senders which signals the dashboard is showing, so they only decode and send those.
+    # the subscription goes back to every address we've received from (and to new senders as soon as they show up)
+    # derived signals aren't sent by anyone, the senders get asked for the signals they are worked out from instead
+    def subscribe(self, names):
+        self.subscription = list(names) if self.derived is None else self.derived.expand(names)
+        self.send_subscription()
+
+    def new_sender(self, address):
+        self.senders.add(address)
+        self.send_subscription(address)
+
+    # function to send the subscription to one sender, or all of them. nothing goes out while no signal is shown, the senders
+    # keep sending what they were last asked for (or everything) until a widget is added
+    def send_subscription(self, address=None):
+        if not self.subscription:
+            return
+        packet = subscription_packet(self.subscription)
+        for host, port in ([address] if address is not None else list(self.senders)):
+            try:
+                if self.threaded:
+                    self.udp_socket.sendto(packet, (host, port))
+                else:
+                    self.socket.writeDatagram(packet, QHostAddress(host), port)
+            except OSError as e:
+                print(f"[DataReceiver] Failed to send subscription to {host}:{port}: {e}")
+    #------------------------------------------
+
+    # function to get the receiver counters
+    def stats(self):
+        return {"received": self.received,
+                "parsed": self.parsed,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "buffered": len(self.buffer) if self.threaded else 0}
+
+# class to cap how often the dashboard repaints
+# widgets only store their newest value and mark themselves dirty, then once per frame every dirty widget gets one repaint.
+# values that come in faster than the frame rate just overwrite each other (latest value wins), and those are counted as coalesced
+class RenderScheduler(QObject):
+    def __init__(self, fps=60, report_interval=None):
+        super().__init__()
+        self.dirty = {} # widgets waiting for a repaint (dict used as an ordered set)
+        self.requests = 0 # total repaint requests from set_value
+        self.coalesced = 0 # requests merged into a repaint that was already pending (values that were never shown)
+        self.repaints = 0 # widget repaints actually done
+        self.frames = 0 # frames that had at least one dirty widget
+        self.report_interval = report_interval # seconds between printed stats, None to not print them
+        self.last_report = time.monotonic()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.render_frame)
+        self.set_fps(fps)
+
+    # function to change the target frame rate
+    def set_fps(self, fps):
+        self.fps = fps
+        self.timer.start(max(1, int(1000 / fps)))
+
+    # function called by widgets when they have a new value to show
+    def request(self, widget):
+        self.requests += 1
+        if widget in self.dirty:
+            self.coalesced += 1
+        else:
+            self.dirty[widget] = None
+
+    # function to forget a widget that is being removed from the window
+    def discard(self, widget):
+        self.dirty.pop(widget, None)
+
+    # function called once per frame, repaints every dirty widget once
+    def render_frame(self):
+        if self.dirty:
+            widgets = list(self.dirty)
+            self.dirty.clear()
+            for widget in widgets:
+                widget.request_repaint()
+            self.repaints += len(widgets)
+            self.frames += 1
+
+        if self.report_interval is not None and time.monotonic() - self.last_report >= self.report_interval:
+            self.last_report = time.monotonic()
+            print(f"[RenderScheduler] {self.fps} fps target: {self.frames} frames, {self.repaints} repaints, "
+                  f"{self.coalesced}/{self.requests} updates coalesced")
+
+    # function to get the counters, ex: to size the display rate for the Pi
+    def stats(self):
+        return {"fps": self.fps,
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "repaints": self.repaints,
+                "frames": self.frames}
+
+# class to keep track of the live dashboard widget objects and which signal each one displays
+# routing a value is then a single dict lookup on the signal name, and signals no widget shows are dropped right away
+class WidgetRegistry:
+    def __init__(self, scheduler=None, on_change=None):
+        self.widgets = {} # widget name -> live widget object
+        self.subscriptions = {} # signal name -> list of live widget objects showing that signal
+        self.scheduler = scheduler # RenderScheduler handed to every registered widget (None = widgets repaint right away)
+        self.on_change = on_change # called with the list of shown signal names whenever it changes (ex: DataReceiver.subscribe)
+        self.state = {} # last-known {signal name: value} (ex: DataReceiver.state), new widgets start out showing it
+        self.stale = set() # signals whose value is stale (ex: DataReceiver.stale), new widgets start out flagged
+        self.link_stats = None # LinkStats handed to every registered widget, so paints get measured (see linkstats.py)
+        self.history = None # HistoryStore handed to every registered widget, for the trends (see signalhistory.py)
+
+    # function to register a newly created widget
+    def add(self, name, widget):
+        widget.scheduler = self.scheduler
+        widget.link_stats = self.link_stats
+        widget.history = self.history
+        self.widgets[name] = widget
+        new_signal = widget.signalname not in self.subscriptions
+        self.subscriptions.setdefault(widget.signalname, []).append(widget)
+        if widget.signalname in self.state:
+            widget.set_value(self.state[widget.signalname], widget.signalname)
+        widget.set_stale(widget.signalname in self.stale)
+        if new_signal and self.on_change is not None:
+            self.on_change(list(self.subscriptions))
+
+    # function to unregister a widget when it gets removed from the window
+    def remove(self, name, widget):
+        if self.widgets.get(name) is widget:
+            del self.widgets[name]
+        subscribers = self.subscriptions.get(widget.signalname, [])
+        if widget in subscribers:
+            subscribers.remove(widget)
+        if self.scheduler is not None:
+            self.scheduler.discard(widget)
+        if not subscribers and widget.signalname in self.subscriptions:
+            del self.subscriptions[widget.signalname]
+            if self.on_change is not None:
+                self.on_change(list(self.subscriptions))
+
+    # function to send one incoming value to the widgets showing that signal
+    def route(self, name, value):
+        for widget in self.subscriptions.get(name, ()):
+            widget.set_value(value, name)
+
+    # function to flag (or unflag) the widgets showing a signal as stale, connect DataReceiver.stale_changed to this
+    def set_stale(self, name, stale):
+        for widget in self.subscriptions.get(name, ()):
+            widget.set_stale(stale)
+
+    # function to send a {signal name: latest value} snapshot to the widgets, only looks at the signals that are shown
+    def route_batch(self, snapshot):
+        for name, widgets in self.subscriptions.items():
+            if name in snapshot:
+                value = snapshot[name]
+                for widget in widgets:
+                    widget.set_value(value, name)
+
+# single-surface renderer: one widget that draws every instrument on the dashboard in a single paint pass, instead of every
+# Gauge/Tickbar/Light being a QWidget that Qt paints, clips and composites on its own.
+# the instruments are still the normal dashboard widgets, they are just hidden: they keep their spot in the window's layout
+# (so the grid, the add dialogs and the remove buttons work the same as with plain widgets) and the canvas calls their
+# paint() at that spot. only the spots of instruments that changed get repainted, Qt merges them into one region per frame.
+# the canvas covers its parent window and sits underneath everything else in it
+class DashboardCanvas(QWidget):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.instruments = {} # instrument widget -> QRect it was last drawn at (None until it has been placed by the layout)
+        self.paints = 0 # paint passes done
+        self.instrument_paints = 0 # instruments drawn over all the paint passes
+        self.setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent) # every dirty pixel gets drawn here, Qt doesn't need to clear it first
+        self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents) # clicks go through to the buttons on top
+        self.resize(parent.size())
+        self.lower()
+        parent.installEventFilter(self)
+
+    # keeps the canvas the same size as its parent window
+    def eventFilter(self, obj, event):
+        if obj is self.parentWidget() and event.type() == QEvent.Type.Resize:
+            self.resize(event.size())
+        return False
+
+    # function to start drawing a dashboard widget on the canvas, call this before adding the widget to its layout
+    def add(self, instrument):
+        instrument.canvas = self
+        instrument.background_color = self.palette().window().color() # opaque background, so the canvas doesn't have to clear under it
+        instrument.background = None
+        policy = instrument.sizePolicy()
+        policy.setRetainSizeWhenHidden(True) # keeps its space (and its geometry) in the layout while hidden
+        instrument.setSizePolicy(policy)
+        instrument.hide()
+        self.instruments[instrument] = None
+        self.update() # the layout moves things around, so everything gets redrawn once
+
+    # function to stop drawing a widget that is being removed from the window
+    def remove(self, instrument):
+        self.instruments.pop(instrument, None)
+        instrument.canvas = None
+        self.update()
+
+    # where an instrument is on the canvas, from its place in the layout
+    def instrument_rect(self, instrument):
+        return QRect(instrument.mapTo(self.parentWidget(), QPoint(0, 0)), instrument.size())
+
+    # function called (through the render scheduler) when an instrument has something new to show
+    def mark_dirty(self, instrument):
+        if instrument in self.instruments:
+            rect = self.instruments[instrument]
+            if rect is None:
+                self.update()
+            else:
+                self.update(rect)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        background = self.palette().window()
+        region = event.region()
+        full = region.boundingRect() == self.rect() # first paint, resize or layout change: everything is worked out again
+        if full:
+            painter.fillRect(self.rect(), background)
+        for instrument, rect in self.instruments.items():
+            if full or rect is None:
+                placed = self.instrument_rect(instrument)
+                if rect is None or placed.size() != rect.size():
+                    instrument.background = None
+                self.instruments[instrument] = rect = placed
+            if not region.intersects(rect):
+                continue
+            # every instrument starts from a fresh painter state (no pen, brush, font or render hints left over from the
+            # one before), the same as painting itself in widget mode
+            painter.save()
+            painter.setClipRect(rect)
+            if instrument.background is None and not hasattr(instrument, 'draw_background'):
+                painter.fillRect(rect, background) # widgets without a cached background draw on a clear spot
+            painter.translate(rect.topLeft())
+            instrument.paint(painter)
+            painter.restore()
+            self.instrument_paints += 1
+        painter.end()
+        self.paints += 1
+
+# debug overlay with the link stats (see linkstats.py) drawn over the top of a window: loss counters, achieved frame rate,
+# and the update rate and latencies (p50/p95, sender -> receiver and sender -> paint) of the busiest signals
+class StatsOverlay(QWidget):
+    def __init__(self, parent, stats, receiver=None, scheduler=None, refresh_ms=1000, max_signals=12):
+        super().__init__(parent)
+        self.stats = stats
+        self.receiver = receiver
+        self.scheduler = scheduler
+        self.max_signals = max_signals
+        self.lines = []
+        self.last_frames = 0
+        self.last_refresh = time.monotonic()
+        self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents) # clicks go through to the widgets underneath
+        self.setFont(QFont("Courier New", 9))
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(refresh_ms)
+
+    # function to work out the text to show, called on the timer
+    def refresh(self):
+        rates = self.stats.update_rates()
+        loss = self.stats.loss()
+        lines = [f"link: {loss['datagrams']} datagrams, {loss['lost']} lost ({loss['loss_percent']}%), {loss['reordered']} reordered"]
+        if self.receiver is not None:
+            receiver = self.receiver.stats()
+            lines.append(f"receiver: {receiver['failed']} failed, {receiver['dropped']} dropped, {receiver['buffered']} buffered")
+        if self.scheduler is not None:
+            now = time.monotonic()
+            frames = self.scheduler.frames
+            lines.append(f"render: {(frames - self.last_frames) / max(now - self.last_refresh, 1e-6):.1f} fps (target {self.scheduler.fps})")
+            self.last_frames, self.last_refresh = frames, now
+        lines.append(f"{'signal':<24} {'rate/s':>8} {'net p50/p95 ms':>15} {'total p50/p95 ms':>17}")
+        for name in sorted(rates, key=rates.get, reverse=True)[:self.max_signals]:
+            histograms = self.stats.latency.get(name)
+            if histograms is None:
+                latency = f"{'-':>15} {'-':>17}"
+            else:
+                network, total = histograms["network"], histograms["total"]
+                latency = f"{network.percentile(0.5):>7g}/{network.percentile(0.95):<7g} {total.percentile(0.5):>8g}/{total.percentile(0.95):<8g}"
+            lines.append(f"{name[:24]:<24} {rates[name]:>8.1f} {latency}")
+        self.lines = lines
+
+        fm = QFontMetrics(self.font())
+        self.resize(max(fm.horizontalAdvance(line) for line in lines) + 16, fm.height() * len(lines) + 12)
+        self.raise_()
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(0, 0, 0, 180))
+        painter.setPen(QColor(0, 255, 120))
+        fm = QFontMetrics(self.font())
+        for i, line in enumerate(self.lines):
+            painter.drawText(8, 6 + fm.ascent() + i * fm.height(), line)
 
 # class to create a new instance of a dashboard widget object, with remove widget button
 class AddToWindow(QWidget):
@@ -293,11 +987,19 @@ class AddToWindow(QWidget):
             temp = Tickbar(self.min_value, self.max_value,self.numticks,self.label,self.signalname)
             temp.setFixedSize(250,60)
             name = f'Tickbar_{self.signalname}'
+
+        elif self.widgetname == 'Trend':
+            temp = Trend(self.min_value, self.max_value, self.numticks, self.label, self.signalname) # numticks is the seconds shown for a trend
+            temp.setFixedSize(250, 120)
+            name = f'Trend_{self.signalname}'
         
         else:
             raise ValueError(f"Widget type not found.")
 
         setattr(self, name, temp)
+        canvas = getattr(self.parent, 'canvas', None)
+        if canvas is not None:
+            canvas.add(temp) # single-surface mode, the canvas draws the widget instead of it painting itself
         value = {"widget_type" : f"{self.widgetname}",
                  "signal" : f"{self.signalname}",
                  "label" : f"{self.label}",
@@ -307,6 +1009,7 @@ class AddToWindow(QWidget):
                  "placement" : (self.i,self.j)}
         
         self.parent.allwidgets[name]=value
+        self.parent.registry.add(name, temp) # live widget object, used to route incoming signals straight to it
 
         vbox.addWidget(temp)
 
@@ -325,6 +1028,9 @@ class AddToWindow(QWidget):
             container.deleteLater()
             if name in self.parent.allwidgets:
                 del self.parent.allwidgets[name]
+            self.parent.registry.remove(name, temp)
+            if temp.canvas is not None:
+                temp.canvas.remove(temp)
             self.remove_callback() # refers to parent window/running code file that has remove_callback in it, adds back the add widget button to window
 
         remove_button.clicked.connect(remove_widget)
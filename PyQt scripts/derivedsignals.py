@@ -0,0 +1,194 @@
+import ast
+import math
+from collections import deque
+
+# Derived signals, worked out on the dashboard from the signals that come in, instead of being computed and sent by the
+# sender as extra channels. A derived signal is a Python expression over other signals, ex:
+#
+#   derived = DerivedSignals()
+#   derived.define("RPM_High", "hysteresis(RPM, 1750, 1650)")   # threshold that doesn't flicker around the limit
+#   derived.define("OilPress_psi", "OilPress * 14.5038")          # unit conversion
+#   derived.define("RPM_Rate", "rate(RPM)")                       # change per second
+#   derived.define("Battery_Avg", "average(BatteryVoltage, 20)")  # moving average of the last 20 values
+#   derived.define("Overheat", "CoolantTemp > 105 and RPM > 3000") # True/False come out as 1.0/0.0
+#
+# Every expression is checked and compiled once when it is defined. DataReceiver(derived=...) then runs update() once per
+# batch (or per packet when not batched), which only evaluates the derived signals whose inputs are in that batch, and puts
+# their values in with the received ones, so widgets, the last-known state, the stale flags and the history treat them
+# exactly like received signals. Derived signals can use other derived signals that were defined before them.
+# Functions that keep state between updates (hysteresis, rate, average, hold_max, hold_min) get their own state every
+# place they are used in an expression.
+
+# plain functions the expressions can use
+FUNCTIONS = {
+    'abs': abs, 'min': min, 'max': max, 'round': round,
+    'sqrt': math.sqrt, 'exp': math.exp, 'log': math.log, 'log10': math.log10,
+    'sin': math.sin, 'cos': math.cos, 'tan': math.tan, 'atan2': math.atan2, 'degrees': math.degrees, 'radians': math.radians,
+    'floor': math.floor, 'ceil': math.ceil, 'pi': math.pi,
+    'clip': lambda x, low, high: max(low, min(x, high)),
+}
+
+# parts of Python an expression can be made of (no attributes, subscripts, lambdas...), everything else is refused
+ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp, ast.Call, ast.Name, ast.Load,
+                 ast.Constant, ast.operator, ast.unaryop, ast.boolop, ast.cmpop)
+
+
+# 1.0 once x reaches on, 0.0 once it drops to off, and whatever it was before in between
+class Hysteresis:
+    def __init__(self, engine):
+        self.state = 0.0
+
+    def __call__(self, x, on, off):
+        if x >= on:
+            self.state = 1.0
+        elif x <= off:
+            self.state = 0.0
+        return self.state
+
+
+# change of x per second, from the previous value and the time the two came in (0 for the first value)
+class Rate:
+    def __init__(self, engine):
+        self.engine = engine
+        self.last = None
+
+    def __call__(self, x):
+        now = self.engine.now
+        rate = 0.0
+        if self.last is not None:
+            last_x, last_t = self.last
+            rate = (x - last_x) / (now - last_t) if now > last_t else self.rate
+        self.last = (x, now)
+        self.rate = rate
+        return rate
+
+
+# mean of the last n values of x (a running sum, so it costs the same for any n)
+class Average:
+    def __init__(self, engine):
+        self.window = deque()
+        self.total = 0.0
+
+    def __call__(self, x, n):
+        self.window.append(x)
+        self.total += x
+        while len(self.window) > n:
+            self.total -= self.window.popleft()
+        return self.total / len(self.window)
+
+
+# highest value of x so far (peak hold)
+class HoldMax:
+    def __init__(self, engine):
+        self.peak = None
+
+    def __call__(self, x):
+        if self.peak is None or x > self.peak:
+            self.peak = x
+        return self.peak
+
+
+# lowest value of x so far
+class HoldMin:
+    def __init__(self, engine):
+        self.low = None
+
+    def __call__(self, x):
+        if self.low is None or x < self.low:
+            self.low = x
+        return self.low
+
+
+STATEFUL = {'hysteresis': Hysteresis, 'rate': Rate, 'average': Average, 'hold_max': HoldMax, 'hold_min': HoldMin}
+
+
+# one compiled derived signal
+class Definition:
+    def __init__(self, name, expression, code, inputs, namespace):
+        self.name = name
+        self.expression = expression
+        self.code = code # compiled expression
+        self.inputs = inputs # names of the signals it reads
+        self.namespace = namespace # functions and the state objects of its stateful calls
+        self.errors = 0 # evaluations that raised (ex: division by zero), only the first one gets printed
+
+
+# class for the set of derived signals on a dashboard
+class DerivedSignals:
+    def __init__(self):
+        self.definitions = {} # derived signal name -> Definition, in the order they were defined
+        self.values = {} # newest value of every signal seen (received and derived), the expressions read their inputs from here
+        self.now = 0.0 # time of the update being evaluated (what rate() measures against)
+
+    # function to add (or replace) a derived signal, raises ValueError if the expression isn't allowed or doesn't parse
+    def define(self, name, expression):
+        try:
+            tree = ast.parse(expression, mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f"Derived signal {name}: can't parse '{expression}': {e.msg}")
+        namespace = {'__builtins__': {}, **FUNCTIONS}
+        inputs = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, ALLOWED_NODES):
+                raise ValueError(f"Derived signal {name}: '{type(node).__name__}' isn't allowed in '{expression}'")
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or (node.func.id not in FUNCTIONS and node.func.id not in STATEFUL):
+                    raise ValueError(f"Derived signal {name}: unknown function in '{expression}'")
+                if node.func.id in STATEFUL:
+                    # every stateful call gets its own state object, the call is pointed at it
+                    state = f"_state{len(namespace)}"
+                    namespace[state] = STATEFUL[node.func.id](self)
+                    node.func.id = state
+            elif isinstance(node, ast.Name) and node.id not in namespace and node.id not in STATEFUL:
+                inputs.add(node.id)
+        inputs -= FUNCTIONS.keys()
+        if name in inputs:
+            raise ValueError(f"Derived signal {name} can't use itself")
+        code = compile(ast.fix_missing_locations(tree), f"<derived {name}>", 'eval')
+        self.definitions.pop(name, None) # a redefined signal goes to the end, after anything it might now use
+        self.definitions[name] = Definition(name, expression, code, inputs, namespace)
+
+    def remove(self, name):
+        self.definitions.pop(name, None)
+
+    # function to take in a batch of {signal name: value} that came in at time now, returns {derived name: value} for the
+    # derived signals that had an input in the batch (and all of their inputs known)
+    def update(self, values, now):
+        self.values.update(values)
+        self.now = now
+        changed = set(values)
+        derived = {}
+        for definition in self.definitions.values():
+            if changed.isdisjoint(definition.inputs):
+                continue
+            try:
+                # the inputs are looked up straight in self.values, nothing gets copied per evaluation
+                value = float(eval(definition.code, definition.namespace, self.values))
+            except NameError:
+                continue # an input hasn't come in yet
+            except Exception as e:
+                definition.errors += 1
+                if definition.errors == 1:
+                    print(f"[DerivedSignals] {definition.name} = {definition.expression} failed: {e}")
+                continue
+            self.values[definition.name] = value
+            derived[definition.name] = value
+            changed.add(definition.name)
+        return derived
+
+    # function to swap the derived signals in a list of names for the received signals they are worked out from (following
+    # derived signals of derived signals), so the senders get subscribed to what the dashboard actually needs
+    def expand(self, names):
+        needed = []
+        pending = list(names)
+        seen = set()
+        while pending:
+            name = pending.pop(0)
+            if name in seen:
+                continue
+            seen.add(name)
+            if name in self.definitions:
+                pending.extend(sorted(self.definitions[name].inputs))
+            else:
+                needed.append(name)
+        return needed
@@ -3,7 +3,14 @@ from PyQt6.QtWidgets import (
     QComboBox, QLineEdit, QDialogButtonBox, QGridLayout, QHBoxLayout
 )
 from PyQt6.QtCore import Qt
-from dashboard_templates import DataReceiver, AddToWindow
+from PyQt6.QtGui import QKeySequence, QShortcut
+from dashboard_templates import DataReceiver, AddToWindow, WidgetRegistry, RenderScheduler, StatsOverlay, DashboardCanvas
+from linkstats import LinkStats
+from signalhistory import HistoryStore
+from derivedsignals import DerivedSignals
+from sessionrecorder import SessionRecorder
+import os
+import time
 
 # Config dialog
 class AddWidgetDialog(QDialog):
@@ -13,7 +20,7 @@ class AddWidgetDialog(QDialog):
         layout = QVBoxLayout()
 
         self.type_box = QComboBox()
-        self.type_box.addItems(["Gauge", "Light", "Tickbar"])
+        self.type_box.addItems(["Gauge", "Light", "Tickbar", "Trend"])
 
         self.config_input1 = QLineEdit()
         self.config_input1.setPlaceholderText("Enter the signal name that you want to show on this widget::")
@@ -28,7 +35,7 @@ class AddWidgetDialog(QDialog):
         self.config_input4.setPlaceholderText("Enter the minimum value for this widget::")
 
         self.config_input5 = QLineEdit()
-        self.config_input5.setPlaceholderText("Enter the number of ticks if you selected a tickbar widget::")
+        self.config_input5.setPlaceholderText("Enter the number of ticks if you selected a tickbar widget (or seconds shown for a trend)::")
 
 
         layout.addWidget(QLabel("Choose Widget Type:"))
@@ -58,12 +65,15 @@ class AddWidgetDialog(QDialog):
 
 # Each slot in the layout
 class SlotWidget(QWidget):
-    def __init__(self, parent_layout, all_widgets_dict):
+    def __init__(self, parent_layout, all_widgets_dict, registry, position, canvas=None):
         super().__init__()
         self.parent_layout = parent_layout
         self.layout = QVBoxLayout()
         self.setLayout(self.layout)
-        self.allwidgets = all_widgets_dict
+        self.allwidgets = all_widgets_dict # config of every widget on the dashboard
+        self.registry = registry # live widget objects, used to route the incoming signals
+        self.position = position # (row, column) of this slot in the window grid
+        self.canvas = canvas # DashboardCanvas that draws the widgets in single-surface mode (None = they paint themselves)
 
         self.add_button = QPushButton("Add Widget +")
         self.add_button.clicked.connect(self.openAddDialog)
@@ -81,12 +91,14 @@ class SlotWidget(QWidget):
                 row = [("Light", data["signal"], data["label"], None, None, None)]
             elif widget_type == "Tickbar":
                 row = [("Tickbar", data["signal"], data["label"], data["min"], data["max"], data["ticks"])]
+            elif widget_type == "Trend":
+                row = [("Trend", data["signal"], data["label"], data["min"], data["max"], data["ticks"])]
             self.layout.addLayout(self.widget_row(row))
 
     def widget_row(self, widgets):
         row_layout = QHBoxLayout()
         for widget in widgets:
-            widget_creator = AddToWindow(self, *widget, remove_callback=self.restore_add_button)
+            widget_creator = AddToWindow(self, *widget, *self.position, remove_callback=self.restore_add_button)
             widget_name = f"{widget[0]}_{widget[1]}"  
             row_layout.addWidget(widget_creator.container, alignment=Qt.AlignmentFlag.AlignHCenter)
         return row_layout
@@ -97,28 +109,89 @@ class SlotWidget(QWidget):
         self.layout.addWidget(self.add_button)
 
 
+# renderer="widgets" is the simple mode, every gauge/light/tickbar is its own widget that paints itself.
+# renderer="canvas" draws all of them on one DashboardCanvas in a single paint pass, and only repaints the ones that changed
+# with a recording_dir (ex: "recordings") every session gets recorded to a .drec file in it, replay it with recording_udpsender.py.
+# off by default, nothing cleans the folder up so it keeps growing for as long as sessions get recorded
 class Window(QWidget):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, renderer="widgets", recording_dir=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.setWindowTitle("PyQt Driver Dashboard")
         self.resize(1920, 1080)
         layout = QGridLayout()
         self.allwidgets = {}
+        self.scheduler = RenderScheduler(fps=60) # repaints are capped at 60 fps, pass report_interval=10 to print the stats
+        self.registry = WidgetRegistry(self.scheduler) # signal name -> live widgets showing it
+        self.canvas = DashboardCanvas(self) if renderer == "canvas" else None
 
         positions = [(i, j) for i in range(2) for j in range(3)]
         for pos in positions:
-            slot = SlotWidget(layout, self.allwidgets)
+            slot = SlotWidget(layout, self.allwidgets, self.registry, pos, self.canvas)
             layout.addWidget(slot, *pos)
 
         self.setLayout(layout)
-        self.receiver = DataReceiver()
+        # one {signal: value} snapshot per batch of packets instead of one signal per value,
+        # and the socket is read on its own thread so dialogs and repaints don't make us miss packets
+        # widgets get greyed out when their signal has had nothing (not even a keyframe) for 3 seconds
+        # the link stats measure latency (sender -> receiver -> paint), loss and update rates for every signal
+        self.link_stats = LinkStats()
+        self.registry.link_stats = self.link_stats
+        # the history keeps the recent values of every signal (256 kB each) for the trend widgets
+        self.history = HistoryStore()
+        self.registry.history = self.history
+        # derived signals are worked out here from the ones exampleUDPsender.py sends, and can be put on widgets like any other
+        self.derived = DerivedSignals()
+        self.derived.define("RPM_High", "hysteresis(RPM, 1750, 1650)") # like RPM_Above_1700, but it doesn't flicker at the limit
+        self.derived.define("OilPress_kPa", "OilPress * 6.89476")
+        self.derived.define("RPM_Rate", "rate(RPM)")
+        self.derived.define("BatteryVoltage_Avg", "average(BatteryVoltage, 20)")
+        # the recorder writes every datagram received to disk on its own thread
+        self.recorder = None
+        if recording_dir is not None:
+            self.recorder = SessionRecorder(os.path.join(recording_dir, f"session_{time.strftime('%Y%m%d_%H%M%S')}.drec"))
+            print(f"Recording to {self.recorder.path}")
+        self.receiver = DataReceiver(batched=True, threaded=True, stale_timeout=3.0, link_stats=self.link_stats, history=self.history,
+                                     derived=self.derived, recorder=self.recorder)
         print(f"Receiver created: {self.receiver}")
-        self.receiver.data_received.connect(self.route_signal)
+        self.receiver.batch_received.connect(self.route_batch)
+        self.receiver.stale_changed.connect(self.registry.set_stale)
+        # widgets added later start out with the last value received (senders with a deadband only send changes)
+        self.registry.state = self.receiver.state
+        self.registry.stale = self.receiver.stale
+        # selective mode: the senders only decode and send the signals that are on screen, and get told again whenever
+        # a widget is added or removed
+        self.registry.on_change = self.receiver.subscribe
+        self.receiver.subscribe(list(self.registry.subscriptions))
+
+        # F12 shows/hides the debug overlay with the link stats, F11 writes them to stats_file (.json, or .csv for a table)
+        self.stats_file = "dashboard_stats.json"
+        self.overlay = StatsOverlay(self, self.link_stats, self.receiver, self.scheduler)
+        self.overlay.hide()
+        QShortcut(QKeySequence("F12"), self).activated.connect(lambda: self.overlay.setVisible(not self.overlay.isVisible()))
+        QShortcut(QKeySequence("F11"), self).activated.connect(self.dump_stats)
 
 
     def route_signal(self, name, value):
-        for key, a in self.allwidgets.items():
-            self.allwidgets[key].set_value(value,name)
+        self.registry.route(name, value)
+
+    # routes a whole snapshot of the latest values to the widgets at once
+    def route_batch(self, snapshot):
+        self.registry.route_batch(snapshot)
+
+    def dump_stats(self):
+        try:
+            self.link_stats.dump(self.stats_file, self.receiver, self.scheduler)
+            print(f"Wrote link stats to {self.stats_file}")
+        except OSError as e:
+            print(f"Failed to write link stats: {e}")
+
+    # the receiver stops first, so nothing new gets queued, then the recorder writes out whatever it still has queued
+    def closeEvent(self, event):
+        self.receiver.close()
+        if self.recorder is not None:
+            self.recorder.close()
+            print(f"Recorded {self.recorder.written} datagrams to {self.recorder.path}")
+        super().closeEvent(event)
 
 if __name__ == "__main__":
     app = QApplication([])
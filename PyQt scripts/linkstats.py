@@ -0,0 +1,194 @@
+import csv
+import json
+import time
+from bisect import bisect_right
+
+# Latency and packet loss measurements for the dashboard's UDP link, filled in by DataReceiver (when it is given a LinkStats)
+# and by the widgets as they paint.
+# Every binary datagram carries a sequence number and the time it was sent (see udpprotocol.py), so for every signal we can
+# measure three latencies:
+#   network: sender -> receiver (time the datagram was read off the socket - time it was sent)
+#   display: receiver -> paint (time the widget painted the value - time it was read off the socket)
+#   total:   sender -> paint
+# The sequence numbers give the lost and out-of-order datagram counts. Latencies between two machines are only as good
+# as their clocks, sync them (ex: NTP) when the sender isn't running on the same machine as the dashboard.
+# JSON datagrams have no sequence number or send time, so they only show up in the update rates.
+
+# latency histogram bucket edges, in milliseconds (the last bucket is everything above 1 s)
+BUCKETS_MS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+
+# class for a latency histogram with fixed buckets, cheap enough to add to for every value
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    # add one latency, in seconds
+    def add(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect_right(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    # upper edge of the bucket the given fraction of latencies fall under (ex: 0.95 for the 95th percentile), in ms
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        running = 0
+        for edge, count in zip(BUCKETS_MS, self.counts):
+            running += count
+            if running >= target:
+                return edge
+        return self.max
+
+    def summary(self):
+        return {"count": self.count, "mean_ms": round(self.mean(), 3), "p50_ms": self.percentile(0.5),
+                "p95_ms": self.percentile(0.95), "p99_ms": self.percentile(0.99), "max_ms": round(self.max, 3),
+                "buckets": self.counts}
+
+
+# class to track the sequence numbers of one sender session, for its loss and reorder counts
+class SequenceTracker:
+    def __init__(self, sequence):
+        self.expected = (sequence + 1) & 0xFFFFFFFF # next sequence number we expect
+        self.datagrams = 1 # binary datagrams seen
+        self.lost = 0 # sequence numbers that never showed up (goes back down when one turns up late)
+        self.reordered = 0 # datagrams that came in after a later one
+
+    def add(self, sequence):
+        self.datagrams += 1
+        if sequence == self.expected:
+            self.expected = (sequence + 1) & 0xFFFFFFFF
+        elif (sequence - self.expected) & 0xFFFFFFFF < 0x80000000:
+            self.lost += (sequence - self.expected) & 0xFFFFFFFF # skipped ahead, everything in between is missing (for now)
+            self.expected = (sequence + 1) & 0xFFFFFFFF
+        else:
+            self.reordered += 1 # one we had given up on turned up late
+            self.lost = max(0, self.lost - 1)
+
+
+# class to collect the link measurements, hand one to DataReceiver(link_stats=...) and to WidgetRegistry.link_stats
+class LinkStats:
+    STAGES = ("network", "display", "total")
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.latency = {} # signal name -> {stage: LatencyHistogram}
+        self.updates = {} # signal name -> values received
+        self.paints = {} # signal name -> values painted
+        self.pending = {} # signal name -> (send time, receive time) of the newest value that hasn't been painted yet
+
+        # sequence tracking, per sender session (several senders can share the dashboard's port)
+        self.sessions = {} # session id -> SequenceTracker
+
+        # update rates over the last rate window, see update_rates()
+        self.rates = {}
+        self.last_rate_time = self.start
+        self.last_updates = {}
+
+    # function called by DataReceiver for every delivered datagram, stamp is (session, sequence, send time, receive time)
+    # (or None for JSON datagrams) and values the {signal name: value} it held
+    def datagram(self, values, stamp):
+        for name in values:
+            self.updates[name] = self.updates.get(name, 0) + 1
+        if stamp is None:
+            return
+        session, sequence, sent, received = stamp
+        tracker = self.sessions.get(session)
+        if tracker is None:
+            self.sessions[session] = SequenceTracker(sequence) # new sender session, start counting from here
+        else:
+            tracker.add(sequence)
+
+        network = received - sent
+        for name in values:
+            histograms = self.latency.get(name)
+            if histograms is None:
+                histograms = self.latency[name] = {stage: LatencyHistogram() for stage in self.STAGES}
+            histograms["network"].add(network)
+            self.pending[name] = (sent, received)
+
+    # function called by a widget when it has painted the value of a signal
+    def painted(self, name):
+        self.paints[name] = self.paints.get(name, 0) + 1
+        stamp = self.pending.pop(name, None)
+        if stamp is None:
+            return # already measured (ex: a repaint without a new value), or a JSON value
+        now = time.time()
+        histograms = self.latency[name]
+        histograms["display"].add(now - stamp[1])
+        histograms["total"].add(now - stamp[0])
+
+    # function to work out the updates per second of every signal since the last call, call it every second or so
+    def update_rates(self):
+        now = time.monotonic()
+        elapsed = now - self.last_rate_time
+        if elapsed <= 0:
+            return self.rates
+        self.rates = {name: (count - self.last_updates.get(name, 0)) / elapsed for name, count in self.updates.items()}
+        self.last_updates = dict(self.updates)
+        self.last_rate_time = now
+        return self.rates
+
+    # the loss counters added up over every sender session, ex: for the debug overlay
+    def loss(self):
+        datagrams = sum(tracker.datagrams for tracker in self.sessions.values())
+        lost = sum(tracker.lost for tracker in self.sessions.values())
+        reordered = sum(tracker.reordered for tracker in self.sessions.values())
+        total = datagrams + lost
+        return {"datagrams": datagrams, "lost": lost, "reordered": reordered, "sessions": len(self.sessions),
+                "loss_percent": round(100 * lost / total, 3) if total else 0.0}
+
+    # everything as one dictionary, what dump() writes for .json files
+    def summary(self, receiver=None, scheduler=None):
+        elapsed = time.monotonic() - self.start
+        signals = {}
+        for name in sorted(self.updates):
+            histograms = self.latency.get(name, {})
+            signals[name] = {
+                "updates": self.updates[name],
+                "paints": self.paints.get(name, 0),
+                "average_rate_hz": round(self.updates[name] / elapsed, 3) if elapsed > 0 else 0.0,
+                "recent_rate_hz": round(self.rates.get(name, 0.0), 3),
+                **{stage: histograms[stage].summary() for stage in self.STAGES if stage in histograms},
+            }
+        sessions = {f"{session:08x}": {"datagrams": tracker.datagrams, "lost": tracker.lost, "reordered": tracker.reordered}
+                    for session, tracker in self.sessions.items()}
+        summary = {"elapsed_s": round(elapsed, 3), "bucket_edges_ms": BUCKETS_MS, "link": self.loss(), "sessions": sessions,
+                   "signals": signals}
+        if receiver is not None:
+            summary["receiver"] = receiver.stats()
+        if scheduler is not None:
+            summary["render"] = scheduler.stats()
+        return summary
+
+    # function to write the stats to a file, .csv gets one row per signal and latency stage, anything else gets JSON
+    def dump(self, path, receiver=None, scheduler=None):
+        summary = self.summary(receiver, scheduler)
+        if not str(path).lower().endswith(".csv"):
+            with open(path, "w") as f:
+                json.dump(summary, f, indent=1)
+            return
+        bucket_names = [f"<={edge}ms" for edge in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["signal", "stage", "updates", "rate_hz", "count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms", *bucket_names])
+            for name, entry in summary["signals"].items():
+                for stage in self.STAGES:
+                    if stage in entry:
+                        latency = entry[stage]
+                        writer.writerow([name, stage, entry["updates"], entry["average_rate_hz"], latency["count"], latency["mean_ms"],
+                                         latency["p50_ms"], latency["p95_ms"], latency["p99_ms"], latency["max_ms"], *latency["buckets"]])
+            link = summary["link"]
+            writer.writerow([])
+            writer.writerow(["datagrams", "lost", "reordered", "loss_percent"])
+            writer.writerow([link["datagrams"], link["lost"], link["reordered"], link["loss_percent"]])
@@ -0,0 +1,211 @@
+import argparse
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Session recorder for the dashboard: every datagram DataReceiver(recorder=...) takes in gets appended, exactly as it came
+# off the socket, to a compact binary log along with the time it was received. Playing that back through the sender tooling
+# (replayengine.RecordingReplay, recording_udpsender.py) shows the dashboard what the driver saw, gaps, lost datagrams and
+# latency included.
+#
+# The receiver only puts (receive time, datagram) on a queue (record() never touches the disk), and a writer thread empties
+# the queue every flush_interval seconds and writes the whole lot in one write. If the disk can't keep up the queue is
+# bounded at max_pending datagrams, and the ones that don't fit are counted in dropped instead of holding up the receiver.
+#
+# File layout (little endian), append only so a crash only loses the last flush:
+#   header:  magic b'DREC' | version (u8) | 3 pad bytes | recording start time (f64, time.time()) | index_interval (f64)
+#   records: receive time (f64, time.time()) | datagram length (u16) | datagram bytes
+# Every index_interval seconds the writer also adds (receive time, file offset) of a record to a .idx file next to the
+# log, so a replay can start anywhere without reading the log up to that point. The index is only a shortcut: a missing or
+# cut off one gets rebuilt by scanning the log, at the index_interval from the header.
+#
+# python sessionrecorder.py recordings/*.drec
+
+RECORDING_MAGIC = b'DREC'
+RECORDING_VERSION = 2
+FILE_HEADER = struct.Struct('<4sBxxxdd')
+RECORD = struct.Struct('<dH')
+INDEX_DTYPE = np.dtype([('time', '<f8'), ('offset', '<u8')])
+READ_BLOCK = 1024 * 1024 # bytes read from the log at a time when reading it back
+
+
+# path of the seek index that goes with a recording
+def index_path_for(path):
+    return f"{path}.idx"
+
+
+# class to record datagrams from the receiver, hand one to DataReceiver(recorder=...) and close() it when the dashboard closes
+class SessionRecorder:
+    def __init__(self, path, flush_interval=0.5, index_interval=1.0, max_pending=200_000):
+        self.path = path
+        self.flush_interval = flush_interval # seconds between writes
+        self.index_interval = index_interval # seconds of recording between seek index entries
+        self.max_pending = max_pending # datagrams that can wait for the writer before new ones get dropped
+        self.queue = deque() # (receive time, datagram) waiting for the writer, appends and pops on a deque are atomic
+        self.start_time = time.time()
+
+        # counters, see stats()
+        self.recorded = 0 # datagrams handed to record()
+        self.dropped = 0 # datagrams thrown away because the writer fell max_pending behind
+        self.written = 0 # datagrams written to the log
+        self.bytes_written = 0 # bytes in the log (header included)
+        self.failed = None # error that stopped the writer, if any
+
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.write_loop, name="SessionRecorder", daemon=True)
+        self.thread.start()
+
+    # function to add one datagram that came in at time t, called from the receiver for every datagram (any thread)
+    def record(self, datagram, t):
+        self.recorded += 1
+        if len(self.queue) >= self.max_pending:
+            self.dropped += 1
+            return
+        self.queue.append((t, datagram))
+
+    # writer thread: the files are opened here too, so nothing in the GUI thread waits on the disk
+    def write_loop(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'wb') as log, open(index_path_for(self.path), 'wb') as index:
+                log.write(FILE_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, self.start_time, self.index_interval))
+                self.bytes_written = FILE_HEADER.size
+                next_index = self.start_time
+                while True:
+                    stopping = self.stopping.wait(self.flush_interval)
+                    next_index = self.write_pending(log, index, next_index)
+                    if stopping:
+                        break
+        except OSError as e:
+            self.failed = e
+            print(f"[SessionRecorder] Stopped recording to {self.path}: {e}")
+
+    # function to write everything in the queue in one go, returns the time the next index entry is due
+    def write_pending(self, log, index, next_index):
+        parts = []
+        entries = []
+        offset = self.bytes_written
+        count = len(self.queue) # only what is there now, anything that comes in while writing waits for the next flush
+        for _ in range(count):
+            t, datagram = self.queue.popleft()
+            if t >= next_index:
+                entries.append((t, offset))
+                next_index = t + self.index_interval
+            parts.append(RECORD.pack(t, len(datagram)))
+            parts.append(datagram)
+            offset += RECORD.size + len(datagram)
+        if not parts:
+            return next_index
+        log.write(b''.join(parts))
+        log.flush()
+        # index entries only go in after the records they point at
+        if entries:
+            index.write(np.array(entries, dtype=INDEX_DTYPE).tobytes())
+            index.flush()
+        self.written += count
+        self.bytes_written = offset
+        return next_index
+
+    # function to write whatever is still queued and close the files (waits for the writer, up to timeout seconds)
+    def close(self, timeout=5.0):
+        self.stopping.set()
+        self.thread.join(timeout)
+
+    # function to get the recorder counters
+    def stats(self):
+        return {"recorded": self.recorded,
+                "written": self.written,
+                "dropped": self.dropped,
+                "pending": len(self.queue),
+                "bytes": self.bytes_written}
+
+
+# class to read a recording back, raises ValueError if the file isn't one
+class Recording:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size:
+            raise ValueError(f"{path} is too short to be a recording")
+        magic, version, self.start_time, self.index_interval = FILE_HEADER.unpack(header)
+        if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+            raise ValueError(f"{path} isn't a version {RECORDING_VERSION} dashboard recording")
+        self.size = os.path.getsize(path)
+        self.index = self.load_index()
+
+    # seek index as an array of (time, offset), read from the .idx file or rebuilt if it is missing or doesn't match the log
+    def load_index(self):
+        try:
+            index = np.fromfile(index_path_for(self.path), dtype=INDEX_DTYPE)
+        except (OSError, ValueError):
+            index = np.empty(0, dtype=INDEX_DTYPE)
+        index = index[index['offset'] < self.size] # entries past a cut off log
+        if len(index) == 0 and self.size > FILE_HEADER.size:
+            print(f"Rebuilding the seek index of {self.path}")
+            entries = []
+            next_index = self.start_time
+            for t, offset, _ in self.scan(FILE_HEADER.size):
+                if t >= next_index:
+                    entries.append((t, offset))
+                    next_index = t + self.index_interval
+            index = np.array(entries, dtype=INDEX_DTYPE)
+        return index
+
+    # function to read (receive time, file offset, datagram) for every record from a file offset on, a block at a time.
+    # stops at the end of the log, or at a record that was cut off half written
+    def scan(self, offset):
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            buffer = b''
+            position = 0
+            while True:
+                block = f.read(READ_BLOCK)
+                if not block:
+                    return
+                buffer = buffer[position:] + block
+                position = 0
+                while position + RECORD.size <= len(buffer):
+                    t, length = RECORD.unpack_from(buffer, position)
+                    end = position + RECORD.size + length
+                    if end > len(buffer):
+                        break
+                    yield t, offset, buffer[position + RECORD.size:end]
+                    offset += end - position
+                    position = end
+
+    # function to get (receive time, datagram) for every datagram from start seconds into the recording on
+    def records(self, start=0.0):
+        t_start = self.start_time + start
+        offset = FILE_HEADER.size
+        if len(self.index):
+            i = int(np.searchsorted(self.index['time'], t_start, side='right')) - 1 # last index entry at or before the start
+            if i >= 0:
+                offset = int(self.index['offset'][i])
+        for t, _, datagram in self.scan(offset):
+            if t >= t_start:
+                yield t, datagram
+
+    # function to count the datagrams and get the time of the last one, reads the whole log
+    def summary(self):
+        count = 0
+        last = self.start_time
+        for t, _, _ in self.scan(FILE_HEADER.size):
+            count += 1
+            last = t
+        return {"datagrams": count, "seconds": last - self.start_time, "bytes": self.size, "index_entries": len(self.index),
+                "started": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.start_time))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show what is in dashboard session recordings")
+    parser.add_argument("files", nargs="+", help="recordings (.drec) to read")
+    args = parser.parse_args()
+    for path in args.files:
+        summary = Recording(path).summary()
+        print(f"{path}: {summary['datagrams']} datagrams over {summary['seconds']:.1f}s, started {summary['started']}, "
+              f"{summary['bytes'] / 1e6:.1f} MB, {summary['index_entries']} index entries")
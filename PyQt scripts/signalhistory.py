@@ -0,0 +1,117 @@
+import time
+
+import numpy as np
+
+# Recent history of every signal the dashboard receives, for trend widgets.
+# Each signal gets a preallocated ring buffer of (receive time, value) pairs, so memory use is fixed per signal
+# (bytes_per_signal) no matter how fast it comes in, and adding a value never allocates. Once a buffer is full the oldest
+# samples are overwritten, so how many seconds a signal keeps depends on its rate, ex: the default 256 kB is 16384 samples,
+# 164 s of a 100 Hz signal.
+# DataReceiver records every value of every datagram into it (when it is given a HistoryStore), not just the latest one
+# per batch, so the trends show the spikes in between frames too.
+
+SAMPLE_BYTES = 16 # float64 time + float64 value
+
+
+# class for the ring buffer of one signal
+class SignalHistory:
+    def __init__(self, capacity):
+        self.times = np.zeros(capacity)
+        self.values = np.zeros(capacity)
+        self.capacity = capacity
+        self.end = 0 # index the next sample goes to
+        self.count = 0 # samples in the buffer (up to capacity)
+
+    # add one sample
+    def append(self, t, value):
+        self.times[self.end] = t
+        self.values[self.end] = value
+        self.end = (self.end + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    # add a block of samples (numpy arrays or lists), only the newest capacity of them are kept
+    def extend(self, times, values):
+        times = np.asarray(times, dtype=np.float64)[-self.capacity:]
+        values = np.asarray(values, dtype=np.float64)[-self.capacity:]
+        n = len(times)
+        first = min(n, self.capacity - self.end) # samples that fit before the buffer wraps
+        self.times[self.end:self.end + first] = times[:first]
+        self.values[self.end:self.end + first] = values[:first]
+        self.times[:n - first] = times[first:]
+        self.values[:n - first] = values[first:]
+        self.end = (self.end + n) % self.capacity
+        self.count = min(self.capacity, self.count + n)
+
+    # function to get the samples in time order, as (times, values). the arrays are copies when the buffer has wrapped,
+    # views into the buffer otherwise, so don't keep them around
+    def samples(self):
+        start = (self.end - self.count) % self.capacity
+        if start + self.count <= self.capacity:
+            return self.times[start:start + self.count], self.values[start:start + self.count]
+        return (np.concatenate((self.times[start:], self.times[:self.end])),
+                np.concatenate((self.values[start:], self.values[:self.end])))
+
+    # function to get the samples between two times (t_start <= t < t_end), plus the last one before t_start so a line
+    # drawn from the samples starts at the left edge
+    def window(self, t_start, t_end):
+        times, values = self.samples()
+        first = max(int(np.searchsorted(times, t_start)) - 1, 0)
+        last = int(np.searchsorted(times, t_end))
+        return times[first:last], values[first:last]
+
+    def latest(self):
+        if self.count == 0:
+            return None
+        i = (self.end - 1) % self.capacity
+        return self.times[i], self.values[i]
+
+
+# class for the history of every signal, the buffers get made the first time a signal comes in
+class HistoryStore:
+    def __init__(self, bytes_per_signal=256 * 1024, names=None):
+        self.capacity = max(2, bytes_per_signal // SAMPLE_BYTES) # samples per signal
+        self.names = None if names is None else set(names) # only keep these signals (None = every signal)
+        self.signals = {} # signal name -> SignalHistory
+
+    # function to add one {signal name: value} packet that came in at time t (time.time() if not given)
+    def record(self, values, t=None):
+        if t is None:
+            t = time.time()
+        for name, value in values.items():
+            history = self.signals.get(name)
+            if history is None:
+                if self.names is not None and name not in self.names:
+                    continue
+                history = self.signals[name] = SignalHistory(self.capacity)
+            history.append(t, value)
+
+    def get(self, name):
+        return self.signals.get(name)
+
+    # function to get the samples of a signal between two times, as (times, values) (both empty if it has no history)
+    def window(self, name, t_start, t_end):
+        history = self.signals.get(name)
+        if history is None:
+            return np.empty(0), np.empty(0)
+        return history.window(t_start, t_end)
+
+    # total memory the buffers take up, in bytes
+    def nbytes(self):
+        return sum(history.times.nbytes + history.values.nbytes for history in self.signals.values())
+
+
+# function to shrink a series down to one (min, max) pair per pixel column, so drawing it costs the same whatever the sample
+# rate is. the times are split into pixels equal slices between t_start and t_end, and the columns with no samples in them
+# are left out. returns (columns, mins, maxs), where columns is the pixel column (0 to pixels - 1) of each pair
+def decimate_minmax(times, values, t_start, t_end, pixels):
+    if len(times) == 0 or pixels <= 0 or t_end <= t_start:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+    edges = t_start + (t_end - t_start) * np.arange(pixels + 1) / pixels
+    bounds = np.searchsorted(times, edges) # samples [bounds[i], bounds[i + 1]) fall in column i
+    starts = bounds[:-1]
+    columns = np.flatnonzero(bounds[1:] > starts)
+    if len(columns) == 0:
+        return columns, np.empty(0), np.empty(0)
+    values = values[:bounds[-1]] # reduceat runs the last slice to the end of the array, stop it at the right edge
+    return columns, np.minimum.reduceat(values, starts[columns]), np.maximum.reduceat(values, starts[columns])
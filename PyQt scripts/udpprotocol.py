@@ -0,0 +1,188 @@
+import json
+import random
+import struct
+import time
+
+# Compact binary UDP wire format shared by the senders (mf4 scripts) and the dashboard's DataReceiver.
+#
+# Every binary datagram starts with the same header:
+#   magic (2 bytes) | version (u8) | packet type (u8) | session id (u32) | sequence number (u32) | timestamp (f64)
+# The sequence number counts every datagram of a session (tables too) and the timestamp is time.time() when it was sent,
+# so the dashboard can measure loss, reordering and latency (see linkstats.py).
+# Table packets map signal ids to names, and are sent at the start of a session (and repeated every so often so a
+# dashboard that starts late still gets them):
+#   header | (signal id (u16) | name length (u8) | utf-8 name) ...
+# Data packets are just packed (signal id, value) records, with float32 or float64 values:
+#   header | (signal id (u16) | value (f32/f64)) ...
+# The magic bytes can never start a JSON message, so the receiver can tell the two formats apart and the old
+# JSON dictionaries ({"signal": value, ...}) still work as a fallback.
+# Subscription packets go the other way, from the dashboard back to the sender, and list the signals the dashboard is
+# showing so the sender only decodes and sends those (same entry layout as the table, the ids are just a count):
+#   header | (index (u16) | name length (u8) | utf-8 name) ...
+
+MAGIC = b'\xd5\xdb'
+VERSION = 1
+
+TYPE_TABLE = 1
+TYPE_DATA_F32 = 2
+TYPE_DATA_F64 = 3
+TYPE_SUBSCRIBE = 4
+
+HEADER = struct.Struct('<2sBBIId')
+STAMP = struct.Struct('<Id') # sequence number and timestamp, the last two header fields
+STAMP_OFFSET = HEADER.size - STAMP.size # senders that encode ahead of time stamp these in as each datagram goes out
+TABLE_ENTRY = struct.Struct('<HB')
+RECORD_FORMATS = {TYPE_DATA_F32: 'Hf', TYPE_DATA_F64: 'Hd'}
+
+MAX_DATAGRAM = 65000 # keep every datagram under the UDP payload limit
+MAX_SESSIONS = 16 # sender sessions a decoder keeps the signal table of, the one heard from longest ago makes room for a new one
+
+
+# class to encode signal values into binary datagrams on the sending side
+class BinaryEncoder:
+    def __init__(self, signal_names, use_float64=False, table_interval=1.0, session_id=None):
+        self.signal_names = list(signal_names)
+        if len(self.signal_names) > 0xFFFF:
+            raise ValueError("Too many signals for the binary format (max 65535).")
+        self.signal_ids = {name: i for i, name in enumerate(self.signal_names)}
+        self.packet_type = TYPE_DATA_F64 if use_float64 else TYPE_DATA_F32
+        self.record_format = RECORD_FORMATS[self.packet_type]
+        self.table_interval = table_interval # seconds between repeats of the signal table, None to only send it once
+        self.session_id = random.getrandbits(32) if session_id is None else session_id
+        self.sequence = 0
+        self.last_table_time = None
+        # most (signal id, value) records that fit in one data packet
+        self.max_records = (MAX_DATAGRAM - HEADER.size) // struct.calcsize('<' + self.record_format)
+
+    def header(self, packet_type, timestamp):
+        header = HEADER.pack(MAGIC, VERSION, packet_type, self.session_id, self.sequence & 0xFFFFFFFF, timestamp)
+        self.sequence += 1
+        return header
+
+    # bodies of the signal table packets, without headers (split over several datagrams if there are a lot of signals)
+    def table_bodies(self):
+        return name_entries(self.signal_names)
+
+    # signal table packets
+    def table_packets(self, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        packets = [self.header(TYPE_TABLE, timestamp) + body for body in self.table_bodies()]
+        self.last_table_time = time.monotonic()
+        return packets
+
+    # data packet from already known signal ids and values
+    def encode_ids(self, ids, values, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        records = [item for pair in zip(ids, values) for item in pair]
+        return self.header(self.packet_type, timestamp) + struct.pack('<' + self.record_format * len(ids), *records)
+
+    # data packet from a {signal_name: value} dictionary
+    def encode(self, values, timestamp=None):
+        ids = [self.signal_ids[name] for name in values]
+        return self.encode_ids(ids, [float(value) for value in values.values()], timestamp)
+
+    # True when the signal table should be (re)sent
+    def table_due(self):
+        return self.last_table_time is None or (
+            self.table_interval is not None and time.monotonic() - self.last_table_time >= self.table_interval)
+
+    # all the datagrams to send for one set of values, with the signal table in front when it is due
+    def packets(self, values, timestamp=None):
+        packets = []
+        if self.table_due():
+            packets.extend(self.table_packets(timestamp))
+        packets.append(self.encode(values, timestamp))
+        return packets
+
+
+# pack a list of signal names into table entries, split over several bodies if they don't fit in one datagram
+def name_entries(names):
+    bodies = []
+    body = b''
+    for signal_id, name in enumerate(names):
+        encoded = name.encode()[:255]
+        entry = TABLE_ENTRY.pack(signal_id, len(encoded)) + encoded
+        if HEADER.size + len(body) + len(entry) > MAX_DATAGRAM:
+            bodies.append(body)
+            body = b''
+        body += entry
+    bodies.append(body)
+    return bodies
+
+
+# unpack table entries, returns {signal id: name}
+def parse_entries(body):
+    entries = {}
+    offset = 0
+    while offset < len(body):
+        signal_id, length = TABLE_ENTRY.unpack_from(body, offset)
+        offset += TABLE_ENTRY.size
+        entries[signal_id] = bytes(body[offset:offset + length]).decode()
+        offset += length
+    return entries
+
+
+# subscription packet from the dashboard to the sender with the signal names it is showing
+# (only the first datagram's worth of names, a dashboard never shows anywhere near that many)
+def subscription_packet(names):
+    return HEADER.pack(MAGIC, VERSION, TYPE_SUBSCRIBE, 0, 0, time.time()) + name_entries(names)[0]
+
+
+# signal names in a subscription packet, None if the datagram isn't one
+def parse_subscription(datagram):
+    if datagram[:2] != MAGIC or len(datagram) < HEADER.size:
+        return None
+    magic, version, packet_type, session_id, sequence, timestamp = HEADER.unpack_from(datagram)
+    if version != VERSION or packet_type != TYPE_SUBSCRIBE:
+        return None
+    return list(parse_entries(memoryview(datagram)[HEADER.size:]).values())
+
+
+# class to decode incoming datagrams on the dashboard side, handles both the binary format and the JSON fallback
+# every sender session keeps its own signal table, so several senders can share the dashboard's port at the same time
+class PacketDecoder:
+    def __init__(self):
+        self.sessions = {} # session id -> {signal id: name}, the signal tables of the last MAX_SESSIONS sender sessions
+        self.last_sequence = {} # session id -> sequence number of its last data packet
+        self.last_timestamp = {} # session id -> send timestamp of its last data packet
+        self.last_stamp = None # (session id, sequence number, send timestamp) of the last datagram decoded, None for JSON
+        self.unknown_session = 0 # data packets dropped because their signal table hasn't arrived yet
+
+    # decode a datagram, returns a {signal_name: float} dictionary (empty for table packets)
+    def decode(self, datagram):
+        self.last_stamp = None
+        if datagram[:2] != MAGIC:
+            return {key: float(value) for key, value in json.loads(datagram.decode()).items()}
+
+        magic, version, packet_type, session_id, sequence, timestamp = HEADER.unpack_from(datagram)
+        if version != VERSION:
+            raise ValueError(f"Unsupported binary packet version {version}")
+        body = memoryview(datagram)[HEADER.size:]
+
+        if packet_type == TYPE_TABLE:
+            # the sessions are kept in the order their tables last came in (live senders repeat theirs), so a sender that
+            # restarted stops taking up room once MAX_SESSIONS newer sessions have been heard from
+            names = self.sessions.pop(session_id, {})
+            names.update(parse_entries(body))
+            self.sessions[session_id] = names
+            if len(self.sessions) > MAX_SESSIONS:
+                oldest = next(iter(self.sessions))
+                del self.sessions[oldest]
+                self.last_sequence.pop(oldest, None)
+                self.last_timestamp.pop(oldest, None)
+            self.last_stamp = (session_id, sequence, timestamp)
+            return {}
+
+        if packet_type not in RECORD_FORMATS:
+            raise ValueError(f"Unknown binary packet type {packet_type}")
+        names = self.sessions.get(session_id)
+        if names is None:
+            self.unknown_session += 1
+            return {}
+
+        self.last_sequence[session_id] = sequence
+        self.last_timestamp[session_id] = timestamp
+        self.last_stamp = (session_id, sequence, timestamp)
+        return {names[signal_id]: value
+                for signal_id, value in struct.iter_unpack('<' + RECORD_FORMATS[packet_type], body)
+                if signal_id in names}
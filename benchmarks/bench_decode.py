@@ -0,0 +1,75 @@
+import argparse
+import os
+
+from benchcommon import DATA_DIR, timed, write_results
+from make_test_log import make_test_log
+
+# Frames/sec of the frametosignalmf4.py decode path, stage by stage:
+#   read:       load_frames(), pulling the frame columns out of the frame-based .mf4 with asammdf
+#   decode:     FrameDecoder.decode(), the bulk numpy decoder (candecoder.py)
+#   per_frame:  decode_frames_per_frame(), the old one-frame-at-a-time cantools loop, on a sample of the frames
+#   convert:    convert_chunked(), the whole conversion including writing the signal-based .mf4
+#
+# python bench_decode.py --duration 60 --bus-load 0.6
+
+
+def bench_decode(mf4_path, dbc_path, group=0, repeat=3, per_frame_sample=20_000, chunk_size=1_000_000, compact=False):
+    import cantools
+    from asammdf import MDF
+
+    from candecoder import load_decoder
+    from frametosignalmf4 import load_frames, group_record_count, decode_frames_per_frame, convert_chunked
+
+    mdf = MDF(mf4_path)
+    frames = group_record_count(mdf, group)
+    results = {'frames': frames, 'mf4_bytes': os.path.getsize(mf4_path)}
+
+    best, median, (ids, dlcs, data_bytes, timestamps) = timed(lambda: load_frames(mdf, group), repeat)
+    results['read'] = {'best_s': best, 'median_s': median, 'frames_per_s': frames / best}
+
+    decoder = load_decoder(dbc_path)
+    best, median, (signal_times, _) = timed(lambda: decoder.decode(ids, dlcs, data_bytes, timestamps), repeat)
+    samples = sum(len(times) for times in signal_times.values())
+    results['decode'] = {'best_s': best, 'median_s': median, 'frames_per_s': frames / best,
+                         'samples': samples, 'samples_per_s': samples / best, 'signals': len(signal_times)}
+
+    if per_frame_sample:
+        db = cantools.database.load_file(dbc_path)
+        n = min(per_frame_sample, frames)
+        best, median, _ = timed(lambda: decode_frames_per_frame(db, ids[:n], dlcs[:n], data_bytes[:n], timestamps[:n]), 1)
+        results['per_frame'] = {'frames': n, 'best_s': best, 'frames_per_s': n / best}
+        results['decode']['speedup_vs_per_frame'] = results['decode']['frames_per_s'] / results['per_frame']['frames_per_s']
+
+    os.makedirs(DATA_DIR, exist_ok=True) # only made by make_test_log, which doesn't run with --mf4
+    output_path = os.path.join(DATA_DIR, 'bench_convert_output.mf4')
+    best, median, _ = timed(lambda: convert_chunked(mdf, decoder, group, output_path, chunk_size, show_progress=False, compact=compact), repeat)
+    results['convert'] = {'best_s': best, 'median_s': median, 'frames_per_s': frames / best,
+                          'chunk_size': chunk_size, 'compact': compact, 'output_bytes': os.path.getsize(output_path)}
+    os.remove(output_path)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the frame decode and conversion path")
+    parser.add_argument("--mf4", default=None, help="frame-based .mf4 to decode (default: generate a synthetic one)")
+    parser.add_argument("--dbc", default=None, help=".dbc for --mf4")
+    parser.add_argument("--group", type=int, default=0, help="CAN group in --mf4")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of synthetic log")
+    parser.add_argument("--bus-load", type=float, default=0.5, help="bus load of the synthetic log (0-1)")
+    parser.add_argument("--bitrate", type=int, default=500_000, help="CAN bitrate of the synthetic log")
+    parser.add_argument("--messages", type=int, default=40, help="messages in the synthetic dbc")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each stage, the fastest one counts")
+    parser.add_argument("--compact", action="store_true", help="convert with the compact dtypes")
+    parser.add_argument("--output", default=None, help="results .json path (default: results/decode-<commit>-<date>.json)")
+    args = parser.parse_args()
+
+    if args.mf4 is None:
+        mf4_path, dbc_path = make_test_log(args.messages, args.duration, args.bitrate, args.bus_load)
+    else:
+        mf4_path, dbc_path = args.mf4, args.dbc
+    results = bench_decode(mf4_path, dbc_path, args.group, args.repeat, compact=args.compact)
+    results['log'] = {'mf4': os.path.basename(mf4_path), 'dbc': os.path.basename(dbc_path)}
+    for stage in ('read', 'decode', 'per_frame', 'convert'):
+        if stage in results:
+            print(f"{stage:>10}: {results[stage]['frames_per_s']:>14,.0f} frames/s")
+    write_results('decode', results, args.output)
@@ -0,0 +1,136 @@
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from benchcommon import qt_app, write_results
+
+# Paint time of the dashboard widgets (Gauge, Tickbar, Light and Trend from dashboard_templates.py), on Qt's offscreen platform.
+# Every widget is shown at the size AddToWindow gives it, gets a new value and is repainted synchronously (repaint()),
+# over and over. "warm" is the normal case where the cached background is reused, "cold" throws the cache away before
+# every paint (what a resize or config change costs). The Trend draws a history of a 1 kHz signal, which is cut down to one
+# min/max pair per pixel before drawing, so its paint time should not move with the sample rate.
+# The "dashboard" case is a whole 2x3 grid of instruments that all get a new value every frame, drawn both ways the
+# dashboard can draw them: "widgets" (every instrument paints itself) and "canvas" (one DashboardCanvas draws them all
+# in one paint pass). There a frame is timed from the new values to Qt having flushed the repaints.
+#
+# python bench_paint.py --paints 3000
+
+
+# the widgets to measure: name -> (function that makes one, (width, height), range of values to cycle through)
+def widget_cases():
+    from dashboard_templates import Gauge, Tickbar, Light
+
+    return {'Gauge': (lambda: Gauge(0, 8000, 'RPM', 'RPM'), (250, 250), (0, 8000)),
+            'Tickbar': (lambda: Tickbar(0, 100, 20, 'Throttle', 'Throttle'), (250, 60), (0, 100)),
+            'Light': (lambda: Light('Warning', 'Warning'), (100, 100), (0, 1)),
+            'Trend': (trend_with_history, (250, 120), (0, 8000))}
+
+
+# a Trend showing 20 s of a 1 kHz signal, with a history big enough to hold all of it (the default 256 kB per signal
+# only keeps about 16 s at 1 kHz)
+def trend_with_history(rate=1000, seconds=20):
+    from dashboard_templates import Trend
+    from signalhistory import HistoryStore, SignalHistory, SAMPLE_BYTES
+
+    history = HistoryStore(bytes_per_signal=rate * seconds * SAMPLE_BYTES)
+    samples = history.signals['RPM'] = SignalHistory(history.capacity)
+    times = time.time() - seconds + np.arange(seconds * rate) / rate
+    samples.extend(times, 4000 + 3000 * np.sin(times) + np.random.default_rng(0).normal(0, 300, len(times)))
+    widget = Trend(0, 8000, seconds, 'RPM', 'RPM')
+    widget.history = history
+    return widget
+
+
+# time paints repaints of one widget, returns the paint time stats in microseconds
+def bench_widget(widget, values, paints=2000, cold=False):
+    app = qt_app()
+    durations = np.empty(paints)
+    for i in range(paints):
+        widget.set_value(values[i % len(values)], widget.signalname)
+        if cold:
+            widget.background = None
+        start = time.perf_counter()
+        widget.repaint()
+        durations[i] = time.perf_counter() - start
+        if i % 100 == 0:
+            app.processEvents() # let the scheduler/posted events through like the real event loop would
+    durations *= 1e6
+    return {'paints': paints,
+            'mean_us': float(durations.mean()),
+            'median_us': float(np.median(durations)),
+            'p95_us': float(np.percentile(durations, 95)),
+            'p99_us': float(np.percentile(durations, 99)),
+            'max_us': float(durations.max()),
+            'paints_per_s': float(1e6 / statistics.median(durations))}
+
+
+# time frames of a 2x3 grid of instruments where every instrument changes every frame, renderer is "widgets" or "canvas"
+def bench_dashboard(renderer, frames=500):
+    from PyQt6.QtWidgets import QWidget, QGridLayout
+    from dashboard_templates import DashboardCanvas
+
+    app = qt_app()
+    host = QWidget()
+    host.resize(1280, 720)
+    layout = QGridLayout(host)
+    canvas = DashboardCanvas(host) if renderer == "canvas" else None
+    cases = [widget_cases()[name] for name in ('Gauge', 'Tickbar', 'Light')]
+    instruments = []
+    for k in range(6):
+        make, size, value_range = cases[k % len(cases)]
+        widget = make()
+        widget.setFixedSize(*size)
+        if canvas is not None:
+            canvas.add(widget)
+        layout.addWidget(widget, k // 3, k % 3)
+        instruments.append((widget, np.linspace(*value_range, 97).tolist()))
+    host.show()
+    app.processEvents()
+
+    durations = np.empty(frames)
+    for i in range(frames):
+        start = time.perf_counter()
+        for widget, values in instruments:
+            widget.set_value(values[i % len(values)], widget.signalname)
+        app.processEvents() # the queued repaints get flushed here, one paint pass per widget (or one for the canvas)
+        durations[i] = time.perf_counter() - start
+    host.close()
+    durations *= 1e6
+    return {'frames': frames,
+            'instruments': len(instruments),
+            'mean_us': float(durations.mean()),
+            'median_us': float(np.median(durations)),
+            'p95_us': float(np.percentile(durations, 95)),
+            'frames_per_s': float(1e6 / statistics.median(durations))}
+
+
+def bench_paint(paints=2000):
+    qt_app()
+    results = {}
+    for name, (make, size, (low, high)) in widget_cases().items():
+        widget = make()
+        widget.setFixedSize(*size)
+        widget.show()
+        qt_app().processEvents()
+        values = np.linspace(low, high, 97).tolist() # odd count so consecutive paints always show different values
+        results[name] = {'size': list(size),
+                         'warm': bench_widget(widget, values, paints),
+                         'cold': bench_widget(widget, values, max(paints // 10, 1), cold=True)}
+        widget.close()
+        print(f"{name:>8}: warm median {results[name]['warm']['median_us']:8.1f} us, "
+              f"cold median {results[name]['cold']['median_us']:8.1f} us")
+
+    results['dashboard'] = {renderer: bench_dashboard(renderer, max(paints // 4, 1)) for renderer in ('widgets', 'canvas')}
+    for renderer, result in results['dashboard'].items():
+        print(f"dashboard ({renderer}): median {result['median_us']:8.1f} us per frame of {result['instruments']} instruments")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the paint time of the dashboard widgets")
+    parser.add_argument("--paints", type=int, default=2000, help="repaints per widget (the cold runs do a tenth of this)")
+    parser.add_argument("--output", default=None, help="results .json path (default: results/paint-<commit>-<date>.json)")
+    args = parser.parse_args()
+    write_results('paint', bench_paint(args.paints), args.output)
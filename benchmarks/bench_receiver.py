@@ -0,0 +1,142 @@
+import argparse
+import os
+import socket
+import threading
+import time
+
+import numpy as np
+
+from benchcommon import DATA_DIR, qt_app, write_results
+
+# Datagrams/sec and latency of the dashboard's DataReceiver over loopback.
+# A replay (replayengine.Replay, binary format) sends datagrams at a fixed rate (or as fast as it can) to 127.0.0.1:6000
+# and a DataReceiver in this process takes them in, the same way the dashboard does. For every rate it reports how many
+# datagrams got through, how many were lost or dropped, and the latency from the sender to:
+#   network:  the receiver reading the datagram off the socket
+#   delivery: the GUI thread handing the values on to the widgets (batch_received / data_received)
+# With --record every datagram also goes to a SessionRecorder (sessionrecorder.py), to see what recording a session costs.
+# The dashboard must not be running (the receiver needs port 6000).
+#
+# python bench_receiver.py --rates 1000 5000 20000 max --duration 3 --record
+
+
+# LinkStats that also measures sender -> GUI thread delivery (LinkStats.datagram is called from DataReceiver.deliver),
+# and counts the datagrams that had values in them (signal tables don't)
+def delivery_stats():
+    from linkstats import LinkStats, LatencyHistogram
+
+    class DeliveryStats(LinkStats):
+        def __init__(self):
+            super().__init__()
+            self.delivery = LatencyHistogram()
+            self.data_datagrams = 0
+
+        def datagram(self, values, stamp):
+            super().datagram(values, stamp)
+            if values:
+                self.data_datagrams += 1
+            if stamp is not None and values:
+                self.delivery.add(time.time() - stamp[2])
+
+    return DeliveryStats()
+
+
+# one run: rate datagrams/s (None = as fast as possible) with signals_per_datagram values each, for duration seconds
+def bench_rate(rate, duration=3.0, signals_per_datagram=8, threaded=True, batched=True, max_datagrams=200_000, record=False):
+    from PyQt6.QtCore import QEventLoop, QTimer
+    from dashboard_templates import DataReceiver
+    from replayengine import Replay
+    from sessionrecorder import SessionRecorder, index_path_for
+
+    qt_app()
+    link_stats = delivery_stats()
+    recorder = SessionRecorder(os.path.join(DATA_DIR, 'bench_recording.drec')) if record else None
+    receiver = DataReceiver(batched=batched, threaded=threaded, link_stats=link_stats, recorder=recorder)
+    receiver.subscription_timer.stop()
+
+    count = max_datagrams if rate is None else int(rate * duration)
+    names = [f"S{i}" for i in range(signals_per_datagram)]
+    # log times only set the pace when there is a rate, but they still decide when the signal table gets repeated (every
+    # table_interval of log time), so the max run gets 10 us steps and only sends a table every 100000 datagrams
+    times = np.repeat(np.arange(count) / (rate or 100_000.0), signals_per_datagram)
+    ids = np.tile(np.arange(signals_per_datagram, dtype=np.int64), count)
+    values = np.random.default_rng(0).normal(size=len(times))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    replay = Replay(names, times, ids, values, sock, ('127.0.0.1', 6000), speed=None if rate is None else 1.0)
+    replay.full = None
+    list(replay.sections(0)) # encode before the clock starts, like run() does
+
+    sender = threading.Thread(target=replay.send_all, daemon=True)
+    loop = QEventLoop()
+    last = {'received': -1, 'time': time.monotonic()}
+
+    # stop once the sender is done and nothing new has come in for a little while
+    def check_done():
+        if receiver.received != last['received']:
+            last['received'], last['time'] = receiver.received, time.monotonic()
+        elif not sender.is_alive() and time.monotonic() - last['time'] > 0.3:
+            loop.quit()
+
+    timer = QTimer()
+    timer.timeout.connect(check_done)
+    timer.start(50)
+    start = time.perf_counter()
+    sender.start()
+    loop.exec()
+    elapsed = time.perf_counter() - start - 0.3
+    timer.stop()
+    receiver.close()
+    sock.close()
+    if recorder is not None:
+        recorder.close()
+        os.remove(recorder.path)
+        os.remove(index_path_for(recorder.path))
+
+    stats = receiver.stats()
+    loss = link_stats.loss()
+    network = link_stats.latency.get(names[0], {}).get('network')
+    return {'target_datagrams_per_s': rate,
+            'signals_per_datagram': signals_per_datagram,
+            'threaded': threaded,
+            'batched': batched,
+            'sent': replay.datagrams_sent,
+            'received': stats['received'],
+            'parsed': stats['parsed'],
+            'failed': stats['failed'],
+            'dropped': stats['dropped'],
+            'lost': loss['lost'],
+            'reordered': loss['reordered'],
+            'loss_percent': round(100 * (replay.datagrams_sent - stats['received']) / max(replay.datagrams_sent, 1), 3),
+            'data_received': link_stats.data_datagrams,
+            'datagrams_per_s': link_stats.data_datagrams / elapsed,
+            'values_per_s': link_stats.data_datagrams * signals_per_datagram / elapsed,
+            'latency_network': network.summary() if network is not None else None,
+            'latency_delivery': link_stats.delivery.summary(),
+            'recorder': recorder.stats() if recorder is not None else None}
+
+
+def bench_receiver(rates=(1000, 5000, 20000, None), duration=3.0, signals_per_datagram=8, modes=((True, True), (False, True)),
+                   record=False):
+    runs = []
+    for threaded, batched in modes:
+        for rate in rates:
+            result = bench_rate(rate, duration, signals_per_datagram, threaded, batched, record=record)
+            latency = result['latency_delivery']
+            print(f"{'threaded' if threaded else 'qt socket':>9} {'max' if rate is None else rate:>6} datagrams/s target: "
+                  f"{result['datagrams_per_s']:>10,.0f} received/s, {result['loss_percent']}% lost, "
+                  f"delivery latency mean {latency['mean_ms']:.2f} ms p95 <= {latency['p95_ms']} ms")
+            runs.append(result)
+    return {'runs': runs}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard's DataReceiver over loopback")
+    parser.add_argument("--rates", nargs="+", default=["1000", "5000", "20000", "max"], help="datagrams/s to send, 'max' for as fast as possible")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per rate")
+    parser.add_argument("--signals", type=int, default=8, help="signal values per datagram")
+    parser.add_argument("--record", action="store_true", help="record every datagram with a SessionRecorder while receiving")
+    parser.add_argument("--output", default=None, help="results .json path (default: results/receiver-<commit>-<date>.json)")
+    args = parser.parse_args()
+
+    rates = [None if rate == "max" else int(rate) for rate in args.rates]
+    write_results('receiver', bench_receiver(rates, args.duration, args.signals, record=args.record), args.output)
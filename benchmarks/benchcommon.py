@@ -0,0 +1,91 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# Shared bits of the benchmark scripts: the import paths to the mf4 and PyQt scripts, a timer, and the results file format.
+# Every benchmark returns a plain dictionary of numbers, and write_results() saves it as JSON together with the git commit,
+# machine and library versions, so the files from two commits can be put side by side (see run_benchmarks.py --compare).
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+DATA_DIR = os.path.join(BENCH_DIR, 'data') # generated logs and dbcs (not checked in)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+sys.path.append(os.path.join(REPO_DIR, 'mf4 scripts'))
+sys.path.append(os.path.join(REPO_DIR, 'PyQt scripts'))
+
+
+# run function repeat times, returns (seconds of the fastest run, seconds of the median run, result of the last run)
+def timed(function, repeat=3):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times), result
+
+
+# git commit the benchmarks ran on (with a + if there are uncommitted changes), None outside of a git checkout
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+        return commit + ('+' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# where the results were measured, so numbers from different machines don't get compared by mistake
+def environment():
+    import numpy as np
+
+    info = {'commit': git_commit(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'numpy': np.__version__}
+    for module in ('asammdf', 'cantools'):
+        try:
+            info[module] = __import__(module).__version__
+        except ImportError:
+            info[module] = None
+    try:
+        from PyQt6.QtCore import QT_VERSION_STR
+        info['qt'] = QT_VERSION_STR
+    except ImportError:
+        info['qt'] = None
+    return info
+
+
+# save benchmark results as JSON, returns the path. the default path is results/<name>-<commit>-<date>.json
+def write_results(name, results, path=None):
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        commit = (git_commit() or 'nogit').replace('+', '-dirty')
+        path = os.path.join(RESULTS_DIR, f"{name}-{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump({'benchmark': name, 'environment': environment(), 'results': results}, f, indent=1)
+    print(f"Wrote {path}")
+    return path
+
+
+qapp = None # kept here so the QApplication doesn't get garbage collected between benchmarks
+
+
+# QApplication for the Qt benchmarks, on the offscreen platform unless another one was asked for (runs without a display)
+def qt_app():
+    global qapp
+    if qapp is None:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt6.QtWidgets import QApplication
+
+        qapp = QApplication.instance() or QApplication([])
+    return qapp
@@ -0,0 +1,130 @@
+import argparse
+import os
+
+import numpy as np
+
+from benchcommon import DATA_DIR
+
+# Synthetic test data for the benchmarks: a .dbc and a frame-based .mf4 laid out like the real CAN logs
+# (CAN_DataFrame.ID / .DLC / .DataBytes channels with a 't' master channel, see frametosignalmf4.load_frames).
+# The bus load sets how many frames per second are on the bus, the same way a real bus is loaded:
+# frames/s = bus_load * bitrate / bits per frame.
+#
+# python make_test_log.py --duration 60 --bitrate 500000 --bus-load 0.6 --messages 40
+
+FRAME_BITS = 125 # bits on the wire for a standard 8 byte CAN frame, including bit stuffing (about 150 for extended IDs)
+CYCLE_TIMES = [0.01, 0.02, 0.05, 0.1, 0.2, 1.0] # seconds, the usual cyclic message rates
+CYCLE_WEIGHTS = [0.15, 0.2, 0.25, 0.25, 0.1, 0.05]
+MUX_VALUES = [0, 1, 2]
+
+
+# frame id of message k, every third message has an extended id
+def frame_id(k):
+    return 0x18FF0000 + k if k % 3 == 2 else 0x100 + k
+
+
+# dbc text with message_count 8 byte messages. most messages have 7 signals covering the usual layouts (scaled,
+# signed, big endian, single bit flags, a choice table); every fourth one is multiplexed instead
+def make_dbc(message_count=40):
+    lines = ['VERSION ""', '', 'NS_ :', '', 'BS_:', '', 'BU_: BENCH', '']
+    values = []
+    for k in range(message_count):
+        can_id = frame_id(k)
+        dbc_id = can_id | 0x80000000 if can_id > 0x7FF else can_id # extended ids have the top bit set in a dbc
+        if k % 4 == 3:
+            lines += [f'BO_ {dbc_id} BenchMux{k}: 8 BENCH',
+                      f' SG_ M{k}_Mux M : 0|8@1+ (1,0) [0|255] "" BENCH',
+                      f' SG_ M{k}_Current m0 : 8|16@1- (0.01,0) [-327.68|327.67] "A" BENCH',
+                      f' SG_ M{k}_Voltage m1 : 8|16@1+ (0.001,0) [0|65.535] "V" BENCH',
+                      f' SG_ M{k}_Status m2 : 8|8@1+ (1,0) [0|255] "" BENCH',
+                      f' SG_ M{k}_Counter : 56|8@1+ (1,0) [0|255] "" BENCH',
+                      '']
+        else:
+            lines += [f'BO_ {dbc_id} BenchMsg{k}: 8 BENCH',
+                      f' SG_ M{k}_Speed : 0|16@1+ (0.01,0) [0|655.35] "km/h" BENCH',
+                      f' SG_ M{k}_Temp : 16|8@1- (1,-40) [-168|87] "C" BENCH',
+                      f' SG_ M{k}_Counter : 24|4@1+ (1,0) [0|15] "" BENCH',
+                      f' SG_ M{k}_Mode : 28|4@1+ (1,0) [0|15] "" BENCH',
+                      f' SG_ M{k}_Pressure : 39|12@0+ (0.5,0) [0|2047.5] "kPa" BENCH',
+                      f' SG_ M{k}_Flag : 40|1@1+ (1,0) [0|1] "" BENCH',
+                      f' SG_ M{k}_Torque : 48|16@1- (0.1,0) [-3276.8|3276.7] "Nm" BENCH',
+                      '']
+            values.append(f'VAL_ {dbc_id} M{k}_Mode 0 "Off" 1 "Idle" 2 "Run" 3 "Fault" ;')
+    return '\n'.join(lines + values) + '\n'
+
+
+# frame arrays (ids, dlcs, data_bytes, timestamps) for duration seconds of a bus at the given load, sorted by time.
+# the data bytes drift like real signals do (a random walk per byte) instead of being pure noise
+def make_frames(message_count=40, duration=60.0, bitrate=500_000, bus_load=0.5, seed=0):
+    rng = np.random.default_rng(seed)
+    cycle_times = rng.choice(CYCLE_TIMES, message_count, p=CYCLE_WEIGHTS)
+    # speed the cycle times up (or slow them down) so the frames add up to the bus load asked for
+    target_rate = bus_load * bitrate / FRAME_BITS
+    cycle_times = cycle_times * (np.sum(1 / cycle_times) / target_rate)
+
+    ids, times, data = [], [], []
+    for k, cycle_time in enumerate(cycle_times):
+        count = int(duration / cycle_time)
+        if count == 0:
+            continue
+        start = rng.uniform(0, cycle_time)
+        times.append(start + np.arange(count) * cycle_time + rng.normal(0, cycle_time * 0.01, count)) # 1% jitter
+        ids.append(np.full(count, frame_id(k), dtype=np.uint32))
+        steps = rng.integers(-2, 3, (count, 8))
+        steps[0] = rng.integers(0, 256, 8)
+        message_data = (np.cumsum(steps, axis=0) % 256).astype(np.uint8)
+        if k % 4 == 3:
+            message_data[:, 0] = rng.choice(MUX_VALUES, count)
+        data.append(message_data)
+
+    times = np.concatenate(times)
+    order = np.argsort(times, kind='stable')
+    times = np.clip(times[order], 0, None)
+    ids = np.concatenate(ids)[order]
+    data = np.concatenate(data)[order]
+    dlcs = np.full(len(ids), 8, dtype=np.uint8)
+    return ids, dlcs, data, times
+
+
+# write the frames as a frame-based mf4 (one CAN group, group 0)
+def write_frame_mf4(path, ids, dlcs, data_bytes, timestamps):
+    from asammdf import MDF, Signal
+
+    mdf = MDF()
+    mdf.append([Signal(ids, timestamps, name='CAN_DataFrame.ID'),
+                Signal(dlcs, timestamps, name='CAN_DataFrame.DLC'),
+                Signal(data_bytes, timestamps, name='CAN_DataFrame.DataBytes')], common_timebase=True)
+    mdf.groups[0].channels[0].name = 't' # master channel name the converter reads the timestamps from
+    mdf.save(path, overwrite=True)
+    return path
+
+
+# make a matching .dbc and frame-based .mf4, returns (mf4 path, dbc path). files that already exist with the same settings
+# are reused, so running the benchmarks again doesn't regenerate them
+def make_test_log(message_count=40, duration=60.0, bitrate=500_000, bus_load=0.5, seed=0, output_dir=DATA_DIR):
+    os.makedirs(output_dir, exist_ok=True)
+    name = f"bench_{message_count}msg_{duration:g}s_{bitrate // 1000}k_{round(bus_load * 100)}pct_seed{seed}"
+    mf4_path = os.path.join(output_dir, f"{name}.mf4")
+    dbc_path = os.path.join(output_dir, f"bench_{message_count}msg.dbc")
+
+    dbc_text = make_dbc(message_count)
+    if not os.path.exists(dbc_path) or open(dbc_path).read() != dbc_text:
+        with open(dbc_path, 'w') as f:
+            f.write(dbc_text)
+    if not os.path.exists(mf4_path):
+        frames = make_frames(message_count, duration, bitrate, bus_load, seed)
+        write_frame_mf4(mf4_path, *frames)
+        print(f"Wrote {mf4_path} ({len(frames[0])} frames, {len(frames[0]) / duration:,.0f} frames/s)")
+    return mf4_path, dbc_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic .dbc and frame-based .mf4 for the benchmarks")
+    parser.add_argument("--messages", type=int, default=40, help="number of messages in the dbc")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of log to generate")
+    parser.add_argument("--bitrate", type=int, default=500_000, help="CAN bitrate in bits/s")
+    parser.add_argument("--bus-load", type=float, default=0.5, help="fraction of the bus that is busy (0-1)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed, the same seed gives the same log")
+    parser.add_argument("--output-dir", default=DATA_DIR, help="folder to write the .dbc and .mf4 to")
+    args = parser.parse_args()
+    make_test_log(args.messages, args.duration, args.bitrate, args.bus_load, args.seed, args.output_dir)
@@ -0,0 +1,95 @@
+import argparse
+import json
+
+from benchcommon import write_results
+from make_test_log import make_test_log
+
+# Runs the whole benchmark suite (decode, receiver, paint) headless and writes one results file for the commit.
+# With --compare it also lines the headline numbers up against an older results file and flags anything that got
+# more than --threshold percent worse, ex:
+#
+# python run_benchmarks.py --compare results/all-1a2b3c4-20250101-120000.json
+
+# headline numbers and which way is better (True = higher is better)
+HEADLINES = {'frames_per_s': True, 'datagrams_per_s': True, 'paints_per_s': True, 'loss_percent': False,
+             'median_us': False, 'p95_us': False, 'mean_ms': False}
+
+
+def run_all(duration=60.0, bus_load=0.5, receiver_duration=3.0, paints=2000, skip=()):
+    results = {}
+    if 'decode' not in skip:
+        from bench_decode import bench_decode
+
+        mf4_path, dbc_path = make_test_log(duration=duration, bus_load=bus_load)
+        print("--- decode ---")
+        results['decode'] = bench_decode(mf4_path, dbc_path)
+    if 'receiver' not in skip:
+        from bench_receiver import bench_receiver
+
+        print("--- receiver ---")
+        results['receiver'] = bench_receiver(duration=receiver_duration)
+    if 'paint' not in skip:
+        from bench_paint import bench_paint
+
+        print("--- paint ---")
+        results['paint'] = bench_paint(paints)
+    return results
+
+
+# every number in a results tree, as {"path/to/value": number}. runs in a list are named by their settings
+def flatten(tree, prefix=''):
+    flat = {}
+    if isinstance(tree, dict):
+        items = tree.items()
+    elif isinstance(tree, list):
+        items = ((f"{'threaded' if item.get('threaded') else 'qt'}@{item.get('target_datagrams_per_s') or 'max'}"
+                  if isinstance(item, dict) and 'target_datagrams_per_s' in item else str(i), item) for i, item in enumerate(tree))
+    else:
+        return {prefix: tree} if isinstance(tree, (int, float)) and not isinstance(tree, bool) else {}
+    for key, value in items:
+        flat.update(flatten(value, f"{prefix}/{key}" if prefix else str(key)))
+    return flat
+
+
+# print the headline numbers of two results files side by side, returns the list of regressions
+def compare(old, new, threshold=10.0):
+    old_values = flatten(old['results'])
+    new_values = flatten(new['results'])
+    print(f"comparing {old['environment'].get('commit')} -> {new['environment'].get('commit')}")
+    if old['environment'].get('platform') != new['environment'].get('platform'):
+        print("warning: the two results files are from different machines")
+    regressions = []
+    for path, value in new_values.items():
+        higher_is_better = HEADLINES.get(path.rsplit('/', 1)[-1])
+        if higher_is_better is None or path not in old_values or not old_values[path]:
+            continue
+        change = 100 * (value - old_values[path]) / abs(old_values[path])
+        worse = -change if higher_is_better else change
+        flag = "  <-- worse" if worse > threshold else ""
+        if flag:
+            regressions.append(path)
+        print(f"{path:<60} {old_values[path]:>14.4g} {value:>14.4g} {change:>+8.1f}%{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the headless benchmark suite")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of synthetic CAN log for the decode benchmark")
+    parser.add_argument("--bus-load", type=float, default=0.5, help="bus load of the synthetic log (0-1)")
+    parser.add_argument("--receiver-duration", type=float, default=3.0, help="seconds per rate for the receiver benchmark")
+    parser.add_argument("--paints", type=int, default=2000, help="repaints per widget for the paint benchmark")
+    parser.add_argument("--skip", nargs="+", default=[], choices=["decode", "receiver", "paint"], help="benchmarks to leave out")
+    parser.add_argument("--output", default=None, help="results .json path (default: results/all-<commit>-<date>.json)")
+    parser.add_argument("--compare", default=None, help="older results .json to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent worse that counts as a regression")
+    args = parser.parse_args()
+
+    path = write_results('all', run_all(args.duration, args.bus_load, args.receiver_duration, args.paints, args.skip), args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        with open(path) as f:
+            new = json.load(f)
+        regressions = compare(old, new, args.threshold)
+        print(f"{len(regressions)} regression(s) over {args.threshold}%")
+        raise SystemExit(1 if regressions else 0)
@@ -0,0 +1,175 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from asammdf import MDF
+
+from candecoder import load_decoder
+from frametosignalmf4 import convert_chunked, group_record_count
+
+# Batch version of frametosignalmf4.py, converts a whole day's worth of frame-based .mf4s in one go.
+# Every (file, CAN group) pair is decoded in its own worker process, and then the per-group outputs of each
+# input file are merged back into a single signal-based .mf4 for that file.
+#
+# python batchconvert.py logs/*.mf4 --dbc 3=CHASSIS_667kB_dbc_2024_20a.dbc --dbc 6=POWERTRAIN.dbc --workers 8 --output-dir converted
+
+
+decoders = {} # dbc files already loaded by this worker process, path -> compiled FrameDecoder
+
+
+# load a dbc once per worker process (load_decoder also caches the compiled dbc on disk, so workers don't all re-parse it)
+def get_decoder(dbc_path):
+    if dbc_path not in decoders:
+        decoders[dbc_path] = load_decoder(dbc_path)
+    return decoders[dbc_path]
+
+
+# worker function, converts one CAN group of one file into a temporary signal-based .mf4
+# returns a dict with the result and throughput numbers so the main process can report them
+# signals (a list of signal names) only decodes those signals, None decodes everything in the dbc
+# compact/compression are passed on to convert_chunked
+def convert_group(mf4_path, group, dbc_path, output_path, chunk_size, signals=None, compact=False, compression=0):
+    start = time.perf_counter()
+    result = {"file": mf4_path, "group": group, "output": output_path, "pid": os.getpid(), "frames": 0, "error": None}
+    try:
+        decoder = get_decoder(dbc_path)
+        decoder.select(signals)
+        mdf = MDF(mf4_path)
+        result["frames"] = group_record_count(mdf, group)
+        convert_chunked(mdf, decoder, group, output_path, chunk_size, show_progress=False, compact=compact, compression=compression)
+        mdf.close()
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+# delete temporary files, ignoring the ones that were never written
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# stack the per-group outputs of one input file into a single signal-based .mf4, the per-group files get deleted either way
+def merge_groups(group_paths, output_path, compression=0):
+    try:
+        merged = MDF.stack(group_paths, sync=False)
+        merged.save(output_path, overwrite=True, compression=compression)
+        merged.close()
+    finally:
+        remove_files(group_paths)
+
+
+# output name (without extension) for every input file. that's the file name, unless another input has the same one, then
+# it's the path from the folder the inputs share (day1/log.mf4 and day2/log.mf4 -> day1_log and day2_log), so no two inputs
+# write to the same temporary or output files
+def output_stems(mf4_paths):
+    names = [os.path.splitext(os.path.basename(path))[0] for path in mf4_paths]
+    try:
+        common = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in mf4_paths])
+    except ValueError: # on different drives
+        common = None
+    stems = {}
+    used = set()
+    for i, (path, name) in enumerate(zip(mf4_paths, names)):
+        stem = name
+        if names.count(name) > 1 and common is not None:
+            stem = os.path.splitext(os.path.relpath(os.path.abspath(path), common))[0].replace(os.sep, '_')
+        if stem in used:
+            stem = f"{i}_{stem}"
+        used.add(stem)
+        stems[path] = stem
+    return stems
+
+
+# convert every file/group pair in parallel, group_dbcs maps a CAN group number to the dbc file for it
+def batch_convert(mf4_paths, group_dbcs, output_dir, workers=None, chunk_size=1_000_000, signals=None, compact=False, compression=0):
+    os.makedirs(output_dir, exist_ok=True)
+    mf4_paths = list(dict.fromkeys(mf4_paths)) # a file given twice only gets converted once
+    stems = output_stems(mf4_paths)
+    jobs = []
+    for mf4_path in mf4_paths:
+        stem = stems[mf4_path]
+        for group, dbc_path in group_dbcs.items():
+            group_output = os.path.join(output_dir, f"{stem}_group{group}.tmp.mf4")
+            # the per-group files are only temporary, so they're never compressed (only the merged output is)
+            jobs.append((mf4_path, group, dbc_path, group_output, chunk_size, signals, compact, 0))
+
+    group_outputs = {path: [] for path in mf4_paths} # input file -> finished per-group outputs
+    remaining = {path: len(group_dbcs) for path in mf4_paths}
+    worker_stats = {} # pid -> [frames, seconds]
+    start = time.perf_counter()
+    total_frames = 0
+    failed = 0 # file/group pairs and merges that failed
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(convert_group, *job) for job in jobs]
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            name = os.path.basename(result["file"])
+            if result["error"] is None:
+                rate = result["frames"] / result["seconds"] if result["seconds"] > 0 else 0
+                print(f"[{done}/{len(jobs)}] {name} group {result['group']}: {result['frames']} frames "
+                      f"in {result['seconds']:.1f}s ({rate:,.0f} frames/s, worker {result['pid']})")
+                group_outputs[result["file"]].append(result["output"])
+                stats = worker_stats.setdefault(result["pid"], [0, 0.0])
+                stats[0] += result["frames"]
+                stats[1] += result["seconds"]
+                total_frames += result["frames"]
+            else:
+                print(f"[{done}/{len(jobs)}] {name} group {result['group']} failed: {result['error']}")
+                remove_files([result["output"]]) # whatever the worker got written before it failed
+                failed += 1
+
+            # once every group of a file is finished, merge them into the final output for that file
+            remaining[result["file"]] -= 1
+            if remaining[result["file"]] == 0 and group_outputs[result["file"]]:
+                output_path = os.path.join(output_dir, f"{stems[result['file']]}_signals.mf4")
+                try:
+                    merge_groups(sorted(group_outputs[result["file"]]), output_path, compression)
+                    print(f"Saved {output_path}")
+                except Exception as e:
+                    print(f"Merging the groups of {name} into {output_path} failed: {e}")
+                    failed += 1
+
+    elapsed = time.perf_counter() - start
+    print(f"Converted {total_frames} frames from {len(mf4_paths)} files in {elapsed:.1f}s "
+          f"({total_frames / elapsed if elapsed > 0 else 0:,.0f} frames/s overall)"
+          + (f", {failed} failed" if failed else ""))
+    for pid, (frames, seconds) in sorted(worker_stats.items()):
+        print(f"  worker {pid}: {frames} frames, {frames / seconds if seconds > 0 else 0:,.0f} frames/s")
+
+
+# turn "3=CHASSIS.dbc" arguments into {3: "CHASSIS.dbc"}
+def parse_group_dbcs(values):
+    group_dbcs = {}
+    for value in values:
+        group, _, dbc_path = value.partition("=")
+        if not dbc_path:
+            raise argparse.ArgumentTypeError(f"Expected GROUP=DBC, got '{value}'")
+        group_dbcs[int(group)] = dbc_path
+    return group_dbcs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert many frame-based .mf4 files to signal-based .mf4s in parallel")
+    parser.add_argument("files", nargs="+", help="frame-based .mf4 files to convert")
+    parser.add_argument("--dbc", action="append", required=True, metavar="GROUP=DBC",
+                        help="CAN group number and the dbc file to decode it with, can be given multiple times")
+    parser.add_argument("--output-dir", default="converted", help="folder to write the signal-based .mf4s to")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=1_000_000, help="frames decoded at a time by each worker")
+    parser.add_argument("--signals", nargs="+", default=None, metavar="SIGNAL",
+                        help="only decode these signals (messages without any of them are skipped), default: everything")
+    parser.add_argument("--compact", action="store_true",
+                        help="store each signal in its smallest dtype and choice signals as raw codes with a text table")
+    parser.add_argument("--compression", type=int, choices=[0, 1, 2], default=0,
+                        help="output compression: 0 = none, 1 = deflate, 2 = transposed deflate")
+    args = parser.parse_args()
+
+    batch_convert(args.files, parse_group_dbcs(args.dbc), args.output_dir, args.workers, args.chunk_size, args.signals,
+                  args.compact, args.compression)
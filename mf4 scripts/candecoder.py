@@ -0,0 +1,445 @@
+import hashlib
+import math
+import os
+import pickle
+
+import numpy as np
+
+# Bulk (vectorized) CAN decoding engine used by frametosignalmf4.py.
+# Instead of decoding one frame at a time with cantools, frames are grouped by their CAN ID and every
+# signal of the matching dbc message is pulled out of the whole column of data bytes at once with numpy
+# bit-shift/mask and scale/offset arithmetic. The results are the same values (and the same dtypes/order)
+# that the per-frame msg.decode() loop produces.
+
+
+# compiled layout of a single dbc signal, only holds plain numbers so it is cheap to use over and over
+class CompiledSignal:
+    def __init__(self, signal, rank):
+        self.name = signal.name
+        self.rank = rank # decode order of this signal inside its message (matches the order of msg.decode())
+        self.length = signal.length
+        self.is_signed = signal.is_signed
+        self.is_float = signal.is_float
+        self.mask = (1 << signal.length) - 1
+        self.scale = signal.scale
+        self.offset = signal.offset
+        # cantools keeps values as integers if the scale and offset are whole numbers (and the signal isn't a float)
+        self.int_scaling = (not signal.is_float
+                            and float(signal.scale).is_integer()
+                            and float(signal.offset).is_integer())
+        if self.int_scaling:
+            self.scale = int(signal.scale)
+            self.offset = int(signal.offset)
+
+        choices = signal.conversion.choices if signal.conversion is not None else None
+        self.choices = np.array(sorted(int(key) for key in choices), dtype=np.int64) if choices else None
+        # (raw code, text) pairs of the choice table, for the value-to-text conversion in the compact output
+        self.choice_texts = sorted((int(key), str(value)) for key, value in choices.items()) if choices else None
+
+        # widest dtype this signal can decode to, used when a fixed dtype is needed up front (ex: chunked conversion)
+        if signal.is_float or not self.int_scaling or self.choices is not None or (signal.length == 64 and not signal.is_signed):
+            self.dtype = np.dtype(np.float64)
+        else:
+            self.dtype = np.dtype(np.int64)
+        self.compact_dtype = self.smallest_dtype()
+
+        self.multiplexer_signal = signal.multiplexer_signal
+        self.multiplexer_ids = list(signal.multiplexer_ids) if signal.multiplexer_ids else None
+
+        # list of (byte index, shift) pairs, each data byte gets shifted into place and or'ed into the raw value
+        self.byte_shifts = []
+        if signal.byte_order == 'little_endian':
+            first_bit = signal.start
+            last_bit = first_bit + signal.length - 1
+            for b in range(first_bit // 8, last_bit // 8 + 1):
+                self.byte_shifts.append((b, 8 * b - first_bit))
+        else:
+            # big endian start bits are given as the msb in the "sawtooth" numbering, convert it to a sequential bit index
+            first_bit = 8 * (signal.start // 8) + (7 - signal.start % 8)
+            last_bit = first_bit + signal.length - 1
+            for b in range(first_bit // 8, last_bit // 8 + 1):
+                self.byte_shifts.append((b, last_bit - 8 * b - 7))
+        self.last_byte = last_bit // 8
+
+    # smallest dtype for this signal's values (used by the compact output): integers get the smallest int type for their
+    # scaled range and floats keep their own width, both exact. fractional scaled values get float32 when it still gives
+    # every raw code its own value: that is exact when the scale is a power of two (ex: 0.5, 0.125) and the offset is a
+    # whole number of steps, otherwise the values are rounded to float32 (about 7 significant digits, ex: 170.82 is
+    # stored as 170.82000732), which is still well inside one step of the signal
+    def smallest_dtype(self):
+        if self.is_float:
+            return np.dtype(np.float32) if self.length == 32 else np.dtype(np.float64)
+        if self.choices is not None and not (self.int_scaling and self.scale == 1 and self.offset == 0):
+            return self.dtype # choice codes mixed with scaled values, only float64 holds both
+        if self.length == 64 and not self.is_signed:
+            return self.dtype
+        if self.is_signed:
+            low, high = -(1 << (self.length - 1)), (1 << (self.length - 1)) - 1
+        else:
+            low, high = 0, self.mask
+        if not self.int_scaling:
+            # the biggest value in steps of the scale has to fit the 24 bit mantissa to be exact, and stay a couple of
+            # bits under it when it gets rounded, so the rounding error is a fraction of a step
+            steps = max(abs(low + self.offset / self.scale), abs(high + self.offset / self.scale))
+            exact = math.frexp(abs(self.scale))[0] == 0.5 and float(self.offset / self.scale).is_integer()
+            return np.dtype(np.float32) if steps < (1 << 24 if exact else 1 << 21) else np.dtype(np.float64)
+        low, high = sorted((low * self.scale + self.offset, high * self.scale + self.offset))
+        for dtype in ((np.uint8, np.uint16, np.uint32, np.uint64) if low >= 0 else (np.int8, np.int16, np.int32, np.int64)):
+            if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+                return np.dtype(dtype)
+        return np.dtype(np.float64)
+
+    # pull the raw (unscaled) values of this signal out of a (frames x bytes) uint8 matrix
+    def raw_values(self, data):
+        raw = np.zeros(len(data), dtype=np.uint64)
+        for b, shift in self.byte_shifts:
+            column = data[:, b].astype(np.uint64)
+            if shift >= 0:
+                raw |= column << np.uint64(shift)
+            else:
+                raw |= column >> np.uint64(-shift)
+        if self.length < 64:
+            raw &= np.uint64(self.mask)
+
+        if self.is_float:
+            if self.length == 32:
+                with np.errstate(invalid='ignore'): # nan bit patterns are fine here, cantools returns them as nan too
+                    return raw.astype(np.uint32).view(np.float32).astype(np.float64)
+            return raw.view(np.float64)
+
+        if self.is_signed:
+            if self.length == 64:
+                return raw.view(np.int64)
+            sign = ((raw >> np.uint64(self.length - 1)) & np.uint64(1)).astype(np.int64)
+            return raw.astype(np.int64) - (sign << np.int64(self.length))
+
+        if self.length == 64:
+            return raw
+        return raw.astype(np.int64)
+
+    # apply scale/offset to the raw values, the same way cantools raw_to_scaled() does
+    def scaled_values(self, raw):
+        if self.int_scaling:
+            if self.scale == 1 and self.offset == 0:
+                return raw
+            return raw * self.scale + self.offset
+        return raw.astype(np.float64) * self.scale + self.offset
+
+    # mask of the frames where cantools would have returned a NamedSignalValue instead of a number
+    def choice_hits(self, raw):
+        if self.choices is None:
+            return None
+        return np.isin(raw.astype(np.int64), self.choices)
+
+    # decoded values of this signal, returns (values, used_choices)
+    # used_choices is True if any of the values came from the choice table, in which case the per-frame loop
+    # would have ended up with an object array that gets converted to float64 (raw code for choices, scaled otherwise)
+    def decode(self, data):
+        raw = self.raw_values(data)
+        scaled = self.scaled_values(raw)
+        hits = self.choice_hits(raw)
+        if hits is None or not hits.any():
+            return scaled, False
+        return np.where(hits, raw, scaled).astype(np.float64), True
+
+
+# compiled layout of a dbc message, made up of CompiledSignals
+class CompiledMessage:
+    def __init__(self, message):
+        self.name = message.name
+        self.frame_id = message.frame_id
+        self.length = message.length
+        self.is_container = bool(getattr(message, 'is_container', False))
+
+        by_name = {signal.name: signal for signal in message.signals}
+        index = {signal.name: i for i, signal in enumerate(message.signals)}
+
+        # work out the decode order key of every signal, msg.decode() returns the root signals first and then
+        # walks each multiplexer's selected branch (in the order the multiplexers appear in the message)
+        def rank_of(signal):
+            if signal.multiplexer_signal is None:
+                return (0, index[signal.name])
+            parent = by_name[signal.multiplexer_signal]
+            return rank_of(parent)[:-2] + (1, index[parent.name], 0, index[signal.name])
+
+        self.signals = sorted((CompiledSignal(signal, rank_of(signal)) for signal in message.signals),
+                              key=lambda compiled: compiled.rank)
+
+        # valid multiplexer ids for each multiplexer signal, anything else makes cantools reject the whole frame
+        self.multiplexers = {}
+        for signal in message.signals:
+            if signal.is_multiplexer:
+                ids = set()
+                for child in message.signals:
+                    if child.multiplexer_signal == signal.name and child.multiplexer_ids is not None:
+                        ids.update(child.multiplexer_ids)
+                choices = signal.conversion.choices if signal.conversion is not None else None
+                if choices:
+                    ids.update(int(key) for key in choices)
+                self.multiplexers[signal.name] = np.array(sorted(ids), dtype=np.int64)
+
+    # decode every frame of this message at once
+    # data is a (frames x bytes) uint8 matrix with at least self.length columns
+    # returns (valid, {signal_name: (active_mask, values, used_choices)}) where valid masks out frames that cantools would reject
+    # wanted (a set of signal names) only decodes the values of those signals, the rest are still checked so the same
+    # frames get rejected either way
+    def decode(self, data, wanted=None):
+        data = data[:, :self.length]
+        valid = np.ones(len(data), dtype=bool)
+        active = {}
+        decoded = {}
+        mux_numbers = {}
+
+        for compiled in self.signals:
+            if compiled.multiplexer_signal is None:
+                mask = np.ones(len(data), dtype=bool)
+            else:
+                parent_mask = active[compiled.multiplexer_signal]
+                mask = parent_mask & np.isin(mux_numbers[compiled.multiplexer_signal], compiled.multiplexer_ids or [])
+            active[compiled.name] = mask
+
+            if compiled.last_byte >= self.length:
+                # signal doesn't fit in the message, cantools can't unpack any frame where it is present
+                valid &= ~mask
+                decoded[compiled.name] = (mask, np.zeros(len(data)), False)
+                mux_numbers[compiled.name] = np.full(len(data), -1, dtype=np.int64)
+                continue
+
+            if wanted is None or compiled.name in wanted:
+                values, used_choices = compiled.decode(data)
+                decoded[compiled.name] = (mask, values, used_choices)
+
+            if compiled.name in self.multiplexers:
+                # cantools turns the mux value back into a number: choices give the raw code, otherwise int(scaled)
+                raw = compiled.raw_values(data)
+                hits = compiled.choice_hits(raw)
+                numbers = np.trunc(compiled.scaled_values(raw)).astype(np.int64)
+                if hits is not None:
+                    numbers = np.where(hits, raw.astype(np.int64), numbers)
+                mux_numbers[compiled.name] = numbers
+                valid &= ~mask | np.isin(numbers, self.multiplexers[compiled.name])
+
+        return valid, decoded
+
+
+# turn the DataBytes samples into a (frames x bytes) uint8 matrix and the usable byte count of each frame
+def frame_byte_matrix(dlcs, data_bytes):
+    if data_bytes.dtype == object:
+        # variable length data (ex: CAN FD frames stored as bytes objects), pad them all to the longest frame
+        width = max((len(row) for row in data_bytes), default=0)
+        matrix = np.zeros((len(data_bytes), width), dtype=np.uint8)
+        for i, row in enumerate(data_bytes):
+            matrix[i, :len(row)] = np.frombuffer(bytes(row), dtype=np.uint8)
+    else:
+        matrix = np.asarray(data_bytes, dtype=np.uint8)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(-1, 1)
+    lengths = np.minimum(np.asarray(dlcs, dtype=np.int64), matrix.shape[1])
+    return matrix, lengths
+
+
+# group the frame indexes by CAN ID, returns a list of (can_id, frame indexes in original order)
+# rows limits the grouping to a subset of the frames (ex: only frames with IDs that are in the dbc)
+def group_by_frame_id(ids, rows=None):
+    ids = np.asarray(ids)
+    if rows is None:
+        order = np.argsort(ids, kind='stable')
+    else:
+        order = rows[np.argsort(ids[rows], kind='stable')]
+    unique_ids, starts = np.unique(ids[order], return_index=True)
+    ends = np.append(starts[1:], len(order))
+    return [(int(can_id), order[start:end]) for can_id, start, end in zip(unique_ids, starts, ends)]
+
+
+# decode every frame of a group, using a lookup function that returns a CompiledMessage (or None) for each CAN ID
+# returns a list of (signal_name, rank, frame_indexes, values, used_choices) pieces, one per signal per message
+# wanted (a set of signal names) limits the pieces to those signals
+def decode_pieces(lookup, ids, dlcs, data_bytes, rows=None, wanted=None):
+    matrix, lengths = frame_byte_matrix(dlcs, data_bytes)
+    pieces = []
+    for can_id, rows in group_by_frame_id(ids, rows):
+        compiled = lookup(can_id)
+        if compiled is None or compiled.is_container:
+            continue # frame not in the dbc, skip the whole group at once
+
+        # frames shorter than the dbc message length can't be decoded
+        rows = rows[lengths[rows] >= compiled.length]
+        if len(rows) == 0:
+            continue
+
+        valid, decoded = compiled.decode(matrix[rows], wanted)
+        for signal in compiled.signals:
+            if signal.name not in decoded:
+                continue
+            mask, values, used_choices = decoded[signal.name]
+            keep = mask & valid
+            if keep.any():
+                pieces.append((signal.name, signal.rank, rows[keep], values[keep], used_choices))
+    return pieces
+
+
+# merge the decoded pieces into per-signal time series, in the same order the per-frame loop would build them
+def merge_pieces(pieces, timestamps):
+    by_name = {}
+    first_seen = {}
+    for name, rank, rows, values, used_choices in pieces:
+        by_name.setdefault(name, []).append((rows, values, used_choices))
+        key = (int(rows[0]), rank)
+        if name not in first_seen or key < first_seen[name]:
+            first_seen[name] = key
+
+    signal_times = {}
+    signal_values = {}
+    for name in sorted(by_name, key=lambda n: first_seen[n]):
+        parts = by_name[name]
+        if len(parts) == 1:
+            rows, values, used_choices = parts[0]
+            if used_choices:
+                values = values.astype(np.float64)
+        else:
+            # same signal name in more than one message, put the samples back into frame order
+            rows = np.concatenate([part[0] for part in parts])
+            if any(part[2] for part in parts):
+                values = np.concatenate([part[1].astype(np.float64) for part in parts])
+            else:
+                values = np.concatenate([part[1] for part in parts])
+            order = np.argsort(rows, kind='stable')
+            rows = rows[order]
+            values = values[order]
+        if values.dtype == np.uint64:
+            # numpy only keeps python ints as uint64 if they all need it, mixed with smaller ones they become float64
+            big = values > np.uint64(np.iinfo(np.int64).max)
+            if not big.any():
+                values = values.astype(np.int64)
+            elif not big.all():
+                values = values.astype(np.float64)
+        signal_times[name] = timestamps[rows]
+        signal_values[name] = values
+    return signal_times, signal_values
+
+
+# bump this whenever the compiled layout changes, so old decoder caches on disk get ignored
+CACHE_VERSION = 5
+
+
+# the signals a FrameDecoder decodes, with the CAN ID caches that depend on them. select() swaps in a new one with a single
+# assignment and decode() keeps using the one it started with, so a selection changed from another thread (ex: a dashboard
+# subscription) never mixes with a decode that is already running, and never ends up in the other selection's caches
+class Selection:
+    def __init__(self, signal_names=None):
+        self.names = None if signal_names is None else frozenset(signal_names) # signal names to decode, None = everything
+        self.known_ids = {} # CAN IDs seen in the logs that decode to a message -> CompiledMessage
+        self.unknown_ids = set() # CAN IDs seen in the logs that aren't in the dbc (or can't be decoded), skipped in bulk
+
+
+# compiled decoder table for a whole dbc, built once from the cantools database and then reused for every chunk/group/file.
+# it only holds plain numbers (no cantools objects), so it can be pickled to disk and loaded back without parsing the dbc again
+class FrameDecoder:
+    def __init__(self, db):
+        self.messages = {message.name: CompiledMessage(message) for message in db.messages}
+
+        # same frame id masking as cantools get_message_by_frame_id(), so we can resolve IDs without the database
+        self.frame_id_mask = getattr(db, '_frame_id_mask', None) or 0xFFFFFFFF
+        self.frame_ids = {} # masked frame id -> CompiledMessage
+        for message in db.messages:
+            key = message.frame_id & self.frame_id_mask
+            if message.is_extended_frame:
+                key |= 0x80000000
+            self.frame_ids[key] = self.messages[message.name]
+
+        self.selection = Selection() # signals to decode and the CAN ID caches for them (see select()), everything to start with
+
+        # output dtype of every signal name, widened if the same name shows up in more than one message
+        self.dtypes = {}
+        self.compact_dtypes = {} # smallest dtype of every signal name, for the compact output
+        self.choice_texts = {} # signal name -> (raw code, text) pairs, for signals that decode to choice codes in the compact output
+        for compiled in self.messages.values():
+            for signal in compiled.signals:
+                if signal.name in self.dtypes:
+                    self.dtypes[signal.name] = np.result_type(self.dtypes[signal.name], signal.dtype)
+                    self.compact_dtypes[signal.name] = np.result_type(self.compact_dtypes[signal.name], signal.compact_dtype)
+                    if self.choice_texts.get(signal.name) != signal.choice_texts:
+                        self.choice_texts[signal.name] = None # different tables in different messages, no single conversion fits
+                else:
+                    self.dtypes[signal.name] = signal.dtype
+                    self.compact_dtypes[signal.name] = signal.compact_dtype
+                    self.choice_texts[signal.name] = signal.choice_texts
+        # scaled choice signals stay float64 and plain numbers, only whole raw codes get a text table
+        self.choice_texts = {name: texts for name, texts in self.choice_texts.items()
+                             if texts and self.compact_dtypes[name].kind != 'f'}
+
+    # look up the compiled dbc message for a CAN ID, returns None if the frame isn't in the dbc (or has none of the
+    # selection's signals). the answer is cached in the selection it was worked out for
+    def lookup(self, can_id, selection):
+        if can_id in selection.known_ids:
+            return selection.known_ids[can_id]
+        if can_id in selection.unknown_ids:
+            return None
+
+        frame_id = can_id | 0x80000000 if can_id > 0x7FF else can_id
+        compiled = self.frame_ids.get(frame_id & (0x80000000 | self.frame_id_mask))
+        if compiled is None or compiled.is_container:
+            selection.unknown_ids.add(can_id)
+            return None
+        if selection.names is not None and not any(signal.name in selection.names for signal in compiled.signals):
+            selection.unknown_ids.add(can_id) # none of its signals are wanted, skip the whole message like an unknown ID
+            return None
+        selection.known_ids[can_id] = compiled
+        return compiled
+
+    # only decode these signal names from now on (None goes back to decoding everything), safe to call while another
+    # thread is decoding: a decode that is already running finishes with the old selection.
+    # messages with none of the signals in them are skipped in bulk, the same way unknown IDs are
+    def select(self, signal_names):
+        self.selection = Selection(signal_names)
+
+    # bulk decode a set of frames, returns {signal_name: timestamps}, {signal_name: values}
+    def decode(self, ids, dlcs, data_bytes, timestamps):
+        selection = self.selection # the whole decode uses one selection, even if select() is called meanwhile
+        ids = np.asarray(ids)
+        rows = None
+        if selection.unknown_ids:
+            # drop every frame with an ID we already know isn't in the dbc in one go, before grouping the rest
+            unknown = np.fromiter(selection.unknown_ids, dtype=ids.dtype, count=len(selection.unknown_ids))
+            rows = np.flatnonzero(~np.isin(ids, unknown))
+        pieces = decode_pieces(lambda can_id: self.lookup(can_id, selection), ids, dlcs, data_bytes, rows, selection.names)
+        return merge_pieces(pieces, np.asarray(timestamps))
+
+
+# bulk version of the per-frame decode loop, returns {signal_name: timestamps}, {signal_name: values}
+def decode_frames(db, ids, dlcs, data_bytes, timestamps):
+    return FrameDecoder(db).decode(ids, dlcs, data_bytes, timestamps)
+
+
+# load the FrameDecoder for a dbc file, from the on-disk cache if the dbc hasn't changed since it was compiled.
+# loading a big dbc with cantools takes a few seconds, the cached decoder loads in milliseconds.
+# cache files are kept in a __dbccache__ folder next to the dbc, and are keyed by the hash of the dbc contents
+def load_decoder(dbc_path, cache_dir=None):
+    import cantools
+    import cantools.database
+
+    with open(dbc_path, 'rb') as f:
+        dbc_hash = hashlib.sha256(f.read()).hexdigest()
+    key = hashlib.sha256(f"{dbc_hash}-{CACHE_VERSION}-{cantools.__version__}".encode()).hexdigest()[:16]
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(dbc_path)), '__dbccache__')
+    cache_path = os.path.join(cache_dir, f"{os.path.basename(dbc_path)}-{key}.pkl")
+
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"Failed to load decoder cache {cache_path}, rebuilding it: {e}")
+
+    decoder = FrameDecoder(cantools.database.load_file(dbc_path))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.tmp" # write then rename, so parallel workers never see half a file
+        with open(temp_path, 'wb') as f:
+            pickle.dump(decoder, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"Failed to save decoder cache {cache_path}: {e}")
+    return decoder
@@ -1,8 +1,8 @@
 import socket
-import time
-import json
 import numpy as np
 
+from replayengine import merge_channels, Replay
+
 # Setup
 duration = 60  # seconds
 sample_rate = 10  # Hz
@@ -36,15 +36,19 @@ battery_voltage = 14.3 + 0.1 * np.sin(0.5 * np.pi * t)
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 address = ('127.0.0.1', 6000)
 
-# Send packets
-for i in range(total_samples):
-    packet_dict = {
-        'RPM': float(round(rpm[i], 2)),
-        'OilPress': float(round(oil_pressure[i], 2)),
-        'RPM_Above_1700': int(rpm_flag[i]),
-        'BatteryVoltage': float(round(battery_voltage[i], 3)),
-    }
-    message = json.dumps(packet_dict).encode()
-    print(f"Sending {packet_dict}")
-    sock.sendto(message, address)
-    time.sleep(1 / sample_rate)
\ No newline at end of file
+# "binary" sends the compact binary format (see udpprotocol.py), "json" sends the old JSON dictionaries
+wire_format = "binary"
+
+# Send packets, every datagram is encoded up front (see replayengine.py) so the send loop just slices and sends
+names = ['RPM', 'OilPress', 'RPM_Above_1700', 'BatteryVoltage']
+times, ids, values = merge_channels([
+    (t, np.round(rpm, 2)),
+    (t, np.round(oil_pressure, 2)),
+    (t, rpm_flag.astype(np.float64)),
+    (t, np.round(battery_voltage, 3)),
+])
+# None sends every sample. set it to only send a signal when it moves by more than its deadband (the flag whenever it flips),
+# with every value resent once a second, ex: {'RPM': 5, 'OilPress': 1, 'RPM_Above_1700': 0, 'BatteryVoltage': 0.01}
+deadband = None
+replay = Replay(names, times, ids, values, sock, address, speed=1.0, wire_format=wire_format, deadband=deadband, keyframe_interval=1.0)
+replay.run()
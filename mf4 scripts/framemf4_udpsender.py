@@ -0,0 +1,130 @@
+import queue
+import socket
+import threading
+import numpy as np
+from asammdf import MDF
+
+from candecoder import load_decoder
+from frametosignalmf4 import load_frames, group_record_count
+from replayengine import merge_channels, prepare_binary, prepare_json, Replay, start_console
+
+# Streams a frame-based .mf4 straight to the dashboard: the CAN frames are read chunk by chunk, decoded with the dbc,
+# and sent paced by their original timestamps. Nothing gets written to disk, so a new log shows up on the dashboard
+# within seconds instead of after a full frametosignalmf4.py conversion and a reload of the signal-based .mf4.
+
+
+# decode a frame-based mf4 group chunk_size frames at a time, yields (times, ids, values) for each chunk in time order,
+# ids index into names (every signal in the dbc)
+# note: like convert_chunked(), samples are only sorted inside each chunk, which is fine for logs written in time order
+def decoded_chunks(mdf, decoder, group, names, chunk_size=200_000):
+    signal_ids = {name: i for i, name in enumerate(names)}
+    total = group_record_count(mdf, group)
+    for record_offset in range(0, total, chunk_size):
+        ids, dlcs, data_bytes, timestamps = load_frames(mdf, group, record_offset, chunk_size)
+        signal_times, signal_values = decoder.decode(ids, dlcs, data_bytes, timestamps)
+        chunk_names = list(signal_times)
+        times, local_ids, values = merge_channels(
+            [(signal_times[name], signal_values[name].astype(np.float64)) for name in chunk_names])
+        yield times, np.array([signal_ids[name] for name in chunk_names], dtype=np.int64)[local_ids], values
+
+
+# class to send decoded chunks as they come in, instead of a whole log that is already in memory.
+# the next chunks get decoded and encoded on a background thread while the current one is being sent.
+# pause/resume/stop work like Replay, seeking and looping don't (there is no index over a log that hasn't been read yet).
+# in selective mode the decoder (the same one decoding the chunks) is switched to only decode the subscribed signals
+class FrameStream(Replay):
+    def __init__(self, names, chunks, sock, address, speed=1.0, wire_format="binary", prefetch=2, decoder=None,
+                 deadband=None, keyframe_interval=1.0):
+        empty = np.array([])
+        super().__init__(names, empty, empty.astype(np.int64), empty, sock, address, speed, wire_format, chunk_size=1,
+                         deadband=deadband, keyframe_interval=keyframe_interval)
+        self.chunks = chunks
+        self.decoder = decoder
+        self.prefetch = prefetch # how many encoded chunks to keep ready ahead of the send loop
+        self.t0 = None
+
+    # decode and encode chunks on a background thread, hands them over through a queue
+    def sections(self, start):
+        ready = queue.Queue(maxsize=self.prefetch)
+
+        def producer():
+            table_bucket = None
+            deadband = None
+            try:
+                for times, ids, values in self.chunks:
+                    if self.stopped:
+                        break
+                    times, ids, values = self.filtered(times, ids, values) # chunks decoded before the last subscription
+                    if len(times) == 0:
+                        continue
+                    if self.t0 is None:
+                        self.t0 = times[0]
+                    if self.deadbands is not None:
+                        if deadband is None:
+                            deadband = self.new_deadband()
+                        deadband.select(self.selected) # signals that got unsubscribed drop out of the keyframes
+                        times, ids, values = deadband.thin(times, ids, values)
+                    if self.wire_format == "binary":
+                        send_buffer, table_bucket = prepare_binary(self.encoder, times, ids, values, self.t0, table_bucket)
+                    else:
+                        send_buffer = prepare_json(self.names, times, ids, values, self.t0)
+                    ready.put(send_buffer)
+            except Exception as e:
+                print(f"Failed to decode frames: {e}")
+            ready.put(None)
+
+        threading.Thread(target=producer, daemon=True).start()
+        while True:
+            send_buffer = ready.get()
+            if send_buffer is None:
+                return
+            yield send_buffer.datagrams(), send_buffer.send_times.tolist(), send_buffer.counts
+
+    # the new subscription goes straight to the decoder, the stream carries on from where it is
+    def apply_selection(self):
+        self.selected = self.next_selected
+        self.selection_changed = False
+        if self.decoder is not None:
+            self.decoder.select(None if self.selected is None else [self.names[i] for i in self.selected])
+        return None
+
+    def seek(self, t):
+        print("Seeking isn't supported when streaming straight from a frame-based .mf4")
+
+    def set_loop(self, loop):
+        print("Looping isn't supported when streaming straight from a frame-based .mf4")
+
+    def run(self):
+        self.send_all()
+
+
+if __name__ == "__main__":
+    mdf = MDF("ZZ5420_Data2_F019_2025-07-24_23-39-58.mf4")
+    decoder = load_decoder("CHASSIS_667kB_dbc_2024_20a.dbc") # compiled dbc, cached in __dbccache__ (see candecoder.py)
+    group = 3 # CAN group with the frames to send
+
+    speed = 1.0 # 1.0 = real time, 2.0 = twice as fast, None = as fast as possible
+    chunk_size = 200_000 # frames decoded at a time, smaller chunks get the first packets out sooner
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = ('127.0.0.1', 6000)
+
+    # "binary" sends the compact binary format (see udpprotocol.py), "json" sends the old JSON dictionaries
+    wire_format = "binary"
+
+    names = list(decoder.dtypes) # every signal in the dbc gets an id in the signal table
+    selective = True # only decode and send the signals the dashboard is showing (it tells us which ones)
+
+    # only send a signal when it changes by more than this (None sends every sample), ex: 0 = any change, 0.5, or a
+    # {signal name: deadband} dictionary. every signal's value still goes out every keyframe_interval seconds
+    deadband = None
+    keyframe_interval = 1.0
+
+    stream = FrameStream(names, decoded_chunks(mdf, decoder, group, names, chunk_size), sock, address,
+                         speed=speed, wire_format=wire_format, decoder=decoder,
+                         deadband=deadband, keyframe_interval=keyframe_interval)
+    if selective:
+        stream.listen()
+    # type commands into the terminal while it runs: pause, resume, stop
+    start_console(stream)
+    stream.run()
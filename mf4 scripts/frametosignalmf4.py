@@ -1,77 +1,179 @@
 from asammdf import MDF, Signal
-import cantools
-import cantools.database
 
 from collections import defaultdict
 import numpy as np
 
-mdf = MDF("ZZ5420_Data2_F019_2025-07-24_23-39-58.mf4")
-db = cantools.database.load_file("CHASSIS_667kB_dbc_2024_20a.dbc")
-#Using asammdf to take in the frame-based mf4 file and then cantools to take in the dbc file.
+from candecoder import load_decoder
+from signalcache import write_cache
+from signalpyramid import write_pyramid
+
 
 #.get helps us extract Signal objects from the loaded MDF file, such as CAN ID, CAN data length code, data bytes, and timestamps
-ids = mdf.get('CAN_DataFrame.ID', group=3).samples.astype(int) # group=1 is specifying to use CAN group 1
-dlcs = mdf.get('CAN_DataFrame.DLC', group=3).samples.astype(int)
-data_bytes = mdf.get('CAN_DataFrame.DataBytes', group=3).samples
-timestamps = mdf.get('t', group=3).samples
-
-
-#--------- build a frame list to put together CAN IDs, timestamps, data length codes, and data bytes ------
-frames = []
-for i in range(len(timestamps)): 
-    can_id = ids[i]
-    dlc = dlcs[i]
-    data = bytes(data_bytes[i][:dlc])
-    frames.append((timestamps[i], can_id, data))
-#----------------------------------------------------------------------------------------------------------
-    
-#------------  decoding using the dbc file -----------------
-decoded_signals = []
-for ts, can_id, data in frames:
-    try:
-        msg = db.get_message_by_frame_id(can_id) # try and get the message definition from dbc
-        signals = msg.decode(data) # decode byte data into the signal's values
-        decoded_signals.append((ts, signals)) # stored as (timestamp, {signal_name: value, ...})
-    except Exception:# Frame not in DBC or decode error, skip as needed
-        pass
-#-----------------------------------------------------------
-
-#------------ Group each value into a time series for its signal --------------
-signal_times = defaultdict(list) # no key error will be raised, default to empty list
-signal_values = defaultdict(list)
-
-for ts, sig_dict in decoded_signals:
-    for sig_name, val in sig_dict.items():
-        signal_times[sig_name].append(ts)
-        signal_values[sig_name].append(val)
-#------------------------------------------------------------------------------
+# record_offset/record_count only read part of the group (record_count=None reads everything from the offset on)
+def load_frames(mdf, group, record_offset=0, record_count=None):
+    ids = mdf.get('CAN_DataFrame.ID', group=group, record_offset=record_offset, record_count=record_count).samples.astype(int) # group=1 is specifying to use CAN group 1
+    dlcs = mdf.get('CAN_DataFrame.DLC', group=group, record_offset=record_offset, record_count=record_count).samples.astype(int)
+    data_bytes = mdf.get('CAN_DataFrame.DataBytes', group=group, record_offset=record_offset, record_count=record_count).samples
+    timestamps = mdf.get('t', group=group, record_offset=record_offset, record_count=record_count).samples
+    return ids, dlcs, data_bytes, timestamps
+
+
+# number of CAN frames (records) in a group
+def group_record_count(mdf, group):
+    return mdf.groups[group].channel_group.cycles_nr
+
+
+# original one-frame-at-a-time decoder, kept around to check the bulk decoder (candecoder.py) against
+def decode_frames_per_frame(db, ids, dlcs, data_bytes, timestamps):
+    #--------- build a frame list to put together CAN IDs, timestamps, data length codes, and data bytes ------
+    frames = []
+    for i in range(len(timestamps)):
+        can_id = ids[i]
+        dlc = dlcs[i]
+        data = bytes(data_bytes[i][:dlc])
+        frames.append((timestamps[i], can_id, data))
+    #----------------------------------------------------------------------------------------------------------
+
+    #------------  decoding using the dbc file -----------------
+    decoded_signals = []
+    for ts, can_id, data in frames:
+        try:
+            msg = db.get_message_by_frame_id(can_id) # try and get the message definition from dbc
+            signals = msg.decode(data) # decode byte data into the signal's values
+            decoded_signals.append((ts, signals)) # stored as (timestamp, {signal_name: value, ...})
+        except Exception:# Frame not in DBC or decode error, skip as needed
+            pass
+    #-----------------------------------------------------------
+
+    #------------ Group each value into a time series for its signal --------------
+    signal_times = defaultdict(list) # no key error will be raised, default to empty list
+    signal_values = defaultdict(list)
+
+    for ts, sig_dict in decoded_signals:
+        for sig_name, val in sig_dict.items():
+            signal_times[sig_name].append(ts)
+            signal_values[sig_name].append(val)
+    #------------------------------------------------------------------------------
+    return signal_times, signal_values
+
+
+# asammdf value-to-text conversion for a choice table, so tools show the names while the file only stores the raw codes.
+# codes that aren't in the table go through an identity conversion and keep their raw value instead of turning into empty text
+# (asammdf then reads the signal as numbers with NaN for the named codes, raw=True still gives every code)
+def value_to_text(choice_texts):
+    conversion = {}
+    for i, (code, text) in enumerate(choice_texts):
+        conversion[f'val_{i}'] = code
+        conversion[f'text_{i}'] = text.encode()
+    conversion['default_addr'] = {'a': 1.0, 'b': 0.0}
+    return conversion
+
 
 #------------ Convert into asammdf Signal objects --------------
-signals = [] 
-for sig_name in signal_times:
-    times = np.array(signal_times[sig_name])
-    values = np.array(signal_values[sig_name])
-    
-    # Sort time stamps to be in order
-    sort_idx = np.argsort(times)
-    times = times[sort_idx]
-    values = values[sort_idx]
-
-    sig = Signal(
-        samples=values,
-        timestamps=times,
-        name=sig_name,
-        unit=''  
-    )
-    if sig.samples.dtype == object:
-    # Extract float values from NamedSignalValue objects, this is for any can signal that isn't a float already, need to figure that out in the future
-        sig.samples = np.array([v.value if hasattr(v, 'value') else v for v in sig.samples], dtype=np.float64)
-
-    signals.append(sig)
+# compact=decoder (the FrameDecoder that decoded the values) stores every signal in its smallest dtype (see
+# CompiledSignal.smallest_dtype) and choice signals as raw codes with a value-to-text conversion, instead of float64
+def build_signals(signal_times, signal_values, compact=None):
+    signals = []
+    for sig_name in signal_times:
+        times = np.array(signal_times[sig_name])
+        values = np.array(signal_values[sig_name])
+
+        # Sort time stamps to be in order
+        sort_idx = np.argsort(times)
+        times = times[sort_idx]
+        values = values[sort_idx]
+
+        conversion = None
+        if compact is not None:
+            values = values.astype(compact.compact_dtypes[sig_name])
+            if sig_name in compact.choice_texts:
+                conversion = value_to_text(compact.choice_texts[sig_name])
+
+        sig = Signal(
+            samples=values,
+            timestamps=times,
+            name=sig_name,
+            unit='',
+            conversion=conversion
+        )
+        if sig.samples.dtype == object:
+        # Extract float values from NamedSignalValue objects, this is for any can signal that isn't a float already, need to figure that out in the future
+            sig.samples = np.array([v.value if hasattr(v, 'value') else v for v in sig.samples], dtype=np.float64)
+
+        signals.append(sig)
+    return signals
+#---------------------------------------------------------------
+
+
+#------------ Chunked (bounded memory) conversion --------------
+# reads the group chunk_size frames at a time, decodes each chunk and appends the samples to the output file as it goes,
+# so the memory used depends on chunk_size and not on how big the log is.
+# each signal gets its own group in the output, and its dtype is fixed from the dbc up front (choice and scaled signals are float64,
+# or the smallest dtype that fits with compact=True, see build_signals)
+# note: samples are only sorted by time inside each chunk, which is fine for logs that are written in time order
+# decoder is the compiled dbc from candecoder.load_decoder(), it is reused for every chunk
+# compression is passed to MDF.save (0 = none, 1 = deflate, 2 = transposed deflate)
+def convert_chunked(mdf, decoder, group, output_path, chunk_size=1_000_000, show_progress=True, compact=False, compression=0):
+    new_mdf = MDF()
+    signal_groups = {} # signal name -> group index in the new mdf
+
+    total = group_record_count(mdf, group)
+    for record_offset in range(0, total, chunk_size):
+        ids, dlcs, data_bytes, timestamps = load_frames(mdf, group, record_offset, chunk_size)
+        signal_times, signal_values = decoder.decode(ids, dlcs, data_bytes, timestamps)
+        del ids, dlcs, data_bytes, timestamps
+
+        for sig_name in signal_times:
+            times = signal_times[sig_name]
+            sort_idx = np.argsort(times)
+            times = times[sort_idx]
+            dtypes = decoder.compact_dtypes if compact else decoder.dtypes
+            values = signal_values[sig_name][sort_idx].astype(dtypes[sig_name])
+
+            if sig_name not in signal_groups:
+                conversion = value_to_text(decoder.choice_texts[sig_name]) if compact and sig_name in decoder.choice_texts else None
+                new_mdf.append(Signal(samples=values, timestamps=times, name=sig_name, unit='', conversion=conversion))
+                signal_groups[sig_name] = len(new_mdf.groups) - 1
+            else:
+                new_mdf.extend(signal_groups[sig_name], [(times, None), (values, None)])
+
+        if show_progress:
+            print(f"Converted {min(record_offset + chunk_size, total)}/{total} frames")
+
+    new_mdf.save(output_path, overwrite=True, compression=compression)
+    return output_path
 #---------------------------------------------------------------
 
 
-new_mdf = MDF()
-new_mdf.append(signals)
-new_mdf.save('signal_based_output_group3.mf4')# generate a signal-based output file
+if __name__ == "__main__":
+    mdf = MDF("ZZ5420_Data2_F019_2025-07-24_23-39-58.mf4")
+    decoder = load_decoder("CHASSIS_667kB_dbc_2024_20a.dbc")
+    #Using asammdf to take in the frame-based mf4 file and then cantools to take in the dbc file.
+    #load_decoder compiles the dbc once and caches it on disk (in __dbccache__ next to the dbc), so later runs skip the slow dbc parsing
+
+    chunk_size = None # set this to a number of frames (ex: 1_000_000) to convert big files chunk by chunk with bounded memory
+    build_cache = True # also write the memory-mapped signal cache (signalcache.py) so the replay tools start instantly
+    build_pyramid = True # also write the min/max/mean pyramid index (signalpyramid.py) for zoomed-out views of long logs
+    selected_signals = None # list of signal names to only decode those (ex: the signals on your dashboard), None = everything
+    decoder.select(selected_signals)
+    compact = False # True = smallest dtype per signal and choice signals as raw codes + text table, instead of float64 for everything
+    compression = 0 # 0 = none, 1 = deflate, 2 = transposed deflate (smaller files, slower to write and read)
+
+    if chunk_size is not None:
+        convert_chunked(mdf, decoder, 3, 'signal_based_output_group3.mf4', chunk_size, compact=compact, compression=compression)
+    else:
+        ids, dlcs, data_bytes, timestamps = load_frames(mdf, group=3)
+
+        # bulk decode every frame at once, grouped by CAN ID (use decode_frames_per_frame with a cantools db for the old loop)
+        signal_times, signal_values = decoder.decode(ids, dlcs, data_bytes, timestamps)
+
+        signals = build_signals(signal_times, signal_values, compact=decoder if compact else None)
+
+        new_mdf = MDF()
+        new_mdf.append(signals)
+        new_mdf.save('signal_based_output_group3.mf4', compression=compression)# generate a signal-based output file
 
+    if build_cache or build_pyramid:
+        write_cache('signal_based_output_group3.mf4')
+    if build_pyramid:
+        write_pyramid('signal_based_output_group3.mf4') # made from the cache, so it needs the cache too
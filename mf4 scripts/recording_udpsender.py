@@ -0,0 +1,41 @@
+import argparse
+import socket
+
+from replayengine import RecordingReplay
+from sessionrecorder import Recording
+
+# sends a dashboard session recording back to the dashboard, datagram for datagram at the times they were received
+# (examplewindow_v2.py records every session into recording_dir when it's given one, see sessionrecorder.py)
+#
+# python recording_udpsender.py "../PyQt scripts/recordings/session_20250101_120000.drec" --speed 4 --start 30
+
+
+# speed argument: 1.0 = real time, 4.0 = four times as fast, 0 = as fast as possible
+def replay_speed(value):
+    speed = float(value)
+    if speed < 0:
+        raise argparse.ArgumentTypeError(f"Expected a speed of 0 or more, got '{value}'")
+    return speed or None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send a dashboard session recording back to the dashboard")
+    parser.add_argument("recording", help="recording (.drec) to replay")
+    parser.add_argument("--speed", type=replay_speed, default=1.0,
+                        help="1 = real time, 4 = four times as fast, 0 = as fast as possible (default: 1)")
+    parser.add_argument("--start", type=float, default=0.0, help="seconds into the recording to start from")
+    parser.add_argument("--no-keep-latency", dest="keep_latency", action="store_false",
+                        help="only show the replay's own network latency, instead of stamping the datagrams so the "
+                             "dashboard measures the latency the recording had")
+    parser.add_argument("--host", default="127.0.0.1", help="dashboard address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=6000, help="dashboard port (default: 6000)")
+    args = parser.parse_args()
+
+    recording = Recording(args.recording)
+    print(f"Replaying {args.recording} from {args.start}s at {args.speed or 'full'} speed")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = (args.host, args.port)
+
+    replay = RecordingReplay(recording, sock, address, speed=args.speed, start=args.start, keep_latency=args.keep_latency)
+    replay.run()
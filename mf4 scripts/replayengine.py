@@ -0,0 +1,695 @@
+import os
+import sys
+import json
+import time
+import threading
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'PyQt scripts')) # udpprotocol.py lives with the dashboard code
+from udpprotocol import BinaryEncoder, MAGIC, VERSION, TYPE_TABLE, HEADER, STAMP, STAMP_OFFSET, parse_subscription
+from signalcache import numeric_samples
+
+# Replay engine for signal-based .mf4s, used by signalmf4_udpsender.py and exampleUDPsender.py.
+# Any number of channels get merged into one time-ordered stream, samples that share a timestamp go out together in one
+# datagram, and everything is paced to the original timestamps (optionally sped up or slowed down).
+# The datagrams are all encoded ahead of time into one contiguous buffer (see SendBuffer), so the timed send loop
+# only slices the buffer, stamps the sequence number and send time into the header and calls sendto.
+# The replay can be paused, resumed, looped and seeked to any point in the log (see TimeIndex and Replay.seek).
+# In selective mode (Replay.listen) the dashboard tells the sender which signals are on screen and only those get sent.
+# With a deadband set only the samples that changed get sent, plus a keyframe with every value now and then (see Deadband).
+# Dashboard session recordings (see sessionrecorder.py) get sent back out datagram for datagram by RecordingReplay.
+
+# numpy layout of the binary packet header, matches udpprotocol.HEADER byte for byte
+HEADER_DTYPE = np.dtype([('magic', 'S2'), ('version', 'u1'), ('type', 'u1'), ('session', '<u4'), ('sequence', '<u4'), ('timestamp', '<f8')])
+
+RESELECT_CHUNK = 200_000 # samples encoded at a time after a subscription change (see Replay.sections)
+
+
+# load channels out of a signal-based mf4, returns (names, [(timestamps, values), ...]) for every channel that could be loaded
+def load_channels(mdf, channel_names):
+    names = []
+    channels = []
+    for name in channel_names:
+        try:
+            sig = mdf.get(name, raw=True)
+            values = np.asarray(numeric_samples(sig), dtype=np.float64) # choice signals get sent as their raw codes
+        except Exception as e:
+            print(f"Skipping {name}: {e}")
+            continue
+        names.append(name)
+        channels.append((np.asarray(sig.timestamps, dtype=np.float64), values))
+    return names, channels
+
+
+# merge every channel's samples into one stream sorted by timestamp, returns (times, channel ids, values) arrays
+# the sort is stable, so samples with the same timestamp stay in channel order
+def merge_channels(channels):
+    if not channels:
+        return np.array([]), np.array([], dtype=np.int64), np.array([])
+    times = np.concatenate([timestamps for timestamps, _ in channels])
+    ids = np.concatenate([np.full(len(timestamps), i, dtype=np.int64) for i, (timestamps, _) in enumerate(channels)])
+    values = np.concatenate([values for _, values in channels])
+    order = np.argsort(times, kind='stable')
+    return times[order], ids[order], values[order]
+
+
+# start index of every run of samples that share a timestamp (plus the end), each run becomes one datagram
+def timestamp_groups(times):
+    if len(times) == 0:
+        return np.array([0], dtype=np.int64)
+    return np.concatenate(([0], np.flatnonzero(np.diff(times)) + 1, [len(times)]))
+
+
+# a whole stretch of the replay encoded ahead of time: every datagram back to back in one buffer (a writable numpy
+# array for binary datagrams, so the send loop can stamp the headers in place),
+# datagram i is buffer[offsets[i]:offsets[i + 1]], is due send_times[i] seconds (of log time) after the start of the replay
+# and holds counts[i] samples
+class SendBuffer:
+    def __init__(self, buffer, offsets, send_times, counts):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.send_times = send_times
+        self.counts = counts
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    # list of memoryview slices, one per datagram (slicing a memoryview doesn't copy anything)
+    def datagrams(self):
+        view = memoryview(self.buffer)
+        offsets = self.offsets.tolist()
+        return [view[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+# encode samples into binary datagrams in one go, the numpy way
+# times/ids/values are a time-ordered slice of merge_channels() output, t0 is the first timestamp of the whole replay.
+# table_bucket is the table_interval bucket the last signal table went out in (None if it hasn't gone out yet),
+# returns (SendBuffer, new table_bucket)
+def prepare_binary(encoder, times, ids, values, t0, table_bucket=None):
+    groups = timestamp_groups(times)
+    group_starts = groups[:-1]
+    group_lengths = np.diff(groups)
+
+    # split timestamp groups that don't fit in one datagram, starts/counts are per data datagram
+    per_group = -(-group_lengths // encoder.max_records)
+    first = np.repeat(np.cumsum(per_group) - per_group, per_group)
+    starts = np.repeat(group_starts, per_group) + (np.arange(len(first)) - first) * encoder.max_records
+    counts = np.minimum(np.repeat(group_starts + group_lengths, per_group) - starts, encoder.max_records)
+    data_times = times[starts] - t0
+
+    # signal table in front of the first datagram, and again whenever a new table_interval of log time starts
+    if encoder.table_interval:
+        buckets = np.floor(data_times / encoder.table_interval).astype(np.int64)
+    else:
+        buckets = np.zeros(len(starts), dtype=np.int64)
+    previous = np.concatenate(([-1 if table_bucket is None else table_bucket], buckets[:-1]))
+    table_before = buckets != previous
+    if table_bucket is not None and not encoder.table_interval:
+        table_before[:] = False
+    if len(buckets):
+        table_bucket = int(buckets[-1])
+
+    bodies = [np.frombuffer(body, dtype=np.uint8) for body in encoder.table_bodies()]
+    tables = len(bodies)
+
+    # where every datagram (tables and data) lands in send order
+    data_position = np.arange(len(starts)) + tables * np.cumsum(table_before)
+    table_position = (data_position[table_before][:, None] - tables + np.arange(tables)).ravel()
+    total = len(starts) + len(table_position)
+
+    headers = np.zeros(total, dtype=HEADER_DTYPE)
+    headers['magic'] = MAGIC
+    headers['version'] = VERSION
+    headers['type'] = encoder.packet_type
+    headers['type'][table_position] = TYPE_TABLE
+    headers['session'] = encoder.session_id
+    headers['sequence'] = (encoder.sequence + np.arange(total)) & 0xFFFFFFFF
+    encoder.sequence += total
+    headers['timestamp'][data_position] = times[starts]
+    headers['timestamp'][table_position] = np.repeat(times[starts][table_before], tables)
+
+    # prefix = the bytes that go in front of each datagram's records (the header, plus the body for table packets)
+    prefix_sizes = np.full(total, HEADER_DTYPE.itemsize, dtype=np.int64)
+    prefix_sizes[table_position] += np.tile([len(body) for body in bodies], int(table_before.sum()))
+    prefix_offsets = np.cumsum(prefix_sizes) - prefix_sizes
+    prefixes = np.zeros(int(prefix_sizes.sum()), dtype=np.uint8)
+    prefixes[prefix_offsets[:, None] + np.arange(HEADER_DTYPE.itemsize)] = headers.view(np.uint8).reshape(total, -1)
+    for n, position in enumerate(table_position):
+        start = prefix_offsets[position] + HEADER_DTYPE.itemsize
+        body = bodies[n % tables]
+        prefixes[start:start + len(body)] = body
+
+    records = np.empty(len(times), dtype=[('id', '<u2'), ('value', '<' + encoder.record_format[1])])
+    records['id'] = ids
+    with np.errstate(over='ignore'):
+        records['value'] = values
+    record_bytes = records.view(np.uint8)
+
+    # slot the prefixes in front of each datagram's records, tables go in front of the data datagram they come before
+    record_starts = np.zeros(total, dtype=np.int64)
+    record_starts[data_position] = starts
+    record_starts[table_position] = np.repeat(starts[table_before], tables)
+    record_counts = np.zeros(total, dtype=np.int64)
+    record_counts[data_position] = counts
+    buffer = np.insert(record_bytes, np.repeat(record_starts * records.itemsize, prefix_sizes), prefixes)
+
+    sizes = prefix_sizes + record_counts * records.itemsize
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    send_times = np.empty(total)
+    send_times[data_position] = data_times
+    send_times[table_position] = np.repeat(data_times[table_before], tables)
+    return SendBuffer(buffer, offsets, send_times, record_counts), table_bucket
+
+
+# encode samples into JSON datagrams ({"signal": value, ...}, one per timestamp), returns a SendBuffer
+def prepare_json(names, times, ids, values, t0):
+    groups = timestamp_groups(times)
+    ids = ids.tolist()
+    values = values.tolist()
+    messages = [json.dumps({names[i]: value for i, value in zip(ids[start:end], values[start:end])}).encode()
+                for start, end in zip(groups[:-1].tolist(), groups[1:].tolist())]
+    offsets = np.concatenate(([0], np.cumsum([len(message) for message in messages], dtype=np.int64)))
+    return SendBuffer(b''.join(messages), offsets, times[groups[:-1]] - t0, np.diff(groups))
+
+
+# index over the merged stream to jump to any point in the log with binary searches instead of a scan.
+# besides the merged timestamps it keeps, for every channel, the positions of that channel's samples in the merged
+# stream (sorted, so the last sample of a channel before any point is a binary search too)
+class TimeIndex:
+    def __init__(self, times, ids, channel_count):
+        self.times = times
+        order = np.argsort(ids, kind='stable')
+        self.positions = np.split(order, np.cumsum(np.bincount(ids, minlength=channel_count))[:-1])
+
+    # position in the merged stream of the first sample at or after log time t
+    def seek(self, t):
+        return int(np.searchsorted(self.times, t, side='left'))
+
+    # merged stream position of each channel's last sample before position (-1 if the channel has none yet)
+    def last_samples(self, position):
+        return np.array([positions[np.searchsorted(positions, position) - 1] if len(positions) and positions[0] < position else -1
+                         for positions in self.positions], dtype=np.int64)
+
+
+# True if two subscriptions (arrays of channel ids, None = every channel) are the same
+def same_selection(a, b):
+    return (a is None) == (b is None) and (a is None or np.array_equal(a, b))
+
+
+# per channel deadbands from the deadband setting of a Replay: one number for every channel, or a {signal name: deadband}
+# dictionary (signals that aren't in it get 0, so they still only go out when they change)
+def deadband_array(names, deadband):
+    if isinstance(deadband, dict):
+        return np.array([float(deadband.get(name, 0.0)) for name in names])
+    return np.full(len(names), float(deadband))
+
+
+# change-only sending: a sample only goes out when its channel has moved more than the channel's deadband away from the
+# value the dashboard was last sent (deadband 0 = every change goes out, repeats of the same value don't).
+# every keyframe_interval seconds of log time the latest value of every channel goes out anyway (a keyframe), so a dashboard
+# that starts late or loses a datagram is back in sync within keyframe_interval, and the dashboard can tell a signal that
+# isn't changing from a sender that has gone away (see DataReceiver's stale_timeout).
+# the state carries over from one call of thin() to the next, so chunked replays and streams get thinned chunk by chunk
+class Deadband:
+    def __init__(self, deadbands, keyframe_interval=1.0, t0=0.0):
+        self.deadbands = deadbands # per channel id
+        self.keyframe_interval = keyframe_interval # None = no keyframes
+        self.t0 = t0
+        self.sent = np.full(len(deadbands), np.nan) # value the dashboard was last sent for each channel (NaN = nothing yet)
+        self.latest = np.full(len(deadbands), np.nan) # newest value of each channel, sent or not
+        self.seen = np.zeros(len(deadbands), dtype=bool) # channels that have had a sample, these go in the keyframes
+        self.next_keyframe = None # log time of the next keyframe
+
+    # forget the channels that aren't selected anymore, so they stop showing up in keyframes
+    def select(self, selected):
+        if selected is not None:
+            self.seen[~np.isin(np.arange(len(self.seen)), selected)] = False
+
+    # drop the samples that are within their channel's deadband and add the keyframes that fall in this stretch,
+    # times/ids/values are the next time-ordered stretch of samples, returns the (times, ids, values) to send
+    def thin(self, times, ids, values):
+        if len(times) == 0:
+            return times, ids, values
+        if not self.keyframe_interval:
+            keep = self.changes(ids, values)
+            return times[keep], ids[keep], values[keep]
+
+        interval = self.keyframe_interval
+        if self.next_keyframe is None:
+            self.next_keyframe = self.t0 + (np.floor((times[0] - self.t0) / interval) + 1) * interval
+        keyframe_times = np.arange(self.next_keyframe, times[-1] + interval / 2, interval)
+        keyframe_times = keyframe_times[keyframe_times <= times[-1]] # arange can overshoot by one on rounding
+        if len(keyframe_times):
+            self.next_keyframe = keyframe_times[-1] + interval
+
+        # each keyframe goes out after every sample before its time, so the stretch is thinned in pieces between keyframes
+        pieces = []
+        start = 0
+        for keyframe_time, end in zip(keyframe_times.tolist(), np.searchsorted(times, keyframe_times, side='left').tolist()):
+            keep = self.changes(ids[start:end], values[start:end])
+            pieces.append((times[start:end][keep], ids[start:end][keep], values[start:end][keep]))
+            pieces.append(self.keyframe(keyframe_time))
+            start = end
+        keep = self.changes(ids[start:], values[start:])
+        pieces.append((times[start:][keep], ids[start:][keep], values[start:][keep]))
+        return tuple(np.concatenate(arrays) for arrays in zip(*pieces))
+
+    # mask of the samples to send out of a time-ordered piece, updates the sent/latest values as it goes
+    def changes(self, ids, values):
+        keep = np.zeros(len(ids), dtype=bool)
+        if len(ids) == 0:
+            return keep
+        order = np.argsort(ids, kind='stable')
+        for positions in np.split(order, np.flatnonzero(np.diff(ids[order])) + 1):
+            channel = ids[positions[0]]
+            channel_values = values[positions]
+            deadband = self.deadbands[channel]
+            # a sample can only go out if it differs from the one before it (NaN counts as a change),
+            # with a deadband of 0 that is already the answer
+            previous = np.concatenate(([self.sent[channel]], channel_values[:-1]))
+            candidates = np.flatnonzero(~(channel_values == previous))
+            if deadband > 0:
+                # whether a sample goes out depends on the last one that did, so the candidates get walked in order
+                kept = []
+                reference = self.sent[channel]
+                for i, value in zip(candidates.tolist(), channel_values[candidates].tolist()):
+                    if not abs(value - reference) <= deadband:
+                        kept.append(i)
+                        reference = value
+                candidates = np.array(kept, dtype=np.int64)
+            keep[positions[candidates]] = True
+            if len(candidates):
+                self.sent[channel] = channel_values[candidates[-1]]
+            self.latest[channel] = channel_values[-1]
+            self.seen[channel] = True
+        return keep
+
+    # (times, ids, values) of a keyframe: the latest value of every channel that has had a sample
+    def keyframe(self, keyframe_time):
+        ids = np.flatnonzero(self.seen)
+        values = self.latest[ids]
+        self.sent[ids] = values
+        return np.full(len(ids), keyframe_time), ids, values
+
+
+# class to send a merged stream of samples over UDP, paced to the original timestamps
+# speed=2.0 plays back twice as fast, speed=None sends everything as fast as possible
+# chunk_size=None encodes the whole replay before sending anything, otherwise it gets encoded chunk_size samples at a
+# time as the replay goes (bounded memory, and the first packets go out sooner)
+# seek(), pause(), resume(), set_loop(), subscribe() and stop() can be called from another thread while run() is going
+# (see start_console and listen)
+# deadband=None sends every sample, a number (or {signal name: deadband}) only sends a signal when it changes by more than
+# that, with a keyframe of every signal's value every keyframe_interval seconds of log time (see Deadband)
+class Replay:
+    def __init__(self, names, times, ids, values, sock, address, speed=1.0, wire_format="binary", chunk_size=None, loop=False,
+                 deadband=None, keyframe_interval=1.0):
+        self.names = names
+        self.times = times
+        self.ids = ids
+        self.values = values
+        self.sock = sock
+        self.address = address
+        self.speed = speed
+        self.wire_format = wire_format
+        self.chunk_size = chunk_size
+        self.loop = loop
+        self.encoder = BinaryEncoder(names)
+        self.index = TimeIndex(times, ids, len(names))
+        self.t0 = times[0] if len(times) else 0.0
+        self.full = None # (datagrams, send times, counts) of the whole replay when it isn't chunked
+        self.full_selected = None # subscription self.full was encoded for
+        self.groups = None # timestamp_groups() of the whole replay, worked out the first time it is needed
+        # change-only sending (see Deadband): None sends every sample, a number or {signal name: deadband} only sends changes
+        self.deadbands = None if deadband is None else deadband_array(names, deadband)
+        self.keyframe_interval = keyframe_interval # seconds of log time between keyframes when the deadband is on
+
+        self.playing = threading.Event()
+        self.playing.set()
+        self.interrupted = False # set by every control, the send loop only checks this one flag per datagram
+        self.seek_position = None # set by seek(), picked up by the send loop
+        self.stopped = False
+        self.play_start = 0 # sample position the current play() started from
+        self.position_time = None # log time (from the start of the log) of the last datagram sent by the current play()
+
+        self.selected = None # channel ids the dashboard subscribed to (None = send every channel)
+        self.next_selected = None # new subscription waiting for the send loop
+        self.selection_changed = False
+
+        self.sequence = 0 # sequence number of the next binary datagram, stamped in as it is sent
+        self.samples_sent = 0
+        self.datagrams_sent = 0
+        self.max_lag = 0.0 # worst time a datagram went out behind schedule, in seconds
+
+    # encode the replay into SendBuffers from sample position start on, chunk by chunk (chunks never split a timestamp group)
+    def buffers(self, start=0, chunk_size=None):
+        if self.groups is None:
+            self.groups = timestamp_groups(self.times)
+        groups = self.groups
+        table_bucket = None
+        deadband = self.new_deadband()
+        chunk_size = chunk_size or self.chunk_size or len(self.times)
+        while start < len(self.times):
+            end = int(groups[np.searchsorted(groups, start + chunk_size)]) if start + chunk_size < len(self.times) else len(self.times)
+            times, ids, values = self.filtered(self.times[start:end], self.ids[start:end], self.values[start:end])
+            if deadband is not None:
+                times, ids, values = deadband.thin(times, ids, values)
+            if self.wire_format == "binary":
+                send_buffer, table_bucket = prepare_binary(self.encoder, times, ids, values, self.t0, table_bucket)
+            else:
+                send_buffer = prepare_json(self.names, times, ids, values, self.t0)
+            yield send_buffer
+            start = end
+
+    # fresh Deadband for a new pass over the replay (None when the deadband is off), every pass starts with a snapshot or
+    # from the start of the log, so the dashboard's values are all sent again anyway
+    def new_deadband(self):
+        if self.deadbands is None:
+            return None
+        return Deadband(self.deadbands, self.keyframe_interval, self.t0)
+
+    # only keep the samples of the subscribed channels
+    def filtered(self, times, ids, values):
+        if self.selected is None:
+            return times, ids, values
+        keep = np.isin(ids, self.selected)
+        return times[keep], ids[keep], values[keep]
+
+    # (datagrams, send times, sample counts) lists to send from sample position start on
+    # the whole replay is encoded once up front (unless chunk_size is set). after a subscription change the rest of the
+    # replay gets encoded chunk by chunk from where it is instead, so adding a widget doesn't hold up the send loop while
+    # the whole log is encoded again. the full encoding is kept and used again whenever the subscription is back to the
+    # one it was made for (ex: every channel)
+    def sections(self, start):
+        if self.chunk_size or (self.full is not None and not same_selection(self.selected, self.full_selected)):
+            for send_buffer in self.buffers(start, self.chunk_size or RESELECT_CHUNK):
+                yield send_buffer.datagrams(), send_buffer.send_times.tolist(), send_buffer.counts
+            return
+        if self.full is None:
+            send_buffer = next(self.buffers(0))
+            self.full = (send_buffer.datagrams(), send_buffer.send_times, send_buffer.counts)
+            self.full_selected = self.selected
+        datagrams, send_times, counts = self.full
+        if len(datagrams) == 0:
+            return
+        first = int(np.searchsorted(send_times, self.times[start] - self.t0, side='left')) if start < len(self.times) else len(datagrams)
+        yield datagrams[first:], send_times[first:].tolist(), counts[first:]
+
+    #------------ controls --------------
+    # jump to t seconds from the start of the log
+    def seek(self, t):
+        self.seek_position = self.index.seek(self.t0 + t)
+        self.interrupted = True
+
+    def pause(self):
+        self.playing.clear()
+        self.interrupted = True
+
+    def resume(self):
+        self.playing.set()
+
+    def set_loop(self, loop):
+        self.loop = loop
+
+    def stop(self):
+        self.stopped = True
+        self.interrupted = True
+        self.playing.set()
+
+    # only send these signals from now on (None sends everything again), names that aren't in the replay are ignored
+    def subscribe(self, signal_names):
+        selected = None
+        if signal_names is not None:
+            selected = np.array(sorted(self.encoder.signal_ids[name] for name in set(signal_names) if name in self.encoder.signal_ids), dtype=np.int64)
+        current = self.next_selected if self.selection_changed else self.selected
+        if same_selection(selected, current):
+            return # dashboards resend their subscription every few seconds, nothing to do if it hasn't changed
+        print(f"Dashboard subscribed to {'every signal' if selected is None else f'{len(selected)} signals'}")
+        self.next_selected = selected
+        self.selection_changed = True
+        self.interrupted = True
+
+    # listen for subscriptions from the dashboard on the send socket (on a daemon thread), the dashboard sends them back
+    # to the address the data comes from
+    def listen(self):
+        if self.sock.getsockname()[1] == 0:
+            self.sock.bind(('', 0)) # has to have a port before it can receive anything
+
+        def listener():
+            while not self.stopped:
+                try:
+                    datagram, _ = self.sock.recvfrom(65535)
+                except ConnectionResetError:
+                    continue # windows reports "port unreachable" here when the dashboard isn't running yet
+                except OSError:
+                    return
+                names = parse_subscription(datagram)
+                if names is not None:
+                    self.subscribe(names)
+
+        thread = threading.Thread(target=listener, daemon=True)
+        thread.start()
+        return thread
+    #------------------------------------
+
+    # sample position to carry on from, right after the last datagram that went out
+    def current_position(self):
+        if self.position_time is None:
+            return self.play_start
+        return int(np.searchsorted(self.times, self.t0 + self.position_time, side='right'))
+
+    # switch to the new subscription, returns the sample position to restart from (None to carry on)
+    def apply_selection(self):
+        self.selected = self.next_selected
+        self.selection_changed = False
+        return self.current_position()
+
+    # send each channel's last value before position (so widgets show the right values straight after a seek),
+    # along with the signal table
+    def send_snapshot(self, position):
+        last = self.index.last_samples(position)
+        ids = np.flatnonzero(last >= 0)
+        if self.selected is not None:
+            ids = ids[np.isin(ids, self.selected)]
+        values = self.values[last[ids]]
+        timestamp = self.times[position] if position < len(self.times) else self.times[-1]
+        if self.wire_format == "binary":
+            messages = self.encoder.table_packets(timestamp)
+            step = self.encoder.max_records
+            for i in range(0, len(ids), step):
+                messages.append(self.encoder.encode_ids(ids[i:i + step].tolist(), values[i:i + step].tolist(), timestamp))
+        else:
+            messages = [json.dumps({self.names[i]: value for i, value in zip(ids.tolist(), values.tolist())}).encode()]
+        self.send_messages(messages)
+        print(f"Sent a snapshot at {timestamp - self.t0:.3f}s with the last value of {len(ids)}/{len(self.names)} channels")
+
+    # send the signal table on its own (an empty dictionary in JSON), while nothing is subscribed this keeps going out
+    # so dashboards that start later still hear from this sender and can send it their subscription
+    def send_heartbeat(self):
+        self.send_messages(self.encoder.table_packets() if self.wire_format == "binary" else [b'{}'])
+
+    # send datagrams encoded outside the send loop, stamping the sequence number and send time into the binary ones
+    def send_messages(self, messages):
+        for message in messages:
+            if self.wire_format == "binary":
+                message = bytearray(message)
+                STAMP.pack_into(message, STAMP_OFFSET, self.sequence & 0xFFFFFFFF, time.time())
+                self.sequence += 1
+            self.sock.sendto(message, self.address)
+        self.datagrams_sent += len(messages)
+
+    # blocks while paused, returns a new sample position if a seek or subscription came in (None to carry on from where it is)
+    def check_controls(self):
+        position = None
+        while True:
+            self.interrupted = False
+            if self.selection_changed:
+                restart = self.apply_selection()
+                if restart is not None and self.seek_position is None:
+                    position = restart
+                    self.send_snapshot(position) # newly shown signals get their current value straight away
+            if self.seek_position is not None:
+                position, self.seek_position = self.seek_position, None
+                self.send_snapshot(position)
+            if self.playing.is_set():
+                return position
+            self.playing.wait(0.1)
+
+    # sends from sample position start until the end, returns a new sample position if it got seeked somewhere else
+    def play(self, start):
+        sock, address, speed = self.sock, self.address, self.speed
+        stamp = STAMP.pack_into if self.wire_format == "binary" else None
+        base = None # perf_counter time that log time 0 lines up with, moved on pause/seek so playback picks up where it left off
+        next_report = time.perf_counter() + 5
+        self.play_start = start
+        self.position_time = None
+        if self.selected is not None and len(self.selected) == 0:
+            # nothing on the dashboard, hold here until it subscribes to something (the signal table still goes out every
+            # table_interval, otherwise a dashboard started after this one would never hear from us)
+            print("Dashboard isn't showing any of these signals, waiting for it to subscribe")
+            interval = self.encoder.table_interval or 1.0
+            next_heartbeat = time.perf_counter()
+            while not self.interrupted:
+                if time.perf_counter() >= next_heartbeat:
+                    self.send_heartbeat()
+                    next_heartbeat += interval
+                time.sleep(0.05)
+            position = self.check_controls()
+            return None if self.stopped else start if position is None else position
+        for datagrams, send_times, counts in self.sections(start):
+            sent = 0
+            for i, (message, send_time) in enumerate(zip(datagrams, send_times)):
+                if self.interrupted:
+                    self.samples_sent += int(counts[sent:i].sum())
+                    self.datagrams_sent += i - sent
+                    sent = i
+                    position = self.check_controls()
+                    if self.stopped:
+                        return None
+                    if position is not None:
+                        return position
+                    base = None
+                if speed:
+                    if base is None:
+                        base = time.perf_counter() - send_time / speed
+                    # every send time is worked out from one fixed base time (not from the last send), so sleep errors don't add up
+                    delay = base + send_time / speed - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    elif -delay > self.max_lag:
+                        self.max_lag = -delay
+                if stamp is not None:
+                    # sequence number and send time go in as the datagram goes out (so they stay right on loops and seeks),
+                    # the dashboard uses them to measure loss and latency
+                    stamp(message, STAMP_OFFSET, self.sequence & 0xFFFFFFFF, time.time())
+                    self.sequence += 1
+                sock.sendto(message, address)
+                self.position_time = send_time
+
+                if i & 1023 == 0 and time.perf_counter() >= next_report:
+                    next_report += 5
+                    print(f"Replayed {send_time:.1f}s of data, {self.datagrams_sent + i - sent + 1} datagrams sent")
+            self.samples_sent += int(counts[sent:].sum())
+            self.datagrams_sent += len(datagrams) - sent
+        return None
+
+    # function to send the whole stream (over and over if loop is on), until it ends or stop() is called
+    def run(self):
+        if len(self.times) == 0:
+            print("Nothing to replay.")
+            return
+        if not self.chunk_size:
+            self.full = None
+            list(self.sections(0)) # encode everything up front, before the clock starts
+        self.send_all()
+
+    # the send loop behind run(), plays from the start (looping if it is on) and prints a summary at the end
+    def send_all(self):
+        start_time = time.perf_counter()
+        position = 0
+        while not self.stopped:
+            position = self.play(position)
+            if position is None:
+                if not self.loop or self.stopped:
+                    break
+                position = 0
+                print("Looping back to the start")
+
+        elapsed = time.perf_counter() - start_time
+        print(f"Sent {self.samples_sent} samples in {self.datagrams_sent} datagrams in {elapsed:.1f}s "
+              f"({self.samples_sent / elapsed if elapsed > 0 else 0:,.0f} samples/s, max lag {self.max_lag * 1000:.1f} ms)")
+
+
+# replay of a dashboard session recording (sessionrecorder.Recording), used by recording_udpsender.py.
+# every datagram the dashboard received goes out again as it was, paced to the times it was received (optionally sped up,
+# speed=None sends as fast as possible), from start seconds into the recording on (the recording's seek index finds the spot).
+# binary datagrams keep their session and sequence numbers, so the datagrams that were lost on the drive show up as lost
+# again, and with keep_latency the send time is stamped so the dashboard measures the network latency the drive had
+# (on top of the replay's own). the recording already only has what the dashboard was subscribed to, so there is no
+# selective mode, and a replay that starts part way in shows its signals once the sender's next signal table comes along.
+# stop() can be called from another thread while run() is going
+class RecordingReplay:
+    def __init__(self, recording, sock, address, speed=1.0, start=0.0, keep_latency=True):
+        self.recording = recording
+        self.sock = sock
+        self.address = address
+        self.speed = speed
+        self.start = start
+        self.keep_latency = keep_latency
+        self.stopped = False
+        self.position_time = None # seconds into the recording of the last datagram sent
+        self.datagrams_sent = 0
+        self.max_lag = 0.0 # worst time a datagram went out behind schedule, in seconds
+
+    def stop(self):
+        self.stopped = True
+
+    # function to send the recording until it ends or stop() is called
+    def run(self):
+        sock, address, speed = self.sock, self.address, self.speed
+        start_time = time.perf_counter()
+        next_report = start_time + 5
+        base = None # perf_counter time the first datagram's receive time lines up with
+        first = None
+        for received, datagram in self.recording.records(self.start):
+            if self.stopped:
+                break
+            if first is None:
+                first = received
+            if speed:
+                if base is None:
+                    base = time.perf_counter()
+                delay = base + (received - first) / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                elif -delay > self.max_lag:
+                    self.max_lag = -delay
+            if datagram[:2] == MAGIC and len(datagram) >= HEADER.size:
+                sequence, sent = STAMP.unpack_from(datagram, STAMP_OFFSET)
+                message = bytearray(datagram)
+                STAMP.pack_into(message, STAMP_OFFSET, sequence, time.time() - (received - sent) if self.keep_latency else time.time())
+                datagram = message
+            sock.sendto(datagram, address)
+            self.datagrams_sent += 1
+            self.position_time = received - self.recording.start_time
+
+            if self.datagrams_sent & 1023 == 0 and time.perf_counter() >= next_report:
+                next_report += 5
+                print(f"Replayed {self.position_time:.1f}s of the recording, {self.datagrams_sent} datagrams sent")
+
+        elapsed = time.perf_counter() - start_time
+        print(f"Sent {self.datagrams_sent} recorded datagrams in {elapsed:.1f}s (max lag {self.max_lag * 1000:.1f} ms)")
+
+
+# small console to control a running replay from the terminal, runs on a daemon thread
+# commands: seek <seconds>, pause, resume, loop on/off, stop
+def start_console(replay):
+    def console():
+        while not replay.stopped:
+            try:
+                command = input().split()
+            except EOFError:
+                return
+            if not command:
+                continue
+            try:
+                if command[0] == "seek":
+                    replay.seek(float(command[1]))
+                elif command[0] == "pause":
+                    replay.pause()
+                    position = replay.position_time # None before the first datagram and once the replay has ended
+                    print("Paused (not started)" if position is None else f"Paused at {position:.3f}s")
+                elif command[0] == "resume":
+                    replay.resume()
+                elif command[0] == "loop":
+                    replay.set_loop(len(command) < 2 or command[1] != "off")
+                    print(f"Looping {'on' if replay.loop else 'off'}")
+                elif command[0] == "stop":
+                    replay.stop()
+                else:
+                    print("Commands: seek <seconds>, pause, resume, loop on/off, stop")
+            except (IndexError, ValueError):
+                print(f"Bad command: {' '.join(command)}")
+
+    thread = threading.Thread(target=console, daemon=True)
+    thread.start()
+    return thread
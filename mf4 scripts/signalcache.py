@@ -0,0 +1,148 @@
+import os
+import json
+import shutil
+import numpy as np
+
+# Columnar cache for signal-based .mf4s, so replay and analysis tools don't have to open the .mf4 with asammdf every run.
+# Every signal gets a timestamps file and a values file (plain .npy arrays that get memory-mapped when they're opened),
+# plus one manifest.json with the signal names, dtypes, sample counts and time ranges.
+# Opening the cache only reads the manifest, and the arrays are only paged in for the channels and time ranges that get used.
+# The cache lives in a __sigcache__ folder next to the .mf4 and is thrown away when the .mf4's size or mtime changes.
+
+CACHE_VERSION = 2
+
+
+# folder the cache for an mf4 goes in
+def cache_path_for(mf4_path, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(mf4_path)), '__sigcache__')
+    return os.path.join(cache_dir, os.path.basename(mf4_path))
+
+
+# samples of a signal read with raw=True as plain numbers: conversions to numbers (ex: linear) get applied, conversions to
+# text (choice tables, see frametosignalmf4.value_to_text) don't, so choice signals stay as their raw codes
+def numeric_samples(sig):
+    if sig.conversion is not None:
+        physical = sig.physical().samples
+        if physical.dtype.kind in 'biuf':
+            return physical
+    return sig.samples
+
+
+# {raw code: text} of a value-to-text conversion, None for any other conversion
+def choice_table(conversion):
+    from asammdf.blocks import v4_constants as v4c
+
+    if conversion is None or conversion.conversion_type != v4c.CONVERSION_TYPE_TABX:
+        return None
+    table = {}
+    for i in range(conversion.val_param_nr):
+        text = conversion.referenced_blocks.get(f'text_{i}')
+        if isinstance(text, bytes):
+            table[str(int(conversion[f'val_{i}']))] = text.decode(errors='replace')
+    return table
+
+
+# what the manifest has to match for the cache to still be good
+def source_key(mf4_path):
+    stat = os.stat(mf4_path)
+    return {'version': CACHE_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+# class to read a signal cache, the arrays are memory-mapped so nothing is read until it is used
+class SignalCache:
+    def __init__(self, path, manifest):
+        self.path = path
+        self.manifest = manifest
+        self.signals = manifest['signals'] # signal name -> {'file', 'dtype', 'count', 'unit', 'start', 'end', 'choices'}
+        self.names = list(self.signals)
+
+    # (timestamps, values) of a signal as memory-mapped arrays, start/end (in seconds) only return that time range
+    def get(self, name, start=None, end=None):
+        entry = self.signals[name]
+        timestamps = np.load(os.path.join(self.path, f"{entry['file']}.t.npy"), mmap_mode='r')
+        values = np.load(os.path.join(self.path, f"{entry['file']}.v.npy"), mmap_mode='r')
+        if start is None and end is None:
+            return timestamps, values
+        # the timestamps are sorted, so the time range is two binary searches (only a handful of pages get touched)
+        first = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+        last = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side='right'))
+        return timestamps[first:last], values[first:last]
+
+
+# open the cache for an mf4, returns None if there isn't one or it is out of date
+def open_cache(mf4_path, cache_dir=None):
+    path = cache_path_for(mf4_path, cache_dir)
+    try:
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('source') != source_key(mf4_path):
+        return None
+    return SignalCache(path, manifest)
+
+
+# write the cache for every signal in a signal-based mf4 (or mdf, an MDF of it that is already open)
+def write_cache(mf4_path, cache_dir=None, mdf=None):
+    from asammdf import MDF
+
+    path = cache_path_for(mf4_path, cache_dir)
+    key = source_key(mf4_path)
+    temp_path = f"{path}.{os.getpid()}.tmp" # written to the side and then swapped in, so readers never see half a cache
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+
+    if mdf is None:
+        mdf = MDF(mf4_path)
+    signals = {}
+    for sig in mdf.iter_channels(skip_master=True, raw=True):
+        if sig.name in signals:
+            continue # same name in more than one group, keep the first one like mdf.get() does
+        samples = numeric_samples(sig)
+        if samples.ndim != 1 or samples.dtype.kind not in 'biuf':
+            print(f"Not caching {sig.name}: samples aren't plain numbers")
+            continue
+        file = f"{len(signals):05d}"
+        np.save(os.path.join(temp_path, f"{file}.t.npy"), np.ascontiguousarray(sig.timestamps, dtype=np.float64))
+        np.save(os.path.join(temp_path, f"{file}.v.npy"), np.ascontiguousarray(samples).view(np.dtype(samples.dtype.str))) # .view drops asammdf's dtype metadata
+        signals[sig.name] = {
+            'file': file,
+            'dtype': samples.dtype.str,
+            'count': len(samples),
+            'unit': sig.unit,
+            'start': float(sig.timestamps[0]) if len(sig.timestamps) else None,
+            'end': float(sig.timestamps[-1]) if len(sig.timestamps) else None,
+            'choices': choice_table(sig.conversion), # {raw code: text} for choice signals, stored as their raw codes
+        }
+
+    # manifest goes in last, a cache folder without one is never used
+    with open(os.path.join(temp_path, 'manifest.json'), 'w') as f:
+        json.dump({'source': key, 'signals': signals}, f, indent=1)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(temp_path, path)
+    return SignalCache(path, {'source': key, 'signals': signals})
+
+
+# open the cache for an mf4, building it first if it is missing or out of date
+def load_cache(mf4_path, cache_dir=None):
+    cache = open_cache(mf4_path, cache_dir)
+    if cache is None:
+        print(f"Building signal cache for {mf4_path}")
+        cache = write_cache(mf4_path, cache_dir)
+    return cache
+
+
+# same as replayengine.load_channels, but out of the cache: returns (names, [(timestamps, values), ...])
+def load_signals(mf4_path, channel_names, cache_dir=None):
+    cache = load_cache(mf4_path, cache_dir)
+    names = []
+    channels = []
+    for name in channel_names:
+        if name not in cache.signals:
+            print(f"Skipping {name}: not in {mf4_path}")
+            continue
+        timestamps, values = cache.get(name)
+        names.append(name)
+        channels.append((np.asarray(timestamps), np.asarray(values, dtype=np.float64)))
+    return names, channels
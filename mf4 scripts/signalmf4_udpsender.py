@@ -1,28 +1,45 @@
 import socket
-from asammdf import MDF
-import time
-import json
+
+from replayengine import merge_channels, Replay, start_console
+from signalcache import load_cache, load_signals
 
 #"signal_based_output_group3.mf4"
-mdf = MDF("signal_based_output_group6.mf4")
-print(mdf.channels_db.keys())
+mf4_path = "signal_based_output_group6.mf4"
+# the channels are read out of the memory-mapped signal cache (built on the first run, and again whenever the .mf4 changes)
+# instead of opening the .mf4 with asammdf every time
+print(load_cache(mf4_path).names)
 
-OilTemp_data = mdf.get("EngOilTemp_Cval")  
+# every signal you want to send, they get merged by timestamp and samples with the same timestamp go out in one packet
+channel_names = ["EngOilTemp_Cval"]
 #add more of these as needed for each signal you want to send...
 
+speed = 1.0 # 1.0 = real time, 2.0 = twice as fast, None = as fast as possible
+loop = False # start over from the beginning when the end of the log is reached
 
-oiltempvalues = OilTemp_data.samples
-#same thing here...
+names, channels = load_signals(mf4_path, channel_names)
+times, ids, values = merge_channels(channels)
 
 
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 address = ('127.0.0.1', 6000)
 
-# if you want to use multiple values you will zip all the values together in a tuple and then access them like that
-for value1 in oiltempvalues:
-    packet_dict = {
-            'EngOilTemp_Cval': float(value1),
-        }
-    message = json.dumps(packet_dict).encode()
-    print(f"Sending {packet_dict} to Local Host")
-    sock.sendto(message, address)
\ No newline at end of file
+# "binary" sends the compact binary format (see udpprotocol.py), "json" sends the old JSON dictionaries
+wire_format = "binary"
+
+# every datagram gets encoded into one buffer before the replay starts, so the timed send loop only slices and sends.
+# for really long logs set chunk_size (ex: 1_000_000 samples) to encode it a chunk at a time as the replay goes instead
+chunk_size = None
+
+# only send a signal when it changes by more than this (None sends every sample), ex: 0 = any change, 0.5, or a
+# {signal name: deadband} dictionary like {"EngOilTemp_Cval": 0.5}. every signal's value still goes out every keyframe_interval seconds
+deadband = None
+keyframe_interval = 1.0
+
+replay = Replay(names, times, ids, values, sock, address, speed=speed, wire_format=wire_format, chunk_size=chunk_size, loop=loop,
+                deadband=deadband, keyframe_interval=keyframe_interval)
+selective = True # only send the signals the dashboard is showing (it tells us which ones), the rest are skipped
+if selective:
+    replay.listen()
+# type commands into the terminal while it runs: seek <seconds>, pause, resume, loop on/off, stop
+start_console(replay)
+replay.run()
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+
+from signalcache import load_cache, source_key
+
+# Level-of-detail index for long signal-based .mf4s, so a zoomed-out view of hours of a signal doesn't read every sample.
+# Level 0 is the signal itself (read out of the signal cache, see signalcache.py). Every level above that groups `factor`
+# entries of the level below into one bucket and keeps the bucket's first timestamp, min, max, mean and sample count, so
+# level k has about count / factor**k buckets. Levels stop once one is down to min_buckets.
+# query(name, start, end, pixels) picks the coarsest level that still has at least one bucket per pixel in the time window
+# and only reads that slice (the levels are memory-mapped), so a whole shift drawn 1000 pixels wide touches a few hundred kB
+# per signal instead of the gigabytes of samples under it.
+# The pyramid lives in a __sigpyramid__ folder next to the .mf4, and like the cache it is rebuilt when the .mf4 changes.
+#
+# python signalpyramid.py converted/*.mf4 --factor 10
+
+PYRAMID_VERSION = 1
+COLUMNS = ['t', 'min', 'max', 'mean', 'count'] # columns of a level array, one row per bucket
+CHUNK_SAMPLES = 4_000_000 # raw samples reduced at a time while building, so memory use doesn't depend on the signal length
+
+
+# folder the pyramid for an mf4 goes in
+def pyramid_path_for(mf4_path, pyramid_dir=None):
+    if pyramid_dir is None:
+        pyramid_dir = os.path.join(os.path.dirname(os.path.abspath(mf4_path)), '__sigpyramid__')
+    return os.path.join(pyramid_dir, os.path.basename(mf4_path))
+
+
+# function to reduce raw samples to one bucket row per factor samples (the last bucket can be short)
+def reduce_samples(times, values, factor):
+    starts = np.arange(0, len(values), factor)
+    counts = np.diff(np.append(starts, len(values)))
+    values = np.asarray(values, dtype=np.float64)
+    return np.column_stack((times[starts],
+                            np.minimum.reduceat(values, starts),
+                            np.maximum.reduceat(values, starts),
+                            np.add.reduceat(values, starts) / counts,
+                            counts))
+
+
+# function to reduce the bucket rows of one level to the next one up, factor rows at a time
+def reduce_buckets(rows, factor):
+    starts = np.arange(0, len(rows), factor)
+    counts = np.add.reduceat(rows[:, 4], starts)
+    return np.column_stack((rows[starts, 0],
+                            np.minimum.reduceat(rows[:, 1], starts),
+                            np.maximum.reduceat(rows[:, 2], starts),
+                            np.add.reduceat(rows[:, 3] * rows[:, 4], starts) / counts,
+                            counts))
+
+
+# number of buckets in every level for a signal of count samples
+def level_sizes(count, factor, min_buckets):
+    sizes = []
+    size = count
+    while size > min_buckets:
+        size = -(-size // factor) # ceil
+        sizes.append(size)
+    return sizes
+
+
+# class to read a pyramid, the levels are memory-mapped so only the rows a query needs get read
+class SignalPyramid:
+    def __init__(self, path, manifest, mf4_path):
+        self.path = path
+        self.manifest = manifest
+        self.factor = manifest['factor']
+        self.signals = manifest['signals'] # signal name -> {'file', 'count', 'start', 'end', 'levels': [bucket counts]}
+        self.names = list(self.signals)
+        self.mf4_path = mf4_path
+        self.cache = None # signal cache for level 0, only opened when a query needs the raw samples
+
+    # level of a signal as a memory-mapped (buckets, 5) array, see COLUMNS
+    def level(self, name, level):
+        entry = self.signals[name]
+        return np.load(os.path.join(self.path, f"{entry['file']}.L{level}.npy"), mmap_mode='r')
+
+    # function to get a signal between start and end (seconds, None = from the start / to the end) at the right detail for
+    # drawing it pixels wide. returns (level, times, mins, maxs, means): level 0 is the raw samples (mins, maxs and means
+    # are then all the samples), level k the buckets of factor**k samples that overlap the window
+    def query(self, name, start=None, end=None, pixels=1000):
+        entry = self.signals[name]
+        start = entry['start'] if start is None else start
+        end = entry['end'] if end is None else end
+        for level in range(len(entry['levels']), 0, -1): # coarsest first
+            rows = self.level(name, level)
+            times = rows[:, 0]
+            first = max(int(np.searchsorted(times, start, side='right')) - 1, 0) # bucket the window starts in
+            last = int(np.searchsorted(times, end, side='right'))
+            if last - first >= pixels:
+                rows = np.asarray(rows[first:last])
+                return level, rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
+
+        if self.cache is None:
+            self.cache = load_cache(self.mf4_path)
+        times, values = self.cache.get(name, start, end)
+        values = np.asarray(values, dtype=np.float64)
+        return 0, np.asarray(times), values, values, values
+
+
+# open the pyramid for an mf4, returns None if there isn't one or it is out of date
+def open_pyramid(mf4_path, pyramid_dir=None):
+    path = pyramid_path_for(mf4_path, pyramid_dir)
+    try:
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('source') != {**source_key(mf4_path), 'pyramid_version': PYRAMID_VERSION}:
+        return None
+    return SignalPyramid(path, manifest, mf4_path)
+
+
+# write the pyramid for every signal in a signal-based mf4, from its signal cache (built first if needed)
+# factor is how many buckets of a level go into one bucket of the next, min_buckets is the size of the coarsest level
+def write_pyramid(mf4_path, factor=10, min_buckets=256, pyramid_dir=None):
+    path = pyramid_path_for(mf4_path, pyramid_dir)
+    key = {**source_key(mf4_path), 'pyramid_version': PYRAMID_VERSION}
+    temp_path = f"{path}.{os.getpid()}.tmp" # written to the side and then swapped in, so readers never see half a pyramid
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+
+    cache = load_cache(mf4_path)
+    signals = {}
+    for name in cache.names:
+        times, values = cache.get(name)
+        sizes = level_sizes(len(values), factor, min_buckets)
+        file = cache.signals[name]['file']
+        levels = [np.lib.format.open_memmap(os.path.join(temp_path, f"{file}.L{k + 1}.npy"), mode='w+',
+                                            dtype=np.float64, shape=(size, len(COLUMNS)))
+                  for k, size in enumerate(sizes)]
+        if levels:
+            # chunks are a whole number of top level buckets, so no bucket of any level is split across two chunks
+            top = factor ** len(levels)
+            chunk = max(1, CHUNK_SAMPLES // top) * top
+            written = [0] * len(levels)
+            for offset in range(0, len(values), chunk):
+                rows = reduce_samples(times[offset:offset + chunk], values[offset:offset + chunk], factor)
+                for k, level in enumerate(levels):
+                    if k > 0:
+                        rows = reduce_buckets(rows, factor)
+                    level[written[k]:written[k] + len(rows)] = rows
+                    written[k] += len(rows)
+            for level in levels:
+                level.flush()
+        signals[name] = {'file': file, 'count': len(values), 'start': cache.signals[name]['start'],
+                         'end': cache.signals[name]['end'], 'levels': sizes}
+        del levels
+
+    # manifest goes in last, a pyramid folder without one is never used
+    manifest = {'source': key, 'factor': factor, 'min_buckets': min_buckets, 'columns': COLUMNS, 'signals': signals}
+    with open(os.path.join(temp_path, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(temp_path, path)
+    return SignalPyramid(path, manifest, mf4_path)
+
+
+# open the pyramid for an mf4, building it first if it is missing or out of date
+def load_pyramid(mf4_path, factor=10, pyramid_dir=None):
+    pyramid = open_pyramid(mf4_path, pyramid_dir)
+    if pyramid is None:
+        print(f"Building signal pyramid for {mf4_path}")
+        pyramid = write_pyramid(mf4_path, factor, pyramid_dir=pyramid_dir)
+    return pyramid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the min/max/mean pyramid index for signal-based .mf4 files")
+    parser.add_argument("files", nargs="+", help="signal-based .mf4 files to index")
+    parser.add_argument("--factor", type=int, default=10, help="reduction from one level to the next (ex: 2 or 10)")
+    parser.add_argument("--min-buckets", type=int, default=256, help="buckets in the coarsest level")
+    args = parser.parse_args()
+    for mf4_path in args.files:
+        pyramid = write_pyramid(mf4_path, args.factor, args.min_buckets)
+        print(f"Indexed {len(pyramid.names)} signals in {mf4_path}")